@@ -0,0 +1,444 @@
+"""
+Índice IVF (inverted file) para buscar vecinos aproximados del modelo de k vecinos.
+
+La búsqueda exacta (`model_engines.ExactKNN`) recorre todas las muestras de entrenamiento
+en cada consulta, así que su costo crece linealmente con el tamaño del entrenamiento. El
+índice agrupa las muestras con k-means en `n_lists` listas; cada consulta solo compara
+contra las muestras de las `nprobe` listas cuyos centroides están más cerca. Más listas
+o menos `nprobe` reducen la latencia a cambio de recall.
+
+El índice se construye fuera de línea a partir de `knears_neighbors_model.pkl`:
+
+    python -m ann_index build [--lists 64] [--output model/knn_ivf]
+
+y se guarda como arreglos .npy (muestras float32 ordenadas por lista, sus normas,
+etiquetas e índices originales, inicio de cada lista y centroides) más un `meta.json`.
+Al iniciar se abren con `numpy.load(mmap_mode='r')`: no se copian a memoria y varios
+procesos comparten las páginas. `meta.json` guarda una huella de las muestras y etiquetas del modelo; si no
+coincide con el modelo cargado, el índice se rechaza y hay que reconstruirlo.
+
+`load_models` (prediction.py) lo usa con Config.KNN_ENGINE = 'ivf'. Si al iniciar no
+existe en Config.KNN_IVF_PATH, `IVFKNN.load` lo construye a partir del modelo y lo guarda.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+
+import joblib
+import numpy as np
+from scipy.linalg.blas import sgemm
+
+import metrics
+from config import Config
+from diagnostics import setup_logging, shutdown_logging
+from model_engines import check_finite
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+# Arreglos del índice, un archivo .npy por arreglo
+INDEX_ARRAYS = ('centroids', 'samples', 'norms', 'labels', 'ids', 'offsets')
+
+# Iteraciones de k-means y filas por bloque al asignar muestras a los centroides
+KMEANS_ITERATIONS = 25
+ASSIGN_BLOCK_ROWS = 8192
+
+# Hasta este k, `smallest` usa pasadas de argmin en lugar de argpartition
+SMALLEST_MAX_PASSES = 8
+
+# Filas que IVFKNN resolvió con sklearn (menos de k candidatos o fuera del rango de float32)
+_ivf_fallback_rows = metrics.counter('knn_ivf_fallback_rows')
+
+
+def model_fingerprint(estimator):
+    """
+    Huella de las muestras y etiquetas de un KNeighborsClassifier ajustado.
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(estimator._fit_X, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(estimator._y, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def default_lists(n_samples):
+    """
+    Número de listas por defecto: alrededor de la raíz cuadrada de las muestras.
+    """
+    return max(int(round(np.sqrt(n_samples))), 1)
+
+
+def kmeans(points, n_clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    k-means de Lloyd sobre NumPy, con inicialización por muestras aleatorias. Un
+    centroide que se queda sin puntos se reemplaza por el punto más lejano de su centroide.
+
+    Args:
+        points (numpy.ndarray): Matriz (N, d) float32.
+        n_clusters (int): Número de centroides.
+        iterations (int): Iteraciones de Lloyd.
+        seed (int): Semilla de la inicialización.
+
+    Returns:
+        tuple: (centroides (n_clusters, d) float32, asignación de cada punto).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), size=n_clusters, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment, distances = assign(points, centroids)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        sums = np.zeros(centroids.shape, dtype=np.float64)
+        np.add.at(sums, assignment, points)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            farthest = np.argsort(distances)[::-1][:len(empty)]
+            sums[empty] = points[farthest]
+            counts[empty] = 1
+        centroids = (sums / counts[:, np.newaxis]).astype(np.float32)
+    return centroids, assign(points, centroids)[0]
+
+
+def assign(points, centroids):
+    """
+    Centroide más cercano de cada punto, por bloques de ASSIGN_BLOCK_ROWS filas.
+
+    Returns:
+        tuple: (índice del centroide, distancia al cuadrado a él).
+    """
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assignment = np.empty(len(points), dtype=np.intp)
+    distances = np.empty(len(points), dtype=np.float32)
+    for start in range(0, len(points), ASSIGN_BLOCK_ROWS):
+        block = points[start:start + ASSIGN_BLOCK_ROWS]
+        scores = block @ centroids.T
+        scores *= -2.0
+        scores += centroid_norms
+        nearest = scores.argmin(axis=1)
+        assignment[start:start + len(block)] = nearest
+        distances[start:start + len(block)] = (scores[np.arange(len(block)), nearest]
+                                               + np.einsum('ij,ij->i', block, block))
+    return assignment, distances
+
+
+def smallest(scores, k):
+    """
+    Los k menores valores de cada fila y sus columnas, sin un orden particular.
+
+    Con k pequeño, k pasadas de argmin son mucho más rápidas que `numpy.argpartition`
+    sobre filas cortas. Modifica `scores`.
+
+    Returns:
+        tuple: (valores (N, k), columnas (N, k)).
+    """
+    if k > SMALLEST_MAX_PASSES:
+        top = np.argpartition(scores, k - 1, axis=1)[:, :k]
+        return np.take_along_axis(scores, top, axis=1), top
+    rows = np.arange(len(scores))
+    values = np.empty((len(scores), k), dtype=scores.dtype)
+    top = np.empty((len(scores), k), dtype=np.intp)
+    for i in range(k):
+        top[:, i] = scores.argmin(axis=1)
+        values[:, i] = scores[rows, top[:, i]]
+        scores[rows, top[:, i]] = np.inf
+    return values, top
+
+
+def build_index(estimator, n_lists=None, seed=0):
+    """
+    Construye el índice IVF de un KNeighborsClassifier ajustado.
+
+    Args:
+        estimator (sklearn.neighbors.KNeighborsClassifier): Modelo ajustado.
+        n_lists (int, optional): Número de listas. Por defecto `default_lists`.
+        seed (int): Semilla de k-means.
+
+    Returns:
+        dict: Arreglos del índice (INDEX_ARRAYS) y sus metadatos en 'meta'.
+    """
+    samples = np.ascontiguousarray(estimator._fit_X, dtype=np.float32)
+    n_lists = min(n_lists or default_lists(len(samples)), len(samples))
+    centroids, assignment = kmeans(samples, n_lists, seed=seed)
+    order = np.argsort(assignment, kind='stable')
+    sizes = np.bincount(assignment, minlength=n_lists)
+    sorted_samples = np.ascontiguousarray(samples[order])
+    return {
+        'centroids': centroids,
+        'samples': sorted_samples,
+        'norms': np.einsum('ij,ij->i', sorted_samples, sorted_samples),
+        'labels': np.asarray(estimator._y, dtype=np.int64)[order],
+        'ids': order.astype(np.int64),
+        'offsets': np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+        'meta': {
+            'version': INDEX_FORMAT_VERSION,
+            'fingerprint': model_fingerprint(estimator),
+            'n_lists': int(n_lists),
+            'n_samples': int(len(samples)),
+            'n_features': int(samples.shape[1]),
+            'n_neighbors': int(estimator.n_neighbors),
+            'largest_list': int(sizes.max()),
+        },
+    }
+
+
+def save_index(index, path):
+    """
+    Guarda el índice en el directorio `path`, un .npy por arreglo y `meta.json`.
+    """
+    os.makedirs(path, exist_ok=True)
+    for name in INDEX_ARRAYS:
+        np.save(os.path.join(path, f'{name}.npy'), index[name])
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(index['meta'], f, indent=2)
+
+
+def _save_index_once(index, path):
+    """
+    Guarda el índice en un directorio temporal y lo renombra a `path`, de modo que otro
+    proceso que arranca a la vez nunca abre un índice a medio escribir. Si no se puede
+    guardar (otro proceso ganó la carrera o el directorio es de solo lectura), el índice
+    se usa igual desde memoria.
+    """
+    temporary = f"{path}.tmp-{os.getpid()}"
+    try:
+        save_index(index, temporary)
+        os.rename(temporary, path)
+    except OSError as e:
+        shutil.rmtree(temporary, ignore_errors=True)
+        logger.warning("No se pudo guardar el índice IVF en %s: %s", path, e)
+
+
+def load_index(path):
+    """
+    Abre un índice guardado con `save_index`, con los arreglos mapeados en memoria.
+
+    Raises:
+        FileNotFoundError: Si falta algún archivo del índice.
+        ValueError: Si el índice tiene otra versión de formato.
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('version') != INDEX_FORMAT_VERSION:
+        raise ValueError(f"El índice {path} tiene la versión {meta.get('version')}, "
+                         f"se esperaba {INDEX_FORMAT_VERSION}.")
+    index = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in INDEX_ARRAYS}
+    index['meta'] = meta
+    return index
+
+
+class IVFKNN:
+    """
+    k vecinos aproximados sobre un índice IVF, con la interfaz de `predict_proba`.
+
+    Cada consulta calcula su distancia a los centroides, elige las `nprobe` listas más
+    cercanas y busca los k vecinos solo entre sus muestras. Las probabilidades se calculan
+    como en sklearn (fracción de vecinos de cada clase). Si las listas elegidas tienen
+    menos de k muestras, la fila se resuelve con `estimator.kneighbors`.
+
+    Args:
+        estimator (sklearn.neighbors.KNeighborsClassifier): Modelo del que se construyó el índice.
+        index (dict): Índice de `build_index` o `load_index`.
+        nprobe (int): Listas revisadas por consulta.
+
+    Raises:
+        ValueError: Si el índice no corresponde al modelo o el modelo usa otra métrica o
+            pesos por distancia.
+    """
+
+    def __init__(self, estimator, index, nprobe=8):
+        if estimator.effective_metric_ != 'euclidean' or estimator.weights != 'uniform':
+            raise ValueError("IVFKNN solo admite la métrica euclidiana con pesos uniformes.")
+        if index['meta']['fingerprint'] != model_fingerprint(estimator):
+            raise ValueError("El índice IVF no corresponde al modelo de k vecinos cargado; "
+                             "reconstruirlo con `python -m ann_index build`.")
+        self.estimator = estimator
+        self.classes_ = estimator.classes_
+        self.n_features_in_ = estimator.n_features_in_
+        self.n_neighbors = estimator.n_neighbors
+        # Vistas ndarray sobre los arreglos mapeados: evitan el costo de np.memmap en cada
+        # operación sin copiar los datos
+        self.centroids = np.asarray(index['centroids'])
+        self.samples = np.asarray(index['samples'])
+        self.norms = np.asarray(index['norms'])
+        self.labels = np.asarray(index['labels'])
+        self.ids = np.asarray(index['ids'])
+        self.offsets = np.asarray(index['offsets']).tolist()
+        self.n_lists = len(self.centroids)
+        self.nprobe = min(max(nprobe, 1), self.n_lists)
+        self._centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self._inverse = None
+
+    @classmethod
+    def load(cls, estimator, path=None, nprobe=None):
+        """
+        Abre el índice guardado en `path` (por defecto Config.KNN_IVF_PATH).
+
+        Si el índice no existe (por ejemplo, porque un volumen montado oculta el construido
+        en la imagen) se construye a partir del modelo y se intenta guardar en `path`.
+        """
+        path = path or Config.KNN_IVF_PATH
+        try:
+            index = load_index(path)
+        except FileNotFoundError:
+            logger.warning("No se encontró el índice IVF en %s; se construye a partir del modelo.", path)
+            index = build_index(estimator)
+            _save_index_once(index, path)
+        engine = cls(estimator, index, nprobe=nprobe or Config.KNN_IVF_NPROBE)
+        logger.info("Índice IVF cargado desde %s: %d muestras en %d listas, nprobe=%d.",
+                    path, len(engine.samples), engine.n_lists, engine.nprobe)
+        return engine
+
+    def predict_proba(self, input_array):
+        """
+        Probabilidades por clase a partir de los k vecinos aproximados.
+
+        Args:
+            input_array (numpy.ndarray): Matriz (N, n_features_in_).
+
+        Returns:
+            numpy.ndarray: Matriz (N, n_clases) float64.
+
+        Raises:
+            ValueError: Si la matriz no tiene la forma esperada o contiene NaN o infinitos.
+        """
+        labels = self.labels[self._search(input_array)]
+        counts = np.empty((len(labels), len(self.classes_)), dtype=np.float64)
+        for column in range(len(self.classes_)):
+            np.sum(labels == column, axis=1, out=counts[:, column])
+        counts /= counts.sum(axis=1)[:, np.newaxis]
+        return counts
+
+    def kneighbors(self, input_array):
+        """
+        Índices de los k vecinos aproximados de cada fila, sin un orden particular.
+
+        Args:
+            input_array (numpy.ndarray): Matriz (N, n_features_in_).
+
+        Returns:
+            numpy.ndarray: Matriz (N, k) de índices de muestras de entrenamiento.
+
+        Raises:
+            ValueError: Si la matriz no tiene la forma esperada o contiene NaN o infinitos.
+        """
+        return self.ids[self._search(input_array)]
+
+    def _search(self, input_array):
+        """
+        Posiciones en el índice (en `samples` y `labels`) de los k vecinos aproximados.
+        """
+        input_array = np.asarray(input_array, dtype=np.float64)
+        if input_array.ndim != 2 or input_array.shape[1] != self.n_features_in_:
+            raise ValueError(f"Se esperaba una matriz de forma (N, {self.n_features_in_}), "
+                             f"se recibió {input_array.shape}")
+        check_finite(input_array)
+        queries = input_array.astype(np.float32)
+        k = self.n_neighbors
+
+        # Listas más cercanas de cada consulta
+        centroid_scores = self._centroid_norms - 2.0 * (queries @ self.centroids.T)
+        if self.nprobe < self.n_lists:
+            probes = np.argpartition(centroid_scores, self.nprobe - 1, axis=1)[:, :self.nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.n_lists), centroid_scores.shape)
+        # Filas fuera del rango de float32: se resuelven con sklearn
+        overflow = np.flatnonzero(~np.isfinite(centroid_scores).all(axis=1))
+        if len(queries) == 1 and not len(overflow):
+            return self._search_row(input_array, queries[0], probes[0])
+
+        # Pares (consulta, lista) agrupados por lista: una multiplicación de matrices por
+        # lista. Cada par aporta sus k mejores candidatos (|y|² - 2·x·y, que ordena igual que
+        # la distancia) a la fila de su consulta, y al final se eligen los k mejores de la fila.
+        n_probes = probes.shape[1]
+        candidate_scores = np.full((len(queries), n_probes * k), np.inf, dtype=np.float32)
+        candidates = np.zeros((len(queries), n_probes * k), dtype=np.intp)
+        pairs = np.argsort(probes.ravel(), kind='stable')
+        bounds = np.searchsorted(probes.ravel()[pairs], np.arange(self.n_lists + 1))
+        slots = np.arange(k)
+        for list_id in np.flatnonzero(np.diff(bounds)):
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            members, probe_rank = np.divmod(pairs[bounds[list_id]:bounds[list_id + 1]], n_probes)
+            scores = sgemm(-2.0, queries[members], self.samples[start:end], trans_b=True)
+            scores += self.norms[start:end]
+            if end - start > k:
+                scores, top = smallest(scores, k)
+            else:
+                top = np.broadcast_to(np.arange(end - start), scores.shape)
+            columns = probe_rank[:, np.newaxis] * k + slots[:scores.shape[1]]
+            candidate_scores[members[:, np.newaxis], columns] = scores
+            candidates[members[:, np.newaxis], columns] = top + start
+        if candidates.shape[1] > k:
+            best_scores, top = smallest(candidate_scores, k)
+            best = np.take_along_axis(candidates, top, axis=1)
+        else:
+            best_scores, best = candidate_scores, candidates
+
+        # Menos de k candidatos en las listas revisadas
+        incomplete = np.union1d(np.flatnonzero(~np.isfinite(best_scores).all(axis=1)), overflow)
+        if len(incomplete):
+            _ivf_fallback_rows.inc(len(incomplete))
+            best[incomplete] = self._positions(
+                self.estimator.kneighbors(input_array[incomplete], return_distance=False))
+        return best
+
+    def _search_row(self, input_array, query, probes):
+        """
+        `_search` para una sola fila: concatena las listas revisadas y las compara de una vez.
+        """
+        k = self.n_neighbors
+        candidates = np.concatenate([np.arange(self.offsets[list_id], self.offsets[list_id + 1])
+                                     for list_id in probes])
+        if len(candidates) < k:
+            _ivf_fallback_rows.inc()
+            return self._positions(self.estimator.kneighbors(input_array, return_distance=False))
+        scores = self.norms[candidates] - 2.0 * (self.samples[candidates] @ query)
+        return candidates[np.argpartition(scores, k - 1)[:k]][np.newaxis, :]
+
+    def _positions(self, sample_indices):
+        """
+        Convierte índices de muestras del modelo en posiciones del índice.
+        """
+        if self._inverse is None:
+            self._inverse = np.argsort(self.ids)
+        return self._inverse[sample_indices]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Índice IVF del modelo de k vecinos.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="Construye el índice a partir del modelo.")
+    build.add_argument('--model', default=os.path.join(Config.MODEL_PATH, 'knears_neighbors_model.pkl'),
+                       help="Modelo de k vecinos.")
+    build.add_argument('--output', default=Config.KNN_IVF_PATH, help="Directorio del índice.")
+    build.add_argument('--lists', type=int, help="Número de listas (por defecto ~raíz cuadrada de las muestras).")
+    build.add_argument('--seed', type=int, default=0, help="Semilla de k-means.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        estimator = joblib.load(args.model)
+        index = build_index(estimator, n_lists=args.lists, seed=args.seed)
+        save_index(index, args.output)
+    except Exception as e:
+        logger.error("Error construyendo el índice IVF: %s", e)
+        return 1
+    meta = index['meta']
+    logger.info("Índice IVF guardado en %s: %d muestras en %d listas (la mayor con %d).",
+                args.output, meta['n_samples'], meta['n_lists'], meta['largest_list'])
+    return 0
+
+
+if __name__ == "__main__":
+    setup_logging()
+    try:
+        sys.exit(main())
+    finally:
+        shutdown_logging()
@@ -0,0 +1,276 @@
+"""
+Re-procesamiento de un rango histórico del tópico de entrada (por ejemplo, al publicar
+modelos nuevos en `model/`).
+
+Uso:
+    python -m backfill --from 2026-10-01T00:00 [--to 2026-10-08T00:00]
+    python -m backfill --start-offset 0 [--end-offset 100000] [--partitions 0,1]
+
+Ubica el inicio y el fin del rango en cada partición (`offsets_for_times` para fechas,
+o los offsets indicados) y asigna las particiones directamente con `assign`: no se une
+al grupo de consumidores del procesamiento en línea ni confirma offsets, así que no lo
+interrumpe ni mueve su posición. Los mensajes se puntúan en lotes grandes de
+`--batch-size` con la misma decodificación y puntuación vectorizada que el
+`StreamProcessor`, y las predicciones se escriben en un tópico y una tabla propios
+(Config.KAFKA_TOPIC_BACKFILL y `--table`), nunca en los del procesamiento en línea.
+
+Cada PROGRESS_INTERVAL segundos registra el avance, la tasa y el tiempo restante
+estimado. Un lote que no se puede almacenar o publicar se reintenta `--retries` veces
+antes de abortar; la ejecución se puede repetir desde el último offset informado.
+"""
+
+import argparse
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+
+import metrics
+from config import Config
+from diagnostics import setup_logging, shutdown_logging
+from kafka_client import TopicPartition, create_consumer, create_producer, flush_producer
+from prediction import load_models
+from stream_processor import StreamProcessor
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Grupo de consumidores propio del re-procesamiento (solo identifica al cliente: no se
+# suscribe ni confirma offsets)
+BACKFILL_GROUP = 'transactions-backfill'
+
+# Tabla de destino por defecto
+BACKFILL_TABLE = 'transactions_backfill'
+
+# Segundos entre dos registros de progreso
+PROGRESS_INTERVAL = 5.0
+
+# Segundos máximos de espera de las consultas de metadatos y offsets al broker
+METADATA_TIMEOUT = 10.0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-puntúa un rango histórico del tópico de entrada.")
+    parser.add_argument('--topic', default=Config.KAFKA_TOPIC_INPUT, help="Tópico a re-procesar.")
+    parser.add_argument('--from', dest='start_time', type=parse_timestamp,
+                        help="Inicio del rango: fecha ISO 8601 (UTC si no indica zona) o epoch en ms.")
+    parser.add_argument('--to', dest='end_time', type=parse_timestamp,
+                        help="Fin del rango (exclusivo), con el mismo formato que --from.")
+    parser.add_argument('--start-offset', type=int, help="Primer offset de cada partición.")
+    parser.add_argument('--end-offset', type=int, help="Offset final (exclusivo) de cada partición.")
+    parser.add_argument('--partitions', type=parse_partitions,
+                        help="Particiones a re-procesar, separadas por comas (por defecto todas).")
+    parser.add_argument('--output-topic', default=Config.KAFKA_TOPIC_BACKFILL,
+                        help="Tópico de las predicciones (vacío para no publicar).")
+    parser.add_argument('--table', default=BACKFILL_TABLE, help="Tabla de las transacciones puntuadas.")
+    parser.add_argument('--no-persist', action='store_true', help="No almacena las transacciones.")
+    parser.add_argument('--dlq-topic', default='',
+                        help="Tópico de los mensajes que no se pueden puntuar (vacío: solo se cuentan).")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Mensajes por lote.")
+    parser.add_argument('--retries', type=int, default=3, help="Reintentos de un lote fallido.")
+    parser.add_argument('--idle-timeout', type=float, default=30.0,
+                        help="Segundos sin mensajes tras los cuales se termina aunque falten offsets.")
+    parser.add_argument('--group', default=BACKFILL_GROUP, help="Grupo de consumidores.")
+    args = parser.parse_args(argv)
+    if args.start_time is not None and args.start_offset is not None:
+        parser.error("--from y --start-offset son excluyentes.")
+    if args.end_time is not None and args.end_offset is not None:
+        parser.error("--to y --end-offset son excluyentes.")
+    return args
+
+
+def parse_timestamp(value):
+    """
+    Convierte una fecha ISO 8601 o un epoch en milisegundos a epoch en milisegundos.
+    """
+    if value.isdigit():
+        return int(value)
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida: {value!r}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def parse_partitions(value):
+    try:
+        return sorted({int(partition) for partition in value.split(',') if partition.strip()})
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"particiones inválidas: {value!r}")
+
+
+def resolve_ranges(consumer, args):
+    """
+    Calcula el rango de offsets [inicio, fin) de cada partición.
+
+    Returns:
+        dict: Partición -> (offset inicial, offset final). Solo incluye las particiones
+            con mensajes en el rango.
+    """
+    metadata = consumer.list_topics(args.topic, timeout=METADATA_TIMEOUT)
+    topic = metadata.topics.get(args.topic)
+    if topic is None or topic.error is not None:
+        raise RuntimeError(f"No se encontró el tópico {args.topic}.")
+    partitions = sorted(topic.partitions)
+    if args.partitions:
+        missing = set(args.partitions) - set(partitions)
+        if missing:
+            raise RuntimeError(f"El tópico {args.topic} no tiene las particiones {sorted(missing)}.")
+        partitions = args.partitions
+
+    watermarks = {
+        partition: consumer.get_watermark_offsets(TopicPartition(args.topic, partition),
+                                                  timeout=METADATA_TIMEOUT)
+        for partition in partitions
+    }
+    starts = {partition: low for partition, (low, _) in watermarks.items()}
+    ends = {partition: high for partition, (_, high) in watermarks.items()}
+    if args.start_time is not None:
+        starts = _offsets_for_time(consumer, args.topic, partitions, args.start_time, ends)
+    elif args.start_offset is not None:
+        starts = {partition: max(args.start_offset, starts[partition]) for partition in partitions}
+    if args.end_time is not None:
+        ends = _offsets_for_time(consumer, args.topic, partitions, args.end_time, ends)
+    elif args.end_offset is not None:
+        ends = {partition: min(args.end_offset, ends[partition]) for partition in partitions}
+    return {partition: (starts[partition], ends[partition])
+            for partition in partitions if starts[partition] < ends[partition]}
+
+
+def _offsets_for_time(consumer, topic, partitions, timestamp, high_watermarks):
+    """
+    Primer offset de cada partición con timestamp mayor o igual a `timestamp`; el high
+    watermark si no hay ninguno.
+    """
+    found = consumer.offsets_for_times([TopicPartition(topic, partition, timestamp) for partition in partitions],
+                                       timeout=METADATA_TIMEOUT)
+    return {
+        tp.partition: tp.offset if tp.offset >= 0 else high_watermarks[tp.partition]
+        for tp in found
+    }
+
+
+def backfill(args):
+    """
+    Ejecuta el re-procesamiento.
+
+    Returns:
+        dict: Mensajes re-procesados, puntuados y fallidos.
+    """
+    consumer = create_consumer(None, group_id=args.group)
+    if consumer is None:
+        raise RuntimeError("No se pudo crear el consumidor de Kafka.")
+    producer = create_producer() if args.output_topic else None
+    persist = not args.no_persist
+    if persist:
+        # Importación diferida: el re-procesamiento puede solo publicar, sin base de datos
+        from db import close_pool, init_transactions_table
+        init_transactions_table(args.table)
+    processor = StreamProcessor(None, producer, load_models(), persist=persist, output_topic=args.output_topic,
+                                dlq_topic=args.dlq_topic, input_topic=args.topic, workers=1, table=args.table)
+
+    stats = {'read': 0, 'scored': 0, 'failed': 0}
+    scored, failed = metrics.counter('stream_messages_processed'), metrics.counter('stream_messages_failed')
+    scored_before, failed_before = scored.value, failed.value
+    try:
+        ranges = resolve_ranges(consumer, args)
+        total = sum(end - start for start, end in ranges.values())
+        logger.info("Re-procesando %d mensajes de %s en %d particiones: %s", total, args.topic, len(ranges),
+                    {partition: f"{start}-{end}" for partition, (start, end) in ranges.items()})
+        if not ranges:
+            return stats
+        consumer.assign([TopicPartition(args.topic, partition, start) for partition, (start, _) in ranges.items()])
+
+        positions = {partition: start for partition, (start, _) in ranges.items()}
+        pending = set(ranges)
+        start_time = last_progress = last_message = time.monotonic()
+        while pending:
+            messages = consumer.consume(num_messages=args.batch_size, timeout=1.0)
+            now = time.monotonic()
+            if not messages:
+                if now - last_message >= args.idle_timeout:
+                    logger.warning("Sin mensajes nuevos durante %.0f s; particiones incompletas: %s",
+                                   args.idle_timeout, {p: positions[p] for p in sorted(pending)})
+                    break
+                continue
+            last_message = now
+
+            entries = []
+            for msg in messages:
+                if msg.error():
+                    logger.error("Error en Kafka Consumer: %s", msg.error())
+                    continue
+                partition = msg.partition()
+                if partition not in pending or msg.offset() >= ranges[partition][1]:
+                    continue
+                entries.append((msg.topic(), partition, msg.offset(), msg.key(), msg.value(), msg.headers()))
+                positions[partition] = msg.offset() + 1
+            if entries:
+                _process_with_retries(processor, entries, args.retries)
+                stats['read'] += len(entries)
+
+            finished = [partition for partition in pending if positions[partition] >= ranges[partition][1]]
+            if finished:
+                # No leer más allá del fin del rango
+                consumer.pause([TopicPartition(args.topic, partition) for partition in finished])
+                pending.difference_update(finished)
+
+            if now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                _log_progress(positions, ranges, total, now - start_time)
+    finally:
+        consumer.close()
+        if producer is not None:
+            flush_producer(producer)
+        if persist:
+            close_pool()
+
+    stats['scored'] = scored.value - scored_before
+    stats['failed'] = failed.value - failed_before
+    elapsed = time.monotonic() - start_time
+    logger.info("Re-procesamiento terminado en %.1f s: %d mensajes (%.0f mensajes/s), %d puntuados, "
+                "%d fallidos.", elapsed, stats['read'], stats['read'] / max(elapsed, 1e-9),
+                stats['scored'], stats['failed'])
+    return stats
+
+
+def _process_with_retries(processor, entries, retries):
+    # Avance entre intentos: un reintento no vuelve a almacenar ni a enviar al tópico de
+    # mensajes fallidos lo que ya quedó hecho
+    stored = {}
+    for attempt in range(retries + 1):
+        if processor.process_entries(entries, stored):
+            return
+        if attempt < retries:
+            logger.warning("Reintentando un lote de %d mensajes (%d/%d).", len(entries), attempt + 1, retries)
+            time.sleep(Config.STREAM_RETRY_BACKOFF_MS / 1000.0)
+    first = min(entries, key=lambda entry: (entry[1], entry[2]))
+    raise RuntimeError(f"No se pudo almacenar o publicar un lote de {len(entries)} mensajes "
+                       f"(desde {first[0]}[{first[1]}]@{first[2]}).")
+
+
+def _log_progress(positions, ranges, total, elapsed):
+    done = sum(positions[partition] - start for partition, (start, _) in ranges.items())
+    rate = done / max(elapsed, 1e-9)
+    eta = (total - done) / rate if rate > 0 else float('inf')
+    logger.info("Re-procesados %d de %d mensajes (%.1f%%), %.0f mensajes/s, %.0f s restantes. Posiciones: %s",
+                done, total, 100.0 * done / max(total, 1), rate, eta, positions)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        backfill(args)
+    except Exception as e:
+        logger.error("Error re-procesando mensajes: %s", e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    finally:
+        shutdown_logging()
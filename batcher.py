@@ -0,0 +1,195 @@
+"""
+Micro-batching de solicitudes concurrentes de predicción.
+
+Cada solicitud encola su fila de características y espera un future; un despachador
+agrupa las filas pendientes y ejecuta una única llamada vectorizada a los modelos
+cuando se alcanza `max_batch_size` o transcurren `max_wait_ms` desde la primera fila
+del lote. Mientras los `max_in_flight` lotes permitidos están en ejecución, las filas
+nuevas se acumulan para el siguiente lote.
+
+Cada fila guarda el contexto (`contextvars`) de su solicitud; el lote se puntúa en el
+contexto de una solicitud registrada en detalle si la hay (ver `diagnostics.begin_request`),
+de modo que los logs de la inferencia siguen la decisión de muestreo de las solicitudes.
+"""
+
+import asyncio
+import contextvars
+import inspect
+import logging
+import time
+
+import numpy as np
+
+import metrics
+from diagnostics import request_traced
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Agrupa filas enviadas concurrentemente desde el event loop en lotes.
+
+    Args:
+        score_batch (callable): Recibe una matriz (N, 30) y retorna una lista con N
+            resultados, en el mismo orden de las filas. Puede ser una función normal o
+            una corrutina (por ejemplo `InferenceExecutor.score`).
+        max_batch_size (int): Máximo de filas por lote.
+        max_wait_ms (float): Tiempo máximo que espera la primera fila de un lote antes
+            de despacharlo.
+        max_in_flight (int): Lotes que pueden estar ejecutándose al mismo tiempo.
+        name (str): Prefijo de las métricas reportadas.
+
+    Métricas:
+        <name>_batch_size: Tamaño efectivo de cada lote despachado.
+        <name>_queue_wait_seconds: Tiempo entre que una fila se encola y su lote se despacha.
+        <name>_batch_seconds: Duración de la llamada a `score_batch`.
+    """
+
+    def __init__(self, score_batch, max_batch_size, max_wait_ms, max_in_flight=1, name='predict'):
+        self.score_batch = score_batch
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.max_wait = max(float(max_wait_ms), 0.0) / 1000.0
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self._queue = None
+        self._task = None
+        self._accepting = False
+        self._slots = None
+        self._in_flight = set()
+        self._batch_size = metrics.histogram(f'{name}_batch_size')
+        self._queue_wait = metrics.histogram(f'{name}_queue_wait_seconds')
+        self._batch_seconds = metrics.histogram(f'{name}_batch_seconds')
+
+    def start(self):
+        """
+        Inicia el despachador. Debe llamarse desde el event loop que atiende las solicitudes.
+        """
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._task = asyncio.get_running_loop().create_task(self._dispatch_loop())
+            self._accepting = True
+            logger.info("Micro-batcher iniciado (max_batch_size=%d, max_wait_ms=%.1f).",
+                        self.max_batch_size, self.max_wait * 1000.0)
+
+    async def stop(self):
+        """
+        Detiene el despachador después de procesar las filas ya encoladas. Las solicitudes
+        que llegan después reciben un error (ver `submit`).
+        """
+        if self._task is None:
+            return
+        self._accepting = False
+        await self._queue.put(None)
+        await self._task
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight)
+        self._task = None
+
+    async def submit(self, row):
+        """
+        Encola una fila y espera su resultado.
+
+        Args:
+            row (numpy.ndarray): Fila de 30 características.
+
+        Returns:
+            Resultado de `score_batch` para esta fila.
+
+        Raises:
+            RuntimeError: Si el micro-batcher no está iniciado o se está deteniendo.
+            Exception: La excepción de `score_batch` si falla esta fila (las filas que fallan
+                se aíslan dividiendo el lote, ver `_score_isolated`).
+        """
+        if not self._accepting:
+            # Sin despachador la fila quedaría en la cola y la solicitud esperaría para siempre
+            raise RuntimeError("El micro-batcher está detenido.")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future, time.perf_counter(), contextvars.copy_context()))
+        return await future
+
+    async def _dispatch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Esperar un lugar libre antes de armar el lote: mientras tanto las filas
+            # nuevas se siguen acumulando en la cola
+            await self._slots.acquire()
+            item = await self._queue.get()
+            if item is None:
+                self._slots.release()
+                return
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            task = loop.create_task(self._flush(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+            if stopping:
+                return
+
+    async def _flush(self, batch):
+        try:
+            await self._run_batch(batch)
+        finally:
+            self._slots.release()
+
+    async def _run_batch(self, batch):
+        dispatched = time.perf_counter()
+        self._batch_size.observe(len(batch))
+        self._queue_wait.observe_many([dispatched - enqueued for _, _, enqueued, _ in batch])
+        try:
+            await self._score_isolated(batch)
+        finally:
+            self._batch_seconds.observe(time.perf_counter() - dispatched)
+
+    async def _score_isolated(self, batch):
+        """
+        Puntúa el lote completo; si falla, lo divide en mitades hasta aislar las filas que
+        fallan, de modo que solo sus solicitudes reciben la excepción.
+        """
+        try:
+            results = await self._score(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error("Error procesando una solicitud: %s", e)
+                future = batch[0][1]
+                if not future.done():
+                    future.set_exception(e)
+                return
+            middle = len(batch) // 2
+            await self._score_isolated(batch[:middle])
+            await self._score_isolated(batch[middle:])
+            return
+        for (_, future, _, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _score(self, batch):
+        contexts = [context for _, _, _, context in batch]
+        context = next((c for c in contexts if c.run(request_traced)), contexts[0])
+        # La tarea copia el contexto vigente al crearse: crearla dentro de `context.run`
+        # ejecuta `score_batch` con las variables de contexto de esa solicitud
+        task = context.run(asyncio.get_running_loop().create_task,
+                           self._call_score_batch(np.stack([row for row, _, _, _ in batch])))
+        return await task
+
+    async def _call_score_batch(self, matrix):
+        results = self.score_batch(matrix)
+        if inspect.isawaitable(results):
+            results = await results
+        return results
@@ -0,0 +1,6 @@
+"""
+Benchmarks de rendimiento del sistema de detección de fraude.
+
+Se ejecutan desde la raíz del repositorio como módulos, por ejemplo:
+    python -m benchmarks.bench_scaling
+"""
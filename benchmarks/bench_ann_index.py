@@ -0,0 +1,136 @@
+"""
+Compara la búsqueda aproximada `ann_index.IVFKNN` con la exacta `model_engines.ExactKNN`
+para varios valores de nprobe (listas revisadas por consulta).
+
+Para cada modelo construye el índice en un directorio temporal y lo abre mapeado en
+memoria, como en producción. Informa por nprobe:
+    - recall@k: fracción de los k vecinos exactos encontrados (por distancia, así las
+      muestras duplicadas cuentan como el mismo vecino).
+    - Desviación de la probabilidad de fraude respecto de ExactKNN: máxima, media y
+      fracción de filas con otra probabilidad.
+    - p50/p99 de una fila y de un lote.
+
+Antes de medir verifica que revisando todas las listas el recall sea 1.
+
+Modelos:
+    - El de k vecinos de MODEL_PATH, con transacciones sintéticas y muestras de
+      entrenamiento con ruido pequeño como consultas.
+    - Uno sintético con --synthetic-samples muestras agrupadas (0 para omitirlo), donde
+      la búsqueda exacta ya recorre muchas muestras por consulta.
+
+Uso:
+    python -m benchmarks.bench_ann_index --nprobe 1,2,4,8,16 --synthetic-samples 200000
+"""
+
+import argparse
+import os
+import tempfile
+
+import joblib
+import numpy as np
+from sklearn.neighbors import KNeighborsClassifier
+
+from ann_index import IVFKNN, build_index, load_index, save_index
+from config import Config
+from model_engines import ExactKNN
+from prediction import apply_scaling, load_scaler_params
+from benchmarks.utils import measure, random_raw_matrix, report
+
+
+def synthetic_model(n_samples, rng, n_clusters=256, fraud_rate=0.02):
+    """
+    KNeighborsClassifier ajustado sobre muestras agrupadas alrededor de `n_clusters`
+    centros, con la clase de fraude concentrada en algunos grupos.
+
+    Returns:
+        tuple: (modelo, función que genera n consultas de la misma distribución).
+    """
+    centers = rng.normal(0.0, 4.0, size=(n_clusters, 30))
+    fraud_share = np.where(rng.random(n_clusters) < 0.1, 0.5, fraud_rate / 10)
+
+    def sample(n):
+        cluster = rng.integers(0, n_clusters, n)
+        points = centers[cluster] + rng.normal(0.0, 1.0, size=(n, 30))
+        return points, (rng.random(n) < fraud_share[cluster]).astype(int)
+
+    samples, labels = sample(n_samples)
+    estimator = KNeighborsClassifier(n_neighbors=3, algorithm='brute').fit(samples, labels)
+    return estimator, lambda n: sample(n)[0]
+
+
+def recall_at_k(estimator, queries, exact, approximate):
+    """
+    Fracción de los vecinos exactos encontrados, comparando distancias.
+    """
+    samples = estimator._fit_X
+
+    def distances(neighbors):
+        return np.linalg.norm(samples[neighbors] - queries[:, np.newaxis, :], axis=2)
+
+    kth = distances(exact).max(axis=1, keepdims=True)
+    return (distances(approximate) <= kth * (1 + 1e-9)).mean()
+
+
+def compare(name, estimator, queries, args):
+    exact = ExactKNN(estimator)
+    exact_neighbors = exact.kneighbors(queries)
+    exact_fraud = exact.predict_proba(queries)[:, 1]
+    with tempfile.TemporaryDirectory() as path:
+        save_index(build_index(estimator, n_lists=args.lists), path)
+        index = load_index(path)
+        n_lists = index['meta']['n_lists']
+        full = IVFKNN(estimator, index, nprobe=n_lists)
+        recall = recall_at_k(estimator, queries, exact_neighbors, full.kneighbors(queries))
+        assert recall == 1.0, f"recall {recall} revisando todas las listas"
+        print(f"\n{name}: {len(estimator._fit_X)} muestras, {n_lists} listas "
+              f"(la mayor con {index['meta']['largest_list']}), k={estimator.n_neighbors}")
+        print(f"Verificado: revisando las {n_lists} listas el recall@k sobre {len(queries)} consultas es 1.")
+
+        single = queries[:1]
+        batch = queries[:args.batch]
+        report("ExactKNN (1 fila)", measure(lambda: exact.predict_proba(single), args.repeat))
+        report(f"ExactKNN ({len(batch)} filas)",
+               measure(lambda: exact.predict_proba(batch), args.batch_repeat), rows=len(batch))
+        for nprobe in args.nprobe:
+            if nprobe > n_lists:
+                continue
+            engine = IVFKNN(estimator, index, nprobe=nprobe)
+            recall = recall_at_k(estimator, queries, exact_neighbors, engine.kneighbors(queries))
+            deviation = np.abs(engine.predict_proba(queries)[:, 1] - exact_fraud)
+            print(f"nprobe={nprobe:<4} recall@{estimator.n_neighbors}={recall:.4f}  "
+                  f"desviación de P(fraude): máx={deviation.max():.3f} media={deviation.mean():.2e} "
+                  f"filas distintas={np.mean(deviation > 0):.2%}")
+            report(f"  IVFKNN nprobe={nprobe} (1 fila)", measure(lambda: engine.predict_proba(single), args.repeat))
+            report(f"  IVFKNN nprobe={nprobe} ({len(batch)} filas)",
+                   measure(lambda: engine.predict_proba(batch), args.batch_repeat), rows=len(batch))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nprobe", type=lambda value: [int(v) for v in value.split(',')],
+                        default=[1, 2, 4, 8, 16], help="Valores de nprobe separados por comas.")
+    parser.add_argument("--lists", type=int, help="Listas del índice (por defecto ~raíz cuadrada de las muestras).")
+    parser.add_argument("--repeat", type=int, default=300, help="Llamadas medidas de una fila.")
+    parser.add_argument("--batch", type=int, default=1024, help="Filas del caso por lotes.")
+    parser.add_argument("--batch-repeat", type=int, default=20, help="Llamadas medidas por lotes.")
+    parser.add_argument("--check-rows", type=int, default=5000, help="Consultas para recall y desviación.")
+    parser.add_argument("--synthetic-samples", type=int, default=200000,
+                        help="Muestras del modelo sintético (0 para omitirlo).")
+    args = parser.parse_args()
+
+    load_scaler_params()
+    rng = np.random.default_rng(0)
+    estimator = joblib.load(os.path.join(Config.MODEL_PATH, 'knears_neighbors_model.pkl'))
+    samples = estimator._fit_X
+    nearby = samples[rng.integers(0, len(samples), args.check_rows)]
+    nearby = nearby + rng.normal(0.0, 0.1, size=nearby.shape)
+    queries = np.vstack([apply_scaling(random_raw_matrix(args.check_rows, rng)), nearby])
+    compare("Modelo de MODEL_PATH", estimator, rng.permutation(queries), args)
+
+    if args.synthetic_samples:
+        estimator, sample = synthetic_model(args.synthetic_samples, rng)
+        compare("Modelo sintético", estimator, sample(args.check_rows), args)
+
+
+if __name__ == "__main__":
+    main()
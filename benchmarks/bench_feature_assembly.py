@@ -0,0 +1,46 @@
+"""
+Compara el armado de la matriz de entrada con pandas (`_build_feature_matrix`)
+contra el ensamblador sin pandas (`assemble_features` + `apply_scaling`).
+
+Uso:
+    python -m benchmarks.bench_feature_assembly --repeat 2000
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+
+import pandas as pd
+
+from prediction import _build_feature_matrix, apply_scaling, assemble_features, load_scaler_params
+from benchmarks.utils import measure, random_transactions, report
+
+
+def pandas_path(transactions):
+    # El flujo con pandas imprime y loguea el DataFrame; se descarta la salida
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _build_feature_matrix(pd.DataFrame(transactions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=1000, help="Llamadas medidas por caso.")
+    parser.add_argument("--batch", type=int, default=1024, help="Filas del caso por lotes.")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    load_scaler_params()
+    single = random_transactions(1)
+    batch = random_transactions(args.batch)
+
+    report("pandas (1 fila)", measure(lambda: pandas_path(single), args.repeat))
+    report("sin pandas (1 fila)", measure(lambda: apply_scaling(assemble_features(single)), args.repeat))
+    report(f"pandas ({args.batch} filas)",
+           measure(lambda: pandas_path(batch), max(args.repeat // 10, 5)), rows=args.batch)
+    report(f"sin pandas ({args.batch} filas)",
+           measure(lambda: apply_scaling(assemble_features(batch)), max(args.repeat // 10, 5)), rows=args.batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Compara `predict_proba` del KNeighborsClassifier de sklearn con el motor exacto
+`model_engines.ExactKNN` (float32 por bloques con BLAS y verificación en float64).
+
+Antes de medir verifica que las probabilidades sean idénticas bit a bit a las de sklearn
+sobre un conjunto de validación: transacciones sintéticas, las propias muestras de
+entrenamiento (con sus duplicados) y muestras de entrenamiento con ruido pequeño. Informa
+cuántas filas se resolvieron con sklearn por empates.
+
+Uso:
+    python -m benchmarks.bench_knn_engine --repeat 500 --threads 4
+"""
+
+import argparse
+import os
+
+import joblib
+import numpy as np
+
+import metrics
+from config import Config
+from model_engines import ExactKNN
+from prediction import apply_scaling, load_scaler_params
+from benchmarks.utils import measure, random_raw_matrix, report
+
+
+def validation_set(estimator, n, rng):
+    samples = estimator._fit_X
+    nearby = samples[rng.integers(0, len(samples), n)] + rng.normal(0.0, 1e-3, size=(n, samples.shape[1]))
+    return np.vstack([apply_scaling(random_raw_matrix(n, rng)), samples, nearby])
+
+
+def check_equivalence(estimator, engine, n, rng):
+    input_array = validation_set(estimator, n, rng)
+    fallback = metrics.counter('knn_exact_fallback_rows')
+    before = fallback.value
+    expected = estimator.predict_proba(input_array)
+    result = engine.predict_proba(input_array)
+    assert result.dtype == expected.dtype and result.shape == expected.shape
+    differing = np.flatnonzero((expected.view(np.uint64) != result.view(np.uint64)).any(axis=1))
+    assert len(differing) == 0, f"{len(differing)} filas difieren de sklearn, por ejemplo {differing[:5]}"
+    print(f"Verificado: {len(input_array)} filas idénticas bit a bit a sklearn "
+          f"({fallback.value - before} resueltas con sklearn por empates).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=300, help="Llamadas medidas por caso.")
+    parser.add_argument("--batch", type=int, default=1024, help="Filas del caso por lotes.")
+    parser.add_argument("--check-rows", type=int, default=10000, help="Filas sintéticas de la verificación.")
+    parser.add_argument("--block-mb", type=float, default=Config.KNN_BLOCK_MB, help="MB de distancias por bloque.")
+    parser.add_argument("--threads", type=int, default=Config.KNN_THREADS, help="Hilos por lote.")
+    args = parser.parse_args()
+
+    load_scaler_params()
+    estimator = joblib.load(os.path.join(Config.MODEL_PATH, 'knears_neighbors_model.pkl'))
+    engine = ExactKNN(estimator, block_mb=args.block_mb, threads=args.threads)
+    rng = np.random.default_rng(0)
+    check_equivalence(estimator, engine, args.check_rows, rng)
+
+    single = apply_scaling(random_raw_matrix(1, rng))
+    batch = apply_scaling(random_raw_matrix(args.batch, rng))
+    large = apply_scaling(random_raw_matrix(args.batch * 16, rng))
+    print(f"Muestras de entrenamiento: {len(engine.samples)}, k={engine.n_neighbors}, "
+          f"bloques de {engine.block_rows} filas, {engine.threads} hilos")
+    report("sklearn predict_proba (1 fila)", measure(lambda: estimator.predict_proba(single), args.repeat))
+    report("ExactKNN.predict_proba (1 fila)", measure(lambda: engine.predict_proba(single), args.repeat))
+    for rows in (batch, large):
+        repeat = max(args.repeat * len(batch) // len(rows), 5)
+        report(f"sklearn predict_proba ({len(rows)} filas)",
+               measure(lambda: estimator.predict_proba(rows), repeat), rows=len(rows))
+        report(f"ExactKNN.predict_proba ({len(rows)} filas)",
+               measure(lambda: engine.predict_proba(rows), repeat), rows=len(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compara `predict_proba` de la regresión logística de sklearn (con el escalado de
+`prediction.apply_scaling` por separado) con el motor `model_engines.FusedLogistic`.
+
+Antes de medir verifica la equivalencia con `logistic_regression_model.pkl`:
+    - Lotes sobre la entrada escalada: idénticos bit a bit.
+    - Una fila en Python puro y entrada sin escalar (escalado plegado en los
+      coeficientes): diferencia absoluta máxima menor que --tolerance.
+    - NaN e infinitos: el mismo ValueError que sklearn (primera línea del mensaje).
+
+Uso:
+    python -m benchmarks.bench_logistic_engine --repeat 5000
+"""
+
+import argparse
+import os
+
+import joblib
+import numpy as np
+
+from config import Config
+from model_engines import FusedLogistic
+from prediction import apply_scaling, load_scaler_params
+from benchmarks.utils import measure, random_raw_matrix, report
+
+
+def check_equivalence(estimator, engine, n, tolerance, rng):
+    raw = random_raw_matrix(n, rng)
+    scaled = apply_scaling(raw.copy())
+    expected = estimator.predict_proba(scaled)
+
+    batch = engine.predict_proba(scaled)
+    assert batch.dtype == expected.dtype and batch.shape == expected.shape
+    assert np.array_equal(expected.view(np.uint64), batch.view(np.uint64)), "el lote difiere de sklearn"
+
+    deviations = {
+        'fila escalada': np.array([engine.predict_row(row) for row in scaled.tolist()]),
+        'lote sin escalar': engine.predict_proba_raw(raw),
+        'fila sin escalar': np.array([engine.predict_row(row, raw=True) for row in raw.tolist()]),
+    }
+    for name, result in deviations.items():
+        deviation = np.abs(result - expected).max()
+        assert deviation < tolerance, f"{name}: desviación {deviation:.3g}"
+        deviations[name] = deviation
+
+    for bad in (np.nan, np.inf):
+        for rows in (2, 1):
+            sample = scaled[:rows].copy()
+            sample[-1, 5] = bad
+            errors = []
+            for predict in (estimator.predict_proba, engine.predict_proba):
+                try:
+                    predict(sample)
+                    errors.append(None)
+                except ValueError as e:
+                    errors.append(str(e).splitlines()[0])
+            assert errors[0] is not None and errors[0] == errors[1], errors
+
+    print(f"Verificado: {n} filas. Lote idéntico bit a bit a sklearn; desviación máxima: "
+          + ", ".join(f"{name} {deviation:.2g}" for name, deviation in deviations.items())
+          + "; NaN e infinitos rechazados igual que sklearn.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000, help="Llamadas medidas por caso.")
+    parser.add_argument("--batch", type=int, default=1024, help="Filas del caso por lotes.")
+    parser.add_argument("--check-rows", type=int, default=20000, help="Filas de la verificación.")
+    parser.add_argument("--tolerance", type=float, default=1e-12,
+                        help="Desviación máxima admitida de la fila en Python y de la entrada sin escalar.")
+    args = parser.parse_args()
+
+    multiplier, offset = load_scaler_params()
+    estimator = joblib.load(os.path.join(Config.MODEL_PATH, 'logistic_regression_model.pkl'))
+    engine = FusedLogistic(estimator, multiplier, offset)
+    rng = np.random.default_rng(0)
+    check_equivalence(estimator, engine, args.check_rows, args.tolerance, rng)
+
+    raw_single = random_raw_matrix(1, rng)
+    raw_row = raw_single[0].tolist()
+    scaled_single = apply_scaling(raw_single.copy())
+    raw_batch = random_raw_matrix(args.batch, rng)
+    scaled_batch = apply_scaling(raw_batch.copy())
+
+    report("escalado + sklearn predict_proba (1 fila)",
+           measure(lambda: estimator.predict_proba(apply_scaling(raw_single.copy())), args.repeat))
+    report("sklearn predict_proba (1 fila escalada)",
+           measure(lambda: estimator.predict_proba(scaled_single), args.repeat))
+    report("FusedLogistic.predict_proba (1 fila)",
+           measure(lambda: engine.predict_proba(scaled_single), args.repeat))
+    report("FusedLogistic.predict_row (sin escalar)",
+           measure(lambda: engine.predict_row(raw_row, raw=True), args.repeat))
+    report(f"escalado + sklearn ({args.batch} filas)",
+           measure(lambda: estimator.predict_proba(apply_scaling(raw_batch.copy())), args.repeat), rows=args.batch)
+    report(f"FusedLogistic.predict_proba ({args.batch} filas)",
+           measure(lambda: engine.predict_proba(scaled_batch), args.repeat), rows=args.batch)
+    report(f"FusedLogistic.predict_proba_raw ({args.batch} filas)",
+           measure(lambda: engine.predict_proba_raw(raw_batch), args.repeat), rows=args.batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compara el escalado de 'amount' y 'time' por solicitud con RobustScaler.fit_transform
+(flujo anterior) contra la transformación afín precalculada de `prediction.apply_scaling`.
+
+Uso:
+    python -m benchmarks.bench_scaling --repeat 2000
+"""
+
+import argparse
+
+import numpy as np
+from sklearn.preprocessing import RobustScaler
+
+from prediction import apply_scaling, load_scaler_params
+from benchmarks.utils import measure, random_raw_matrix, report
+
+
+def fit_transform_per_row(raw):
+    """Flujo anterior: un RobustScaler ajustado por cada fila y columna."""
+    scaler_amount = RobustScaler()
+    scaler_time = RobustScaler()
+    out = raw.copy()
+    for i in range(len(raw)):
+        out[i, 0] = scaler_amount.fit_transform(raw[i:i + 1, 0:1])[0, 0]
+        out[i, 1] = scaler_time.fit_transform(raw[i:i + 1, 1:2])[0, 0]
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=1000, help="Llamadas medidas por caso.")
+    parser.add_argument("--batch", type=int, default=1024, help="Filas del caso por lotes.")
+    args = parser.parse_args()
+
+    load_scaler_params()
+    single = random_raw_matrix(1)
+    batch = random_raw_matrix(args.batch)
+
+    report("fit_transform por fila (1 fila)",
+           measure(lambda: fit_transform_per_row(single), args.repeat))
+    report("afín precalculado (1 fila)",
+           measure(lambda: apply_scaling(single.copy()), args.repeat))
+    report(f"fit_transform por fila ({args.batch} filas)",
+           measure(lambda: fit_transform_per_row(batch), max(args.repeat // 100, 5)), rows=args.batch)
+    report(f"afín precalculado ({args.batch} filas)",
+           measure(lambda: apply_scaling(batch.copy()), args.repeat), rows=args.batch)
+
+    # El flujo anterior transformaba cualquier monto y tiempo en 0
+    old = fit_transform_per_row(batch)
+    new = apply_scaling(batch.copy())
+    print(f"Columnas escaladas distintas de cero: anterior={np.count_nonzero(old[:, :2])}, "
+          f"afín={np.count_nonzero(new[:, :2])} de {2 * args.batch}")
+
+
+if __name__ == "__main__":
+    main()
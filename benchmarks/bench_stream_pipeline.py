@@ -0,0 +1,172 @@
+"""
+Mide el pipeline completo de Kafka (`StreamProcessor`: consumo, decodificación,
+puntuación, publicación y commit de offsets) sobre el transporte en memoria
+(`memory_kafka`), sin broker ni red.
+
+Dos escenarios, con datos deterministas:
+    - Rendimiento: se cargan N transacciones en el tópico de entrada y se mide cuánto
+      tarda el procesador en publicar todas las predicciones.
+    - Latencia: se producen transacciones a una tasa fija y se mide, para cada una, el
+      tiempo entre su timestamp en el tópico de entrada y el de su predicción en el de
+      salida.
+
+Antes de reportar verifica que haya exactamente una predicción por transacción, que
+coincida con `process_transactions_batch` y que los offsets confirmados lleguen al
+final de cada partición. No usa la base de datos.
+
+Uso:
+    python -m benchmarks.bench_stream_pipeline --messages 20000 --format binary
+"""
+
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+
+import memory_kafka
+import wire_format
+from config import Config
+from kafka_client import CONSUMER_GROUP, create_consumer, create_producer, flush_producer, send_to_topic
+from prediction import RAW_COLUMNS, load_models, process_transactions_batch
+from stream_processor import StreamProcessor
+from benchmarks.utils import random_raw_matrix, random_transactions
+
+
+def encode_inputs(n, message_format, seed):
+    """
+    Returns:
+        tuple: (transacciones como diccionarios, lista de (clave, valor, headers)).
+    """
+    transactions = random_transactions(n, seed=seed)
+    if message_format == 'binary':
+        raw = random_raw_matrix(n, np.random.default_rng(seed))
+        transactions = [dict(zip(RAW_COLUMNS, row.tolist())) for row in raw]
+        values = wire_format.encode_transactions(raw)
+        headers = [(wire_format.CONTENT_TYPE_HEADER, wire_format.CONTENT_TYPE_TRANSACTION)]
+        return transactions, [(f"tx-{i}", value, headers) for i, value in enumerate(values)]
+    return transactions, [
+        (f"tx-{i}", json.dumps(dict(transaction, transaction_id=f"tx-{i}")).encode(), None)
+        for i, transaction in enumerate(transactions)
+    ]
+
+
+def start_pipeline(models, args):
+    consumer = create_consumer(Config.KAFKA_TOPIC_INPUT)
+    producer = create_producer()
+    processor = StreamProcessor(consumer, producer, models, persist=False, batch_size=args.batch,
+                                workers=args.workers, worker_kind='thread')
+    processor.start()
+    return consumer, producer, processor
+
+
+def stop_pipeline(consumer, producer, processor):
+    processor.stop()
+    consumer.close()
+    flush_producer(producer)
+
+
+def wait_for_outputs(broker, expected, timeout=600.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        produced = sum(broker.watermarks(Config.KAFKA_TOPIC_OUTPUT, p)[1]
+                       for p in range(broker.create_topic(Config.KAFKA_TOPIC_OUTPUT)))
+        if produced >= expected:
+            return
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"Solo se publicaron {produced} de {expected} predicciones.")
+        time.sleep(0.001)
+
+
+def flatten(prediction):
+    svc = prediction['svc']
+    return [*prediction['logistic'], *prediction['kneighbors'], svc['non_fraud'], svc['fraud'], *prediction['tree']]
+
+
+def check_outputs(broker, transactions, models):
+    outputs = {}
+    for msg in broker.messages(Config.KAFKA_TOPIC_OUTPUT):
+        key = msg.key().decode()
+        assert key not in outputs, f"predicción duplicada: {key}"
+        outputs[key] = json.loads(msg.value())
+    assert len(outputs) == len(transactions), (len(outputs), len(transactions))
+
+    sample = list(range(0, len(transactions), max(len(transactions) // 200, 1)))
+    expected = process_transactions_batch([transactions[i] for i in sample], models)
+    np.testing.assert_allclose([flatten(outputs[f"tx-{i}"]) for i in sample],
+                               [flatten(prediction) for prediction in expected], rtol=0, atol=1e-12)
+
+    for p in range(broker.create_topic(Config.KAFKA_TOPIC_INPUT)):
+        high = broker.watermarks(Config.KAFKA_TOPIC_INPUT, p)[1]
+        committed = broker.committed(CONSUMER_GROUP, Config.KAFKA_TOPIC_INPUT, p)
+        assert high == 0 or committed == high, f"partición {p}: commit {committed}, fin {high}"
+    print(f"Verificado: {len(outputs)} predicciones únicas, iguales a process_transactions_batch "
+          f"(muestra de {len(sample)}) y offsets confirmados hasta el final de cada partición.")
+
+
+def run_throughput(models, args):
+    broker = memory_kafka.reset_broker(args.partitions)
+    transactions, inputs = encode_inputs(args.messages, args.format, args.seed)
+    producer = create_producer()
+    for key, value, headers in inputs:
+        send_to_topic(producer, Config.KAFKA_TOPIC_INPUT, key=key, value=value, headers=headers)
+    flush_producer(producer)
+
+    start = time.perf_counter()
+    pipeline = start_pipeline(models, args)
+    wait_for_outputs(broker, len(inputs))
+    elapsed = time.perf_counter() - start
+    stop_pipeline(*pipeline)
+    check_outputs(broker, transactions, models)
+    print(f"Rendimiento ({args.format}, {args.messages} mensajes, lotes de {args.batch}, "
+          f"{args.workers} workers): {elapsed:.2f} s, {args.messages / elapsed:,.0f} mensajes/s")
+
+
+def run_latency(models, args):
+    broker = memory_kafka.reset_broker(args.partitions)
+    n = int(args.rate * args.duration)
+    transactions, inputs = encode_inputs(n, args.format, args.seed)
+    pipeline = start_pipeline(models, args)
+    producer = create_producer()
+    start = time.perf_counter()
+    for i, (key, value, headers) in enumerate(inputs):
+        delay = start + i / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        send_to_topic(producer, Config.KAFKA_TOPIC_INPUT, key=key, value=value, headers=headers)
+    wait_for_outputs(broker, n)
+    flush_producer(producer)
+    stop_pipeline(*pipeline)
+    check_outputs(broker, transactions, models)
+
+    produced_at = {msg.key(): msg.timestamp()[1] for msg in broker.messages(Config.KAFKA_TOPIC_INPUT)}
+    latencies = np.array([msg.timestamp()[1] - produced_at[msg.key()]
+                          for msg in broker.messages(Config.KAFKA_TOPIC_OUTPUT)], dtype=np.float64)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    print(f"Latencia ({args.format}, {args.rate:,.0f} mensajes/s durante {args.duration:.0f} s): "
+          f"p50={p50:.0f}ms  p90={p90:.0f}ms  p99={p99:.0f}ms  max={latencies.max():.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000, help="Mensajes del escenario de rendimiento.")
+    parser.add_argument("--format", choices=("json", "binary"), default="json", help="Formato de entrada.")
+    parser.add_argument("--batch", type=int, default=Config.STREAM_BATCH_SIZE, help="Mensajes por lote.")
+    parser.add_argument("--workers", type=int, default=1, help="Workers 'thread' del procesador.")
+    parser.add_argument("--partitions", type=int, default=Config.KAFKA_MEMORY_PARTITIONS,
+                        help="Particiones de los tópicos.")
+    parser.add_argument("--rate", type=float, default=2000, help="Mensajes/s del escenario de latencia.")
+    parser.add_argument("--duration", type=float, default=5, help="Segundos del escenario de latencia.")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los datos.")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    Config.KAFKA_TRANSPORT = 'memory'
+    models = load_models()
+    run_throughput(models, args)
+    run_latency(models, args)
+
+
+if __name__ == "__main__":
+    main()
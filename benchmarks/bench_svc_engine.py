@@ -0,0 +1,119 @@
+"""
+Compara `decision_function` de SVC de sklearn seguida de la sigmoide de prediction.py con
+el motor `model_engines.KernelSVC` (kernels por lotes y sigmoide fusionada).
+
+Antes de medir verifica, para `svc_model.pkl` y para modelos sintéticos con kernel
+'rbf', 'poly' y 'sigmoid':
+    - Probabilidad de fraude: diferencia absoluta máxima con sklearn menor que --tolerance.
+    - NaN e infinitos: el mismo ValueError que sklearn (primera línea del mensaje).
+
+Luego informa, para cada fracción de --prune, cuántos vectores de soporte se descartan y
+cuánto cambia la probabilidad de fraude (máxima y media sobre las filas de verificación).
+
+Uso:
+    python -m benchmarks.bench_svc_engine --repeat 2000 --prune 0.001,0.01,0.1
+"""
+
+import argparse
+import os
+
+import joblib
+import numpy as np
+from sklearn.svm import SVC
+
+from config import Config
+from model_engines import KernelSVC
+from prediction import apply_scaling, load_scaler_params
+from benchmarks.utils import measure, random_raw_matrix, report
+
+
+def sklearn_proba(estimator, input_array):
+    """
+    Probabilidad de fraude como en `prediction._predict_matrix` con el SVC de sklearn.
+    """
+    return 1 / (1 + np.exp(-estimator.decision_function(input_array)))
+
+
+def synthetic_models(n_samples, rng):
+    """
+    SVC con kernel 'rbf', 'poly' y 'sigmoid' ajustados sobre datos sintéticos de 30 columnas.
+    """
+    samples = rng.normal(0.0, 1.0, size=(n_samples, 30))
+    labels = (samples[:, 0] * samples[:, 1] + samples[:, 2] > 0.5).astype(int)
+    return {kernel: SVC(kernel=kernel, C=1.0).fit(samples, labels) for kernel in ('rbf', 'poly', 'sigmoid')}
+
+
+def check_equivalence(name, estimator, input_array, tolerance):
+    engine = KernelSVC(estimator)
+    deviation = np.abs(engine.predict_proba(input_array)[:, 1] - sklearn_proba(estimator, input_array)).max()
+    assert deviation < tolerance, f"{name}: desviación {deviation:.3g}"
+
+    for bad in (np.nan, np.inf):
+        for rows in (2, 1):
+            sample = input_array[:rows].copy()
+            sample[-1, 5] = bad
+            errors = []
+            for predict in (estimator.decision_function, engine.predict_proba):
+                try:
+                    predict(sample)
+                    errors.append(None)
+                except ValueError as e:
+                    errors.append(str(e).splitlines()[0])
+            assert errors[0] is not None and errors[0] == errors[1], errors
+    print(f"Verificado: {name} ({len(estimator.support_vectors_)} vectores de soporte), {len(input_array)} filas, "
+          f"desviación máxima {deviation:.2g}; NaN e infinitos rechazados igual que sklearn.")
+
+
+def report_pruning(name, estimator, input_array, fractions):
+    full = KernelSVC(estimator).predict_proba(input_array)[:, 1]
+    for fraction in fractions:
+        engine = KernelSVC(estimator, min_dual_coef=fraction)
+        deviation = np.abs(engine.predict_proba(input_array)[:, 1] - full)
+        print(f"{name}: min_dual_coef={fraction:<6g} {len(engine.dual_coef):>5} de "
+              f"{len(estimator.support_vectors_)} vectores de soporte; desviación de P(fraude): "
+              f"máx={deviation.max():.3g} media={deviation.mean():.2e}")
+
+
+def report_timings(name, estimator, single, batch, repeat):
+    engine = KernelSVC(estimator)
+    report(f"{name}: sklearn + sigmoide (1 fila)", measure(lambda: sklearn_proba(estimator, single), repeat))
+    report(f"{name}: KernelSVC (1 fila)", measure(lambda: engine.predict_proba(single), repeat))
+    batch_repeat = max(repeat // 10, 5)
+    report(f"{name}: sklearn + sigmoide ({len(batch)} filas)",
+           measure(lambda: sklearn_proba(estimator, batch), batch_repeat), rows=len(batch))
+    report(f"{name}: KernelSVC ({len(batch)} filas)",
+           measure(lambda: engine.predict_proba(batch), batch_repeat), rows=len(batch))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=1000, help="Llamadas medidas por caso de una fila.")
+    parser.add_argument("--batch", type=int, default=1024, help="Filas del caso por lotes.")
+    parser.add_argument("--check-rows", type=int, default=20000, help="Filas de la verificación.")
+    parser.add_argument("--tolerance", type=float, default=1e-12,
+                        help="Desviación máxima admitida de la probabilidad de fraude.")
+    parser.add_argument("--prune", type=lambda value: [float(v) for v in value.split(',')],
+                        default=[0.001, 0.01, 0.05, 0.1], help="Fracciones de min_dual_coef separadas por comas.")
+    parser.add_argument("--synthetic-samples", type=int, default=3000,
+                        help="Muestras de entrenamiento de los modelos sintéticos (0 para omitirlos).")
+    args = parser.parse_args()
+
+    load_scaler_params()
+    rng = np.random.default_rng(0)
+    models = {'svc_model.pkl': joblib.load(os.path.join(Config.MODEL_PATH, 'svc_model.pkl'))}
+    inputs = {'svc_model.pkl': apply_scaling(random_raw_matrix(args.check_rows, rng))}
+    if args.synthetic_samples:
+        for kernel, estimator in synthetic_models(args.synthetic_samples, rng).items():
+            models[kernel] = estimator
+            inputs[kernel] = rng.normal(0.0, 1.0, size=(args.check_rows, 30))
+
+    for name, estimator in models.items():
+        check_equivalence(name, estimator, inputs[name], args.tolerance)
+    for name, estimator in models.items():
+        report_pruning(name, estimator, inputs[name], args.prune)
+    for name, estimator in models.items():
+        report_timings(name, estimator, inputs[name][:1], inputs[name][:args.batch], args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Mide la latencia de `get_transaction` con y sin la columna indexada 'transaction_id'.
+
+Crea un esquema temporal en la base de Config.DATABASE_URL, lo llena con N filas
+sintéticas (sin la columna, como las tablas anteriores a la migración), mide la búsqueda
+por transaction_json->>'transaction_id', ejecuta `migrate_transaction_id_column` y mide
+la búsqueda por la columna indexada. El esquema se elimina al terminar.
+
+Uso:
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_transaction_lookup --rows 1000000 10000000
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from db import TRANSACTIONS_DDL, get_db_connection, migrate_transaction_id_column
+from benchmarks.utils import report
+
+SCHEMA = "lookup_bench"
+
+SELECT_COLUMNS = """
+    transaction_json,
+    logistic_regression_fraud, logistic_regression_non_fraud,
+    kneighbors_fraud, kneighbors_non_fraud,
+    svc_fraud, svc_non_fraud,
+    decision_tree_fraud, decision_tree_non_fraud
+"""
+EXPRESSION_QUERY = f"""
+    SELECT {SELECT_COLUMNS} FROM transactions
+    WHERE transaction_json->>'transaction_id' = %s ORDER BY id DESC LIMIT 1
+"""
+INDEXED_QUERY = f"""
+    SELECT {SELECT_COLUMNS} FROM transactions
+    WHERE transaction_id = %s ORDER BY id DESC LIMIT 1
+"""
+
+
+def populate(cursor, rows):
+    """Crea la tabla sin 'transaction_id' y la llena con `rows` transacciones."""
+    cursor.execute(TRANSACTIONS_DDL)
+    cursor.execute("ALTER TABLE transactions DROP COLUMN transaction_id")
+    cursor.execute("""
+        INSERT INTO transactions (
+            transaction_json,
+            logistic_regression_fraud, logistic_regression_non_fraud,
+            kneighbors_fraud, kneighbors_non_fraud,
+            svc_fraud, svc_non_fraud,
+            decision_tree_fraud, decision_tree_non_fraud
+        )
+        SELECT jsonb_build_object('transaction_id', 'tx-' || g, 'amount', g %% 1000),
+               r, 1 - r, r, 1 - r, r, 1 - r, r, 1 - r
+        FROM (SELECT g, random() AS r FROM generate_series(1, %s) AS g) AS s
+    """, (rows,))
+    cursor.execute("ANALYZE transactions")
+
+
+def measure_lookups(cursor, query, rows, repeat):
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        transaction_id = f"tx-{random.randint(1, rows)}"
+        start = time.perf_counter()
+        cursor.execute(query, (transaction_id,))
+        cursor.fetchone()
+        timings[i] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000],
+                        help="Tamaños de tabla a medir.")
+    parser.add_argument("--repeat", type=int, default=200, help="Búsquedas con índice por tamaño.")
+    parser.add_argument("--scan-repeat", type=int, default=5, help="Búsquedas sin índice por tamaño.")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        for rows in args.rows:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+            cursor.execute(f"SET search_path TO {SCHEMA}")
+            conn.commit()
+
+            start = time.perf_counter()
+            populate(cursor, rows)
+            conn.commit()
+            print(f"\n{rows:,} filas generadas en {time.perf_counter() - start:.1f}s")
+
+            report("transaction_json->>'transaction_id'",
+                   measure_lookups(cursor, EXPRESSION_QUERY, rows, args.scan_repeat))
+            conn.commit()
+
+            start = time.perf_counter()
+            migrate_transaction_id_column(conn)
+            print(f"Migración (llenado + índice) en {time.perf_counter() - start:.1f}s")
+
+            report("columna transaction_id indexada",
+                   measure_lookups(cursor, INDEXED_QUERY, rows, args.repeat))
+            conn.commit()
+    finally:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compara `predict_proba` del DecisionTreeClassifier de sklearn con el motor compilado
+`model_engines.CompiledTree` (recorrido por niveles para lotes y código de ramas generado
+para una fila).
+
+Antes de medir verifica que ambos produzcan exactamente los mismos bits, sobre filas
+aleatorias y sobre valores en los bordes de cada umbral (el umbral, sus vecinos float32 y
+los puntos medios de redondeo) y NaN.
+
+Uso:
+    python -m benchmarks.bench_tree_engine --repeat 5000
+"""
+
+import argparse
+import os
+
+import joblib
+import numpy as np
+
+from config import Config
+from model_engines import CompiledTree
+from prediction import apply_scaling, load_scaler_params
+from benchmarks.utils import measure, random_raw_matrix, report
+
+
+def threshold_edge_values(estimator):
+    """
+    Valores alrededor de cada umbral donde un error de redondeo cambiaría la rama.
+
+    Returns:
+        list[tuple[int, float]]: (columna, valor).
+    """
+    tree = estimator.tree_
+    values = []
+    for node in np.flatnonzero(tree.children_left != -1):
+        threshold = tree.threshold[node]
+        t32 = np.float32(threshold)
+        neighbors = [np.nextafter(t32, np.float32(-np.inf)), t32, np.nextafter(t32, np.float32(np.inf))]
+        candidates = [threshold, np.nextafter(threshold, -np.inf), np.nextafter(threshold, np.inf)]
+        for low, high in zip(neighbors, neighbors[1:]):
+            middle = (np.float64(low) + np.float64(high)) / 2.0
+            candidates += [middle, np.nextafter(middle, -np.inf), np.nextafter(middle, np.inf), np.float64(low)]
+        values += [(tree.feature[node], float(value)) for value in candidates]
+    return values
+
+
+def check_equivalence(estimator, engine, n, rng):
+    """
+    Verifica que el motor reproduzca bit a bit `predict_proba` del estimador, por lotes y por fila.
+    """
+    input_array = apply_scaling(random_raw_matrix(n, rng))
+    edges = threshold_edge_values(estimator)
+    for row in input_array:
+        for index in rng.integers(0, len(edges), size=3):
+            column, value = edges[index]
+            row[column] = value
+    input_array[rng.random(input_array.shape) < 0.01] = np.nan
+
+    expected = estimator.predict_proba(input_array)
+    batch = engine.predict_proba(input_array)
+    rows = np.array([engine.predict_row(row) for row in input_array.tolist()])
+    assert batch.dtype == expected.dtype and batch.shape == expected.shape
+    assert np.array_equal(expected.view(np.uint64), batch.view(np.uint64)), "el lote difiere de sklearn"
+    assert np.array_equal(expected.view(np.uint64), rows.view(np.uint64)), "una fila difiere de sklearn"
+    print(f"Verificado: {n} filas ({len(edges)} valores de borde de umbrales y NaN) idénticas bit a bit "
+          f"a sklearn, por lotes y por fila.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000, help="Llamadas medidas por caso.")
+    parser.add_argument("--batch", type=int, default=1024, help="Filas del caso por lotes.")
+    parser.add_argument("--check-rows", type=int, default=20000, help="Filas de la verificación.")
+    args = parser.parse_args()
+
+    load_scaler_params()
+    estimator = joblib.load(os.path.join(Config.MODEL_PATH, 'decision_tree_model.pkl'))
+    engine = CompiledTree(estimator)
+    rng = np.random.default_rng(0)
+    check_equivalence(estimator, engine, args.check_rows, rng)
+
+    single = apply_scaling(random_raw_matrix(1, rng))
+    row = single[0].tolist()
+    batch = apply_scaling(random_raw_matrix(args.batch, rng))
+    print(f"Árbol: {estimator.tree_.node_count} nodos, profundidad {engine.max_depth}")
+    report("sklearn predict_proba (1 fila)", measure(lambda: estimator.predict_proba(single), args.repeat))
+    report("CompiledTree.predict_proba (1 fila)", measure(lambda: engine.predict_proba(single), args.repeat))
+    report("CompiledTree.predict_row (lista)", measure(lambda: engine.predict_row(row), args.repeat))
+    report(f"sklearn predict_proba ({args.batch} filas)",
+           measure(lambda: estimator.predict_proba(batch), args.repeat), rows=args.batch)
+    report(f"CompiledTree.predict_proba ({args.batch} filas)",
+           measure(lambda: engine.predict_proba(batch), args.repeat), rows=args.batch)
+
+
+if __name__ == "__main__":
+    main()
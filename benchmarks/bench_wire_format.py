@@ -0,0 +1,81 @@
+"""
+Compara la decodificación de un lote de transacciones de Kafka en JSON (`json.loads` por
+mensaje + `assemble_features`) contra el formato binario de `wire_format`
+(`decode_transactions`, un único `np.frombuffer` por lote), y la codificación de las
+predicciones (`json.dumps` contra `encode_prediction`).
+
+Antes de medir verifica que ambos caminos produzcan la misma matriz: idéntica en
+float64 y dentro de la precisión de float32 en el formato float32.
+
+Uso:
+    python -m benchmarks.bench_wire_format --batch 500
+"""
+
+import argparse
+import json
+import logging
+
+import numpy as np
+
+import wire_format
+from prediction import assemble_features, load_models, process_transactions_batch
+from benchmarks.utils import measure, random_raw_matrix, random_transactions, report
+
+
+def decode_json(values):
+    return assemble_features([json.loads(value) for value in values])
+
+
+def check_equivalence(transactions):
+    expected = assemble_features(transactions)
+    payloads = [json.dumps(transaction).encode() for transaction in transactions]
+    np.testing.assert_array_equal(decode_json(payloads), expected)
+
+    decoded, errors = wire_format.decode_transactions(wire_format.encode_transactions(expected, 'float64'))
+    assert not errors, errors
+    np.testing.assert_array_equal(decoded, expected)
+
+    decoded, errors = wire_format.decode_transactions(wire_format.encode_transactions(expected, 'float32'))
+    assert not errors, errors
+    np.testing.assert_allclose(decoded, expected, rtol=1e-6, atol=1e-6)
+
+    predictions = process_transactions_batch(transactions[:10], load_models())
+    for prediction in predictions:
+        assert wire_format.decode_prediction(wire_format.encode_prediction(prediction)) == prediction
+    print("Equivalencia verificada: JSON, binario float64 (exacto), float32 (rtol 1e-6) y predicciones.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="Llamadas medidas por caso.")
+    parser.add_argument("--batch", type=int, default=500, help="Mensajes por lote.")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    transactions = random_transactions(args.batch)
+    check_equivalence(transactions)
+
+    raw = random_raw_matrix(args.batch)
+    json_values = [json.dumps(dict(transaction, transaction_id=f"tx-{i}")).encode()
+                   for i, transaction in enumerate(transactions)]
+    binary64 = wire_format.encode_transactions(raw, 'float64')
+    binary32 = wire_format.encode_transactions(raw, 'float32')
+    print(f"Tamaño por mensaje: JSON ~{np.mean([len(v) for v in json_values]):.0f} B, "
+          f"binario float64 {len(binary64[0])} B, float32 {len(binary32[0])} B")
+
+    report(f"json.loads + assemble_features ({args.batch})",
+           measure(lambda: decode_json(json_values), args.repeat), rows=args.batch)
+    report(f"binario float64 ({args.batch})",
+           measure(lambda: wire_format.decode_transactions(binary64), args.repeat), rows=args.batch)
+    report(f"binario float32 ({args.batch})",
+           measure(lambda: wire_format.decode_transactions(binary32), args.repeat), rows=args.batch)
+
+    predictions = process_transactions_batch(transactions, load_models())
+    report(f"json.dumps predicciones ({args.batch})",
+           measure(lambda: [json.dumps(p) for p in predictions], args.repeat), rows=args.batch)
+    report(f"encode_prediction ({args.batch})",
+           measure(lambda: [wire_format.encode_prediction(p) for p in predictions], args.repeat), rows=args.batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Utilidades compartidas por los benchmarks: generación de datos y medición de tiempos.
+"""
+
+import time
+
+import numpy as np
+
+from prediction import RAW_COLUMNS
+
+
+def random_transactions(n, seed=0):
+    """
+    Genera transacciones sintéticas con la forma que recibe la API.
+
+    Args:
+        n (int): Número de transacciones.
+        seed (int): Semilla del generador aleatorio.
+
+    Returns:
+        list[dict]: Transacciones con 'amount', 'time' y 'v1' a 'v28'.
+    """
+    rng = np.random.default_rng(seed)
+    raw = random_raw_matrix(n, rng)
+    return [dict(zip(RAW_COLUMNS, row.tolist())) for row in raw]
+
+
+def random_raw_matrix(n, rng=None):
+    """
+    Genera una matriz (n, 30) sin escalar en el orden de RAW_COLUMNS.
+
+    Args:
+        n (int): Número de filas.
+        rng (numpy.random.Generator, optional): Generador a usar.
+
+    Returns:
+        numpy.ndarray: Matriz float64 con 'amount', 'time' y 'v1' a 'v28'.
+    """
+    if rng is None:
+        rng = np.random.default_rng(0)
+    raw = rng.normal(0.0, 2.0, size=(n, len(RAW_COLUMNS)))
+    raw[:, 0] = rng.exponential(90.0, size=n)
+    raw[:, 1] = rng.uniform(0.0, 172792.0, size=n)
+    return raw
+
+
+def measure(fn, repeat, warmup=3):
+    """
+    Mide la latencia de `fn` llamándola `repeat` veces.
+
+    Args:
+        fn (callable): Función sin argumentos a medir.
+        repeat (int): Número de llamadas medidas.
+        warmup (int): Llamadas previas que no se miden.
+
+    Returns:
+        numpy.ndarray: Latencias en segundos de cada llamada.
+    """
+    for _ in range(warmup):
+        fn()
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - start
+    return timings
+
+
+def report(name, timings, rows=1):
+    """
+    Imprime p50, p99 y el rendimiento en filas por segundo de una medición.
+
+    Args:
+        name (str): Nombre del caso medido.
+        timings (numpy.ndarray): Latencias en segundos, una por llamada.
+        rows (int): Filas procesadas en cada llamada.
+    """
+    p50, p99 = np.percentile(timings, [50, 99])
+    rate = rows * len(timings) / timings.sum()
+    print(f"{name:<45} p50={p50 * 1e6:>10.1f}us  p99={p99 * 1e6:>10.1f}us  {rate:>14,.0f} filas/s")
@@ -5,10 +5,66 @@ load_dotenv()
 
 
 class Config:
+    # Modelos de predicción
+    MODEL_PATH = os.getenv("MODEL_PATH", "/app/model")
+    # Armado de la matriz de entrada: 'fast' (sin pandas) o 'pandas'
+    FEATURE_ASSEMBLER = os.getenv("FEATURE_ASSEMBLER", "fast")
+    # Tipo de la matriz de entrada: 'float64' o 'float32'
+    FEATURE_DTYPE = os.getenv("FEATURE_DTYPE", "float64")
+    # Motor del árbol de decisión: 'compiled' (arreglos planos de nodos, ver
+    # model_engines.py) o 'sklearn' (predict_proba del estimador)
+    TREE_ENGINE = os.getenv("TREE_ENGINE", "compiled")
+    # Motor de la regresión logística: 'compiled' (producto y sigmoide sin sklearn) o 'sklearn'
+    LOGISTIC_ENGINE = os.getenv("LOGISTIC_ENGINE", "compiled")
+    # Motor de k vecinos: 'compiled' (búsqueda exacta por bloques con BLAS), 'ivf'
+    # (aproximada con el índice de ann_index.py) o 'sklearn'.
+    # MB máximos de distancias por bloque e hilos para repartir los bloques
+    KNN_ENGINE = os.getenv("KNN_ENGINE", "compiled")
+    KNN_BLOCK_MB = float(os.getenv("KNN_BLOCK_MB", "16"))
+    KNN_THREADS = int(os.getenv("KNN_THREADS", str(min(4, os.cpu_count() or 1))))
+    # Directorio del índice IVF (si falta se construye al iniciar) y listas revisadas por
+    # consulta (más listas: más recall y latencia)
+    KNN_IVF_PATH = os.getenv("KNN_IVF_PATH", os.path.join(MODEL_PATH, "knn_ivf"))
+    KNN_IVF_NPROBE = int(os.getenv("KNN_IVF_NPROBE", "8"))
+    # Motor del SVC: 'compiled' (kernels por lotes con la sigmoide fusionada) o 'sklearn'.
+    # Fracción del mayor |dual_coef_| bajo la cual se descarta un vector de soporte (0: ninguno)
+    SVC_ENGINE = os.getenv("SVC_ENGINE", "compiled")
+    SVC_MIN_DUAL_COEF = float(os.getenv("SVC_MIN_DUAL_COEF", "0"))
+
+    # Micro-batching de solicitudes concurrentes a /predict
+    MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "true").lower() == "true"
+    MICROBATCH_MAX_BATCH_SIZE = int(os.getenv("MICROBATCH_MAX_BATCH_SIZE", "64"))
+    MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "2"))
+
+    # Pool de inferencia fuera del event loop ('thread' o 'process')
+    INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+    INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+    # Logging y diagnósticos por solicitud ('off', 'sampled' o 'full')
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    DIAGNOSTICS_MODE = os.getenv("DIAGNOSTICS_MODE", "off")
+    DIAGNOSTICS_SAMPLE_RATE = max(int(os.getenv("DIAGNOSTICS_SAMPLE_RATE", "100")), 1)
+
     # NeonDB PostgreSQL
     DATABASE_URL = os.getenv("DATABASE_URL")
+    # Pool de conexiones (tiempos en segundos)
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+    DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+    DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))
+    # Escritura diferida por lotes de las transacciones procesadas
+    DB_WRITE_BEHIND_ENABLED = os.getenv("DB_WRITE_BEHIND_ENABLED", "true").lower() == "true"
+    DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "500"))
+    DB_WRITE_FLUSH_INTERVAL_MS = float(os.getenv("DB_WRITE_FLUSH_INTERVAL_MS", "200"))
+    DB_WRITE_QUEUE_SIZE = int(os.getenv("DB_WRITE_QUEUE_SIZE", "10000"))
+    DB_WRITE_ENQUEUE_TIMEOUT = float(os.getenv("DB_WRITE_ENQUEUE_TIMEOUT", "1"))
 
     # Kafka Confluent Cloud
+    # Transporte: 'confluent' (broker real) o 'memory' (logs en memoria del proceso, para
+    # benchmarks y pruebas locales sin red; ver memory_kafka.py)
+    KAFKA_TRANSPORT = os.getenv("KAFKA_TRANSPORT", "confluent")
+    KAFKA_MEMORY_PARTITIONS = int(os.getenv("KAFKA_MEMORY_PARTITIONS", "4"))
     KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "pkc-921jm.us-east-2.aws.confluent.cloud:9092")
     KAFKA_SASL_MECHANISMS = os.getenv("KAFKA_SASL_MECHANISMS", "PLAIN")
     KAFKA_SECURITY_PROTOCOL = os.getenv("KAFKA_SECURITY_PROTOCOL", "SASL_SSL")
@@ -16,3 +72,51 @@ class Config:
     KAFKA_SASL_PASSWORD = os.getenv("KAFKA_SASL_PASSWORD")
     KAFKA_TOPIC_INPUT = os.getenv("KAFKA_TOPIC_INPUT", "transactions_stream")
     KAFKA_TOPIC_OUTPUT = os.getenv("KAFKA_TOPIC_OUTPUT", "fraud_predictions")
+    # Formato de las predicciones publicadas: 'json' o 'binary' (ver wire_format.py). Las
+    # transacciones de entrada se decodifican según su header content-type
+    KAFKA_OUTPUT_FORMAT = os.getenv("KAFKA_OUTPUT_FORMAT", "json")
+    # Mensajes que no se pueden decodificar o puntuar (vacío para solo descartarlos)
+    KAFKA_TOPIC_DLQ = os.getenv("KAFKA_TOPIC_DLQ", "transactions_dlq")
+    # Predicciones del re-procesamiento de rangos históricos (`python -m backfill`)
+    KAFKA_TOPIC_BACKFILL = os.getenv("KAFKA_TOPIC_BACKFILL", "fraud_predictions_backfill")
+    # Consumidor: con 'false' los offsets se confirman manualmente después de cada lote
+    KAFKA_ENABLE_AUTO_COMMIT = os.getenv("KAFKA_ENABLE_AUTO_COMMIT", "false").lower() == "true"
+    # Cada cuántos ms librdkafka entrega estadísticas del consumidor (lag por partición y
+    # tasa de consumo en /metrics y /health). 0 las desactiva
+    KAFKA_STATISTICS_INTERVAL_MS = int(os.getenv("KAFKA_STATISTICS_INTERVAL_MS", "5000"))
+    # Productor: agrupación y compresión de mensajes (tiempos en ms salvo que se indique)
+    KAFKA_PRODUCER_LINGER_MS = int(os.getenv("KAFKA_PRODUCER_LINGER_MS", "5"))
+    KAFKA_PRODUCER_BATCH_SIZE = int(os.getenv("KAFKA_PRODUCER_BATCH_SIZE", "131072"))
+    KAFKA_PRODUCER_COMPRESSION = os.getenv("KAFKA_PRODUCER_COMPRESSION", "lz4")
+    # Segundos que `send_to_topic` espera si el buffer local está lleno
+    KAFKA_PRODUCER_BLOCK_TIMEOUT = float(os.getenv("KAFKA_PRODUCER_BLOCK_TIMEOUT", "5"))
+    # Segundos que se espera la entrega de los mensajes pendientes al apagar
+    KAFKA_PRODUCER_FLUSH_TIMEOUT = float(os.getenv("KAFKA_PRODUCER_FLUSH_TIMEOUT", "10"))
+
+    # Procesamiento de transacciones desde Kafka por lotes
+    STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+    STREAM_POLL_MIN_TIMEOUT_MS = float(os.getenv("STREAM_POLL_MIN_TIMEOUT_MS", "50"))
+    STREAM_POLL_MAX_TIMEOUT_MS = float(os.getenv("STREAM_POLL_MAX_TIMEOUT_MS", "1000"))
+    # Workers en paralelo por lote: cada mensaje va al worker de su clave ('partition' o
+    # 'transaction_id'), lo que conserva el orden por clave. 'process' puntúa en procesos
+    STREAM_WORKERS = max(int(os.getenv("STREAM_WORKERS", "1")), 1)
+    STREAM_WORKER_KIND = os.getenv("STREAM_WORKER_KIND", "thread")
+    STREAM_PARTITION_KEY = os.getenv("STREAM_PARTITION_KEY", "partition")
+    # Puerto de /health y /metrics del worker independiente (`python -m worker`)
+    WORKER_HEALTH_PORT = int(os.getenv("WORKER_HEALTH_PORT", "8001"))
+    # Segundos mínimos entre dos registros de error de la misma clase
+    STREAM_ERROR_LOG_INTERVAL = float(os.getenv("STREAM_ERROR_LOG_INTERVAL", "10"))
+    # Confirmación de offsets: cada cuántos lotes procesados se hace un commit asíncrono
+    STREAM_COMMIT_EVERY_BATCHES = max(int(os.getenv("STREAM_COMMIT_EVERY_BATCHES", "1")), 1)
+    # Segundos que se espera la confirmación del broker de las predicciones de un lote
+    STREAM_DELIVERY_TIMEOUT = float(os.getenv("STREAM_DELIVERY_TIMEOUT", "30"))
+    # Espera antes de reintentar un lote que no se pudo almacenar o publicar; se duplica con
+    # cada fallo seguido hasta el máximo (los reintentos no se agotan)
+    STREAM_RETRY_BACKOFF_MS = float(os.getenv("STREAM_RETRY_BACKOFF_MS", "1000"))
+    STREAM_RETRY_MAX_BACKOFF_MS = float(os.getenv("STREAM_RETRY_MAX_BACKOFF_MS", "30000"))
+    # Backpressure: lotes máximos en la cola de cada etapa (puntuar, almacenar, publicar).
+    # Si una cola llega a STREAM_QUEUE_HIGH_WATER lotes se pausan las particiones
+    # asignadas, y se reanudan cuando todas bajan a STREAM_QUEUE_LOW_WATER
+    STREAM_STAGE_QUEUE_SIZE = max(int(os.getenv("STREAM_STAGE_QUEUE_SIZE", "4")), 1)
+    STREAM_QUEUE_HIGH_WATER = int(os.getenv("STREAM_QUEUE_HIGH_WATER", "3"))
+    STREAM_QUEUE_LOW_WATER = int(os.getenv("STREAM_QUEUE_LOW_WATER", "1"))
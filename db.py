@@ -1,13 +1,87 @@
 import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+import json
 import logging
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
 from config import Config
+from diagnostics import request_traced
 
 logger = logging.getLogger(__name__)
 
+_pool = None
+_pool_lock = threading.Lock()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+# Tabla de las transacciones procesadas en línea
+TRANSACTIONS_TABLE = 'transactions'
+
+# Definición de una tabla de transacciones (ver `init_transactions_table`)
+TRANSACTIONS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id SERIAL PRIMARY KEY,
+        transaction_id TEXT,
+        transaction_json JSONB,
+        logistic_regression_fraud REAL,
+        logistic_regression_non_fraud REAL,
+        kneighbors_fraud REAL,
+        kneighbors_non_fraud REAL,
+        svc_fraud REAL,
+        svc_non_fraud REAL,
+        decision_tree_fraud REAL,
+        decision_tree_non_fraud REAL
+    )
+"""
+
+TRANSACTIONS_DDL = TRANSACTIONS_TABLE_DDL.format(table=TRANSACTIONS_TABLE)
+
+# Nombres de tabla aceptados (se interpolan en el SQL)
+_TABLE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# Índice para buscar la transacción más reciente de un transaction_id sin recorrer la tabla
+TRANSACTION_ID_INDEX = "idx_transactions_transaction_id"
+
+# Nombre con el que se registra en 'schema_migrations' el llenado de 'transaction_id'
+TRANSACTION_ID_MIGRATION = "transactions_transaction_id_column"
+
+# Filas que actualiza cada lote del llenado de 'transaction_id'
+BACKFILL_BATCH_SIZE = 10000
+
+# Errores causados por el contenido de una fila: Postgres rechaza el valor (por ejemplo,
+# NaN o \u0000 en el JSON) o psycopg2 no puede adaptarlo (NUL en un texto). Los demás
+# (conexión, pool) afectan a todo el lote
+ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, ValueError, TypeError)
+
+# Columnas que se insertan por cada transacción, en el orden de `_transaction_row`
+INSERT_COLUMNS = """
+    transaction_id,
+    transaction_json,
+    logistic_regression_fraud, logistic_regression_non_fraud,
+    kneighbors_fraud, kneighbors_non_fraud,
+    svc_fraud, svc_non_fraud,
+    decision_tree_fraud, decision_tree_non_fraud
+"""
 
-def get_db_connection():
+
+def get_db_connection(dsn=None):
     """
-    Establece y retorna una conexión a la base de datos NeonDB (PostgreSQL).
+    Establece y retorna una conexión nueva a la base de datos NeonDB (PostgreSQL).
+
+    Las funciones de este módulo no la usan directamente: obtienen sus conexiones del
+    pool (ver `get_pool`), que llama a esta función cuando necesita abrir una.
+
+    Args:
+        dsn (str, optional): Cadena de conexión. Por defecto Config.DATABASE_URL.
 
     Returns:
         connection (psycopg2.extensions.connection): Conexión establecida a la base de datos.
@@ -16,20 +90,252 @@ def get_db_connection():
         Exception: Si ocurre algún error al conectar a la base de datos.
     """
     try:
-        conn = psycopg2.connect(Config.DATABASE_URL)
-        logger.info("Conectado a NeonDB (PostgreSQL).")
+        conn = psycopg2.connect(dsn or Config.DATABASE_URL)
+        logger.debug("Conectado a NeonDB (PostgreSQL).")
         return conn
     except Exception as e:
-        logger.error(f"Error conectando a NeonDB: {str(e)}")
+        logger.error("Error conectando a NeonDB: %s", e)
         raise
 
 
-def init_transactions_table():
+class ConnectionPool:
+    """
+    Pool de conexiones reutilizables a NeonDB (PostgreSQL).
+
+    Evita abrir una conexión nueva (TLS y autenticación) por cada operación:
+      - Mantiene al menos `min_size` conexiones abiertas y nunca más de `max_size`.
+      - Si todas están en uso, espera hasta `acquire_timeout` segundos por una libre.
+      - Antes de entregar una conexión inactiva por más de `health_check_after` segundos
+        verifica que siga viva con 'SELECT 1'.
+      - Descarta las conexiones rotas y recicla las que superan `max_lifetime` segundos.
+
+    Métricas:
+        db_pool_wait_seconds: Tiempo de espera para obtener una conexión.
+        db_pool_in_use, db_pool_size, db_pool_utilization: Uso actual del pool.
+        db_pool_discarded: Conexiones descartadas por rotas o por antigüedad.
+
+    Args:
+        dsn (str): Cadena de conexión. Por defecto Config.DATABASE_URL.
+        min_size (int): Conexiones que se abren al crear el pool.
+        max_size (int): Máximo de conexiones abiertas al mismo tiempo.
+        acquire_timeout (float): Segundos máximos de espera por una conexión.
+        max_lifetime (float): Antigüedad máxima de una conexión antes de reciclarla.
+        health_check_after (float): Inactividad tras la cual se verifica la conexión.
+    """
+
+    def __init__(self, dsn=None, min_size=None, max_size=None, acquire_timeout=None,
+                 max_lifetime=None, health_check_after=None):
+        self.dsn = dsn or Config.DATABASE_URL
+        self.max_size = max(max_size or Config.DB_POOL_MAX_SIZE, 1)
+        self.min_size = min(min_size if min_size is not None else Config.DB_POOL_MIN_SIZE, self.max_size)
+        self.acquire_timeout = acquire_timeout or Config.DB_POOL_ACQUIRE_TIMEOUT
+        self.max_lifetime = max_lifetime or Config.DB_POOL_MAX_LIFETIME
+        self.health_check_after = (health_check_after if health_check_after is not None
+                                   else Config.DB_POOL_HEALTH_CHECK_AFTER)
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle = deque()  # (conexión, creada_en, último_uso)
+        self._created = {}  # id(conexión) -> creada_en, para las conexiones en uso
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._wait = metrics.histogram('db_pool_wait_seconds')
+        self._discarded = metrics.counter('db_pool_discarded')
+        for _ in range(self.min_size):
+            self._idle.append((get_db_connection(self.dsn), time.monotonic(), time.monotonic()))
+        self._update_gauges()
+
+    def getconn(self):
+        """
+        Obtiene una conexión del pool, abriendo una nueva si no hay inactivas.
+
+        Returns:
+            connection (psycopg2.extensions.connection): Conexión lista para usar.
+
+        Raises:
+            psycopg2.pool.PoolError: Si no se libera ninguna conexión en `acquire_timeout`.
+            Exception: Si no se puede abrir una conexión nueva.
+        """
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._wait.observe(time.perf_counter() - start)
+            raise psycopg2.pool.PoolError(
+                f"No hay conexiones libres tras {self.acquire_timeout}s (max_size={self.max_size})"
+            )
+        try:
+            conn, created = self._take_healthy()
+        except Exception:
+            self._slots.release()
+            raise
+        self._wait.observe(time.perf_counter() - start)
+        with self._lock:
+            self._created[id(conn)] = created
+            self._in_use += 1
+        self._update_gauges()
+        return conn
+
+    def _take_healthy(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, created, last_used = self._idle.pop()
+            if conn.closed or now - created > self.max_lifetime:
+                self._discard(conn)
+                continue
+            if now - last_used > self.health_check_after and not self._is_alive(conn):
+                self._discard(conn)
+                continue
+            return conn, created
+        return get_db_connection(self.dsn), now
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        self._discarded.inc()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def putconn(self, conn, broken=False):
+        """
+        Devuelve una conexión al pool.
+
+        Args:
+            conn (psycopg2.extensions.connection): Conexión obtenida con `getconn`.
+            broken (bool): Si es True la conexión se cierra en lugar de reutilizarse.
+        """
+        with self._lock:
+            created = self._created.pop(id(conn), time.monotonic())
+            self._in_use -= 1
+        try:
+            if not broken and not conn.closed:
+                # Una transacción abierta o fallida no debe pasar al siguiente usuario
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, created, time.monotonic()))
+        except Exception:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+            self._update_gauges()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager que obtiene una conexión y la devuelve al salir.
+
+        Si ocurre un error de conexión (OperationalError o InterfaceError) la conexión
+        se descarta en lugar de volver al pool.
+
+        Yields:
+            connection (psycopg2.extensions.connection): Conexión del pool.
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def stats(self):
+        """
+        Retorna el estado actual del pool.
+
+        Returns:
+            dict: Conexiones en uso, inactivas, tamaño máximo, utilización y tiempo de espera.
+        """
+        with self._lock:
+            in_use, idle = self._in_use, len(self._idle)
+        return {
+            'in_use': in_use,
+            'idle': idle,
+            'max_size': self.max_size,
+            'utilization': in_use / self.max_size,
+            'wait_seconds': self._wait.snapshot(),
+            'discarded': self._discarded.value,
+        }
+
+    def _update_gauges(self):
+        with self._lock:
+            in_use, idle = self._in_use, len(self._idle)
+        metrics.gauge('db_pool_in_use').set(in_use)
+        metrics.gauge('db_pool_size').set(in_use + idle)
+        metrics.gauge('db_pool_utilization').set(in_use / self.max_size)
+
+    def close(self):
+        """
+        Cierra todas las conexiones inactivas del pool.
+        """
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._update_gauges()
+
+
+def get_pool():
+    """
+    Retorna el pool de conexiones global, creándolo en el primer uso.
+
+    Returns:
+        ConnectionPool: Pool compartido por todas las funciones de este módulo.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+                logger.info("Pool de conexiones a NeonDB creado (min=%d, max=%d).",
+                            _pool.min_size, _pool.max_size)
+    return _pool
+
+
+def close_pool():
+    """
+    Cierra el pool de conexiones global, si existe.
     """
-    Crea la tabla 'transactions' en NeonDB si no existe.
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def pool_stats():
+    """
+    Retorna las estadísticas del pool global, o None si aún no se ha creado.
+    """
+    pool = _pool
+    return pool.stats() if pool is not None else None
+
+
+def init_transactions_table(table=TRANSACTIONS_TABLE):
+    """
+    Crea la tabla 'transactions' (o `table`, con las mismas columnas) en NeonDB si no existe.
 
     La tabla contiene los siguientes campos:
         - id: Identificador único autoincrementable.
+        - transaction_id: Campo 'transaction_id' de la transacción, indexado para las búsquedas.
         - transaction_json: Datos de la transacción en formato JSONB.
         - logistic_regression_fraud: Probabilidad de fraude según regresión logística.
         - logistic_regression_non_fraud: Probabilidad de no fraude según regresión logística.
@@ -40,33 +346,119 @@ def init_transactions_table():
         - decision_tree_fraud: Probabilidad de fraude según árbol de decisión.
         - decision_tree_non_fraud: Probabilidad de no fraude según árbol de decisión.
 
+    En la tabla 'transactions' existente agrega y llena 'transaction_id' (ver
+    `migrate_transaction_id_column`).
+
     Registra en el log la creación o verificación de la tabla.
+
+    Args:
+        table (str): Nombre de la tabla (por ejemplo, la de un re-procesamiento histórico).
+    """
+    _check_table_name(table)
+    with get_pool().connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(TRANSACTIONS_TABLE_DDL.format(table=table))
+            conn.commit()
+            logger.info("Tabla '%s' creada o verificada en NeonDB.", table)
+            if table == TRANSACTIONS_TABLE:
+                migrate_transaction_id_column(conn)
+        except Exception as e:
+            conn.rollback()
+            logger.error("Error al crear la tabla en NeonDB: %s", e)
+        finally:
+            cursor.close()
+
+
+def migrate_transaction_id_column(conn, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Agrega y llena la columna indexada 'transaction_id' en tablas creadas antes de tenerla.
+
+    Pasos (idempotentes y reanudables):
+      1. Agrega la columna si no existe.
+      2. Llena 'transaction_id' desde transaction_json->>'transaction_id' recorriendo la
+         tabla por rangos de 'id', con un commit por lote para no bloquearla.
+      3. Crea el índice (transaction_id, id DESC) con CREATE INDEX CONCURRENTLY. Si un
+         intento anterior falló a medias y dejó el índice inválido, lo borra y lo rehace.
+      4. Registra la migración en 'schema_migrations' para no repetirla.
+
+    Un advisory lock evita que varias instancias la ejecuten a la vez.
+
+    Args:
+        conn (psycopg2.extensions.connection): Conexión sin transacción en curso.
+        batch_size (int): Filas de 'id' que cubre cada lote del llenado.
     """
-    conn = get_db_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id SERIAL PRIMARY KEY,
-                transaction_json JSONB,
-                logistic_regression_fraud REAL,
-                logistic_regression_non_fraud REAL,
-                kneighbors_fraud REAL,
-                kneighbors_non_fraud REAL,
-                svc_fraud REAL,
-                svc_non_fraud REAL,
-                decision_tree_fraud REAL,
-                decision_tree_non_fraud REAL
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name TEXT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
             )
         """)
+        cursor.execute("SELECT 1 FROM schema_migrations WHERE name = %s", (TRANSACTION_ID_MIGRATION,))
+        applied = cursor.fetchone() is not None
         conn.commit()
-        logger.info("Tabla 'transactions' creada o verificada en NeonDB.")
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error al crear la tabla en NeonDB: {str(e)}")
+        if applied:
+            return
+
+        cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", (TRANSACTION_ID_MIGRATION,))
+        try:
+            cursor.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS transaction_id TEXT")
+            cursor.execute("SELECT min(id), max(id) FROM transactions")
+            first_id, last_id = cursor.fetchone()
+            conn.commit()
+
+            updated = 0
+            if first_id is not None:
+                for start in range(first_id, last_id + 1, batch_size):
+                    cursor.execute("""
+                        UPDATE transactions
+                        SET transaction_id = transaction_json->>'transaction_id'
+                        WHERE id >= %s AND id < %s
+                          AND transaction_id IS NULL
+                          AND transaction_json ? 'transaction_id'
+                    """, (start, start + batch_size))
+                    updated += cursor.rowcount
+                    conn.commit()
+            logger.info("Columna 'transaction_id' llenada en %d filas.", updated)
+
+            # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción
+            conn.autocommit = True
+            try:
+                cursor.execute("""
+                    SELECT i.indisvalid
+                    FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = %s
+                """, (TRANSACTION_ID_INDEX,))
+                row = cursor.fetchone()
+                if row is not None and not row[0]:
+                    # Un CREATE INDEX CONCURRENTLY fallido deja el índice INVALID: existe, así
+                    # que IF NOT EXISTS no lo rehace, pero las consultas no lo usan
+                    logger.warning("Índice %s inválido; se vuelve a crear.", TRANSACTION_ID_INDEX)
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {TRANSACTION_ID_INDEX}")
+                cursor.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {TRANSACTION_ID_INDEX} "
+                    "ON transactions (transaction_id, id DESC)"
+                )
+            finally:
+                conn.autocommit = False
+
+            cursor.execute(
+                "INSERT INTO schema_migrations (name) VALUES (%s) ON CONFLICT DO NOTHING",
+                (TRANSACTION_ID_MIGRATION,)
+            )
+            conn.commit()
+            logger.info("Índice %s creado o verificado.", TRANSACTION_ID_INDEX)
+        finally:
+            # Si un paso falló la transacción quedó abortada y el unlock también fallaría,
+            # dejando el lock de sesión tomado
+            conn.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (TRANSACTION_ID_MIGRATION,))
+            conn.commit()
     finally:
         cursor.close()
-        conn.close()
 
 
 def store_transaction(transaction_json, predictions):
@@ -74,7 +466,7 @@ def store_transaction(transaction_json, predictions):
     Almacena una transacción y sus predicciones en la tabla 'transactions' de NeonDB.
 
     Args:
-        transaction_json (dict): Datos de la transacción en formato JSON.
+        transaction_json (str | dict): Datos de la transacción en formato JSON.
         predictions (dict): Diccionario con las predicciones de los modelos. Estructura esperada:
             {
                 'logistic': [valor_no_fraude, valor_fraude],
@@ -85,40 +477,293 @@ def store_transaction(transaction_json, predictions):
 
     Registra en el log el éxito o error al almacenar la transacción.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            INSERT INTO transactions (
-                transaction_json,
-                logistic_regression_fraud, logistic_regression_non_fraud,
-                kneighbors_fraud, kneighbors_non_fraud,
-                svc_fraud, svc_non_fraud,
-                decision_tree_fraud, decision_tree_non_fraud
+    with get_pool().connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                f"INSERT INTO transactions ({INSERT_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                _transaction_row(transaction_json, predictions)
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            transaction_json,
-            predictions['logistic'][1], predictions['logistic'][0],
-            predictions['kneighbors'][1], predictions['kneighbors'][0],
-            predictions['svc']['fraud'], predictions['svc']['non_fraud'],
-            predictions['tree'][1], predictions['tree'][0]
-        ))
-        conn.commit()
-        logger.info("Transacción almacenada en NeonDB.")
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error almacenando la transacción: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+            conn.commit()
+            if request_traced():
+                logger.info("Transacción almacenada en NeonDB.")
+        except Exception as e:
+            conn.rollback()
+            logger.error("Error almacenando la transacción: %s", e)
+        finally:
+            cursor.close()
+
+
+def store_transactions_batch(records, table=TRANSACTIONS_TABLE):
+    """
+    Almacena varias transacciones con un único INSERT multi-fila y un solo commit.
+
+    Args:
+        records (list[tuple]): Pares (transaction_json, predictions) con el mismo formato
+            que recibe `store_transaction`.
+        table (str): Tabla de destino, creada con `init_transactions_table`.
+
+    Raises:
+        Exception: Si falla la inserción; en ese caso no se almacena ninguna fila del lote.
+    """
+    if not records:
+        return
+    _check_table_name(table)
+    rows = [_transaction_row(transaction_json, predictions) for transaction_json, predictions in records]
+    with get_pool().connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                psycopg2.extras.execute_values(
+                    cursor,
+                    f"INSERT INTO {table} ({INSERT_COLUMNS}) VALUES %s",
+                    rows,
+                    page_size=len(rows)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+
+def store_transactions_isolating(records, table=TRANSACTIONS_TABLE):
+    """
+    Almacena varias transacciones como `store_transactions_batch`; si el lote se rechaza
+    por el contenido de alguna fila (ROW_ERRORS), lo divide en mitades hasta aislar las
+    filas rechazadas y almacena las demás.
+
+    Args:
+        records (list[tuple]): Pares (transaction_json, predictions).
+        table (str): Tabla de destino, creada con `init_transactions_table`.
+
+    Returns:
+        list[tuple]: (posición en `records`, excepción) de cada fila rechazada.
+
+    Raises:
+        Exception: Si falla por otra causa (por ejemplo, la conexión); las partes del lote
+            ya aisladas pueden haber quedado almacenadas.
+    """
+    return _store_isolating(records, table, 0)
+
+
+def _store_isolating(records, table, first):
+    if not records:
+        return []
+    try:
+        store_transactions_batch(records, table=table)
+        return []
+    except ROW_ERRORS as e:
+        if len(records) == 1:
+            return [(first, e)]
+    middle = len(records) // 2
+    return (_store_isolating(records[:middle], table, first)
+            + _store_isolating(records[middle:], table, first + middle))
+
+
+def _check_table_name(table):
+    if not _TABLE_NAME.match(table):
+        raise ValueError(f"Nombre de tabla inválido: {table!r}")
+
+
+def _transaction_row(transaction_json, predictions):
+    """
+    Convierte una transacción y sus predicciones en la tupla de valores de INSERT_COLUMNS.
+    """
+    if isinstance(transaction_json, str):
+        transaction_data = json.loads(transaction_json)
+    else:
+        transaction_data = transaction_json
+        transaction_json = json.dumps(transaction_data)
+    return (
+        _extract_transaction_id(transaction_data),
+        transaction_json,
+        predictions['logistic'][1], predictions['logistic'][0],
+        predictions['kneighbors'][1], predictions['kneighbors'][0],
+        predictions['svc']['fraud'], predictions['svc']['non_fraud'],
+        predictions['tree'][1], predictions['tree'][0]
+    )
+
+
+def _extract_transaction_id(transaction_data):
+    """
+    Obtiene 'transaction_id' con el mismo texto que produce transaction_json->>'transaction_id'.
+    """
+    if not isinstance(transaction_data, dict):
+        return None
+    transaction_id = transaction_data.get('transaction_id')
+    if transaction_id is None or isinstance(transaction_id, str):
+        return transaction_id
+    return json.dumps(transaction_id)
+
+
+class WriteBehindWriter:
+    """
+    Buffer de escritura diferida para las transacciones procesadas.
+
+    Las transacciones se encolan en memoria y un hilo en segundo plano las inserta en
+    lotes con `store_transactions_isolating`, cuando se acumulan `batch_size` filas o pasan
+    `flush_interval_ms` desde la primera fila pendiente. Así quien encola no espera el
+    viaje de ida y vuelta ni el commit de la base de datos. Si Postgres rechaza alguna
+    fila, solo esa fila se pierde; el resto del lote se almacena.
+
+    La cola está acotada a `max_queue` filas: si se llena, `submit` espera hasta
+    `enqueue_timeout` segundos y, si sigue llena, almacena la fila de forma síncrona.
+
+    Métricas:
+        db_write_batch_seconds: Latencia de cada inserción por lotes.
+        db_write_batch_size: Filas por lote.
+        db_write_behind_queue_depth: Filas pendientes en la cola.
+        db_write_behind_failed_rows: Filas que no se pudieron almacenar (las rechazadas por
+            Postgres, o el lote completo si falla la conexión).
+        db_write_behind_sync_fallbacks: Filas almacenadas de forma síncrona por cola llena.
+
+    Args:
+        batch_size (int): Máximo de filas por lote.
+        flush_interval_ms (float): Espera máxima de una fila antes de escribir su lote.
+        max_queue (int): Capacidad de la cola en memoria.
+        enqueue_timeout (float): Segundos que espera `submit` si la cola está llena.
+    """
+
+    _STOP = object()
+
+    def __init__(self, batch_size=None, flush_interval_ms=None, max_queue=None, enqueue_timeout=None):
+        self.batch_size = max(batch_size or Config.DB_WRITE_BATCH_SIZE, 1)
+        self.flush_interval = (flush_interval_ms or Config.DB_WRITE_FLUSH_INTERVAL_MS) / 1000.0
+        self.enqueue_timeout = enqueue_timeout if enqueue_timeout is not None else Config.DB_WRITE_ENQUEUE_TIMEOUT
+        self._queue = queue.Queue(maxsize=max_queue or Config.DB_WRITE_QUEUE_SIZE)
+        self._batch_seconds = metrics.histogram('db_write_batch_seconds')
+        self._batch_rows = metrics.histogram('db_write_batch_size')
+        self._queue_depth = metrics.gauge('db_write_behind_queue_depth')
+        self._failed_rows = metrics.counter('db_write_behind_failed_rows')
+        self._sync_fallbacks = metrics.counter('db_write_behind_sync_fallbacks')
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='db-write-behind', daemon=True)
+        self._thread.start()
+
+    def submit(self, transaction_json, predictions):
+        """
+        Encola una transacción para almacenarla en el próximo lote.
+
+        Args:
+            transaction_json (str | dict): Datos de la transacción. Si es un diccionario se
+                serializa a JSON en el hilo de escritura.
+            predictions (dict): Predicciones con el formato de `store_transaction`.
+        """
+        if self._stopping.is_set():
+            # El hilo de escritura ya puede haber terminado
+            store_transaction(transaction_json, predictions)
+            return
+        try:
+            self._queue.put((transaction_json, predictions), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._sync_fallbacks.inc()
+            store_transaction(transaction_json, predictions)
+
+    def close(self, timeout=None):
+        """
+        Escribe las filas pendientes y detiene el hilo de escritura.
+
+        Si la cola está llena no se espera a que haya lugar para la señal de fin: el hilo
+        termina cuando la vacía. Si no termina en `timeout` segundos se registra cuántas
+        filas quedaron sin almacenar.
+
+        Args:
+            timeout (float, optional): Segundos máximos de espera.
+        """
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(self._STOP)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error("El buffer de escritura diferida no terminó en %.1f s; %d transacciones "
+                         "en cola quedan sin almacenar.", timeout, self._queue.qsize())
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stopping or (self._stopping.is_set() and self._queue.empty()):
+                return
+
+    def _flush(self, batch):
+        self._queue_depth.set(self._queue.qsize())
+        start = time.perf_counter()
+        try:
+            rejected = store_transactions_isolating(batch)
+        except Exception as e:
+            self._failed_rows.inc(len(batch))
+            logger.error("Error almacenando lote de %d transacciones: %s", len(batch), e)
+        else:
+            if rejected:
+                self._failed_rows.inc(len(rejected))
+                logger.error("%d de %d transacciones rechazadas al almacenar el lote; la primera: %s",
+                             len(rejected), len(batch), rejected[0][1])
+        finally:
+            self._batch_seconds.observe(time.perf_counter() - start)
+            self._batch_rows.observe(len(batch))
+
+
+def get_writer():
+    """
+    Retorna el buffer de escritura diferida global, creándolo en el primer uso.
+
+    Returns:
+        WriteBehindWriter: Buffer compartido por la API y el consumidor de Kafka.
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteBehindWriter()
+    return _writer
+
+
+def enqueue_transaction(transaction_json, predictions):
+    """
+    Encola una transacción en el buffer de escritura diferida (ver `WriteBehindWriter`).
+
+    Args:
+        transaction_json (str | dict): Datos de la transacción.
+        predictions (dict): Predicciones con el formato de `store_transaction`.
+    """
+    get_writer().submit(transaction_json, predictions)
+
+
+def close_writer(timeout=None):
+    """
+    Escribe las transacciones pendientes y detiene el buffer global, si existe.
+
+    Args:
+        timeout (float, optional): Segundos máximos de espera.
+    """
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close(timeout)
 
 
 def get_transaction(transaction_id: str):
     """
     Obtiene la transacción más reciente que coincide con el ID de transacción.
 
-    Se busca en la columna 'transaction_json' filtrando por el campo 'transaction_id'.
+    Se busca en la columna indexada 'transaction_id' (ver `migrate_transaction_id_column`).
 
     Args:
         transaction_id (str): Identificador de la transacción a buscar.
@@ -136,37 +781,37 @@ def get_transaction(transaction_id: str):
             "tree": [valor_no_fraude, valor_fraude]
         }
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        query = """
-            SELECT 
-                transaction_json,
-                logistic_regression_fraud, logistic_regression_non_fraud,
-                kneighbors_fraud, kneighbors_non_fraud,
-                svc_fraud, svc_non_fraud,
-                decision_tree_fraud, decision_tree_non_fraud
-            FROM transactions
-            WHERE transaction_json->>'transaction_id' = %s
-            ORDER BY id DESC
-            LIMIT 1;
-        """
-        cursor.execute(query, (transaction_id,))
-        row = cursor.fetchone()
-        logger.info("Resultado de get_transaction para %s: %s", transaction_id, row)
-        if row is None:
+    with get_pool().connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = """
+                SELECT 
+                    transaction_json,
+                    logistic_regression_fraud, logistic_regression_non_fraud,
+                    kneighbors_fraud, kneighbors_non_fraud,
+                    svc_fraud, svc_non_fraud,
+                    decision_tree_fraud, decision_tree_non_fraud
+                FROM transactions
+                WHERE transaction_id = %s
+                ORDER BY id DESC
+                LIMIT 1;
+            """
+            cursor.execute(query, (transaction_id,))
+            row = cursor.fetchone()
+            if request_traced():
+                logger.info("Resultado de get_transaction para %s: %s", transaction_id, row)
+            if row is None:
+                return None
+            result = {
+                "transaction_json": row[0],
+                "logistic": [row[2], row[1]],  # [non_fraud, fraud]
+                "kneighbors": [row[4], row[3]],
+                "svc": {"non_fraud": row[6], "fraud": row[5]},
+                "tree": [row[8], row[7]]
+            }
+            return result
+        except Exception as e:
+            logger.error("Error al obtener la transacción: %s", e)
             return None
-        result = {
-            "transaction_json": row[0],
-            "logistic": [row[2], row[1]],  # [non_fraud, fraud]
-            "kneighbors": [row[4], row[3]],
-            "svc": {"non_fraud": row[6], "fraud": row[5]},
-            "tree": [row[8], row[7]]
-        }
-        return result
-    except Exception as e:
-        logger.error("Error al obtener la transacción: %s", str(e))
-        return None
-    finally:
-        cursor.close()
-        conn.close()
+        finally:
+            cursor.close()
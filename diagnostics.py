@@ -0,0 +1,192 @@
+"""
+Configuración de logging y diagnósticos compartida por la API, el procesamiento de
+predicciones, la base de datos y Kafka.
+
+Los registros se encolan con una QueueHandler y un QueueListener en segundo plano los
+formatea y escribe, de modo que el hilo que atiende la solicitud no construye el texto
+del mensaje ni espera la escritura.
+
+El detalle por solicitud (datos de entrada, DataFrames, predicciones) solo se registra
+según Config.DIAGNOSTICS_MODE:
+    - 'off': nunca (valor por defecto, sin construcción de cadenas por solicitud).
+    - 'sampled': 1 de cada Config.DIAGNOSTICS_SAMPLE_RATE solicitudes.
+    - 'full': todas las solicitudes.
+"""
+
+import atexit
+import contextvars
+import itertools
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+from config import Config
+
+DIAGNOSTICS_OFF = 'off'
+DIAGNOSTICS_SAMPLED = 'sampled'
+DIAGNOSTICS_FULL = 'full'
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+_listener = None
+_request_counter = itertools.count()
+_request_traced = contextvars.ContextVar('request_traced', default=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que deja el formateo del mensaje al QueueListener.
+
+    La implementación estándar de `prepare` formatea el registro en el hilo que loguea;
+    aquí solo se toma una instantánea de los argumentos (se evalúan los `lazy` y se copian
+    listas, diccionarios y conjuntos) para que el QueueListener no lea objetos que la
+    solicitud sigue modificando. Armar el texto del mensaje ocurre en segundo plano.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if isinstance(args, tuple):
+            record.args = tuple(_snapshot(arg) for arg in args)
+        elif isinstance(args, dict):
+            record.args = {key: _snapshot(value) for key, value in args.items()}
+        return record
+
+
+def _snapshot(value):
+    if isinstance(value, lazy):
+        return value.func(*value.args)
+    if isinstance(value, (list, dict, set)):
+        return value.copy()
+    return value
+
+
+def setup_logging():
+    """
+    Configura el logger raíz con el pipeline asíncrono basado en QueueHandler.
+
+    Es idempotente: llamadas posteriores no agregan handlers nuevos. El nivel se toma
+    de Config.LOG_LEVEL y el listener se detiene (vaciando la cola) al terminar el proceso.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.handlers = [_DeferredQueueHandler(log_queue)]
+    root.setLevel(Config.LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """
+    Detiene el QueueListener después de escribir los registros pendientes.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def begin_request():
+    """
+    Decide si la solicitud o mensaje actual se registra en detalle.
+
+    La decisión se guarda en una variable de contexto para que las funciones llamadas
+    durante la misma solicitud (predicción, base de datos, Kafka) la consulten con
+    `request_traced`.
+
+    Returns:
+        bool: True si la solicitud se registra en detalle.
+    """
+    mode = Config.DIAGNOSTICS_MODE
+    if mode == DIAGNOSTICS_FULL:
+        traced = True
+    elif mode == DIAGNOSTICS_SAMPLED:
+        traced = next(_request_counter) % Config.DIAGNOSTICS_SAMPLE_RATE == 0
+    else:
+        traced = False
+    _request_traced.set(traced)
+    return traced
+
+
+def request_traced():
+    """
+    Indica si la solicitud actual fue seleccionada por `begin_request`.
+
+    Returns:
+        bool: True si se debe registrar el detalle de la solicitud actual.
+    """
+    return _request_traced.get()
+
+
+class lazy:
+    """
+    Difiere el cálculo de un argumento de log hasta que el registro pasa el filtro de nivel.
+
+    Se evalúa en el hilo que loguea, antes de encolar el registro (ver
+    `_DeferredQueueHandler`), así que ve los datos tal como estaban al loguear; solo el
+    formateo del texto queda para el QueueListener.
+
+    Ejemplo:
+        logger.debug("Entrada: %s", lazy(df.to_string))
+
+    Args:
+        func (callable): Función que produce el valor a mostrar.
+        *args: Argumentos de `func`.
+    """
+
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+    __repr__ = __str__
+
+
+class ThrottledLog:
+    """
+    Limita los registros repetidos de una misma clase de error a uno por intervalo.
+
+    Evita que una ráfaga de mensajes inválidos se traduzca en una ráfaga de logs; el
+    siguiente registro informa cuántos se omitieron.
+
+    Args:
+        logger (logging.Logger): Logger donde se escriben los registros.
+        interval (float): Segundos mínimos entre dos registros de la misma clase.
+    """
+
+    def __init__(self, logger, interval):
+        self.logger = logger
+        self.interval = interval
+        self._state = {}  # clase -> (último registro, registros omitidos desde entonces)
+        self._lock = threading.Lock()
+
+    def error(self, key, msg, *args):
+        """
+        Registra `msg` con nivel ERROR salvo que `key` se haya registrado hace menos de
+        `interval` segundos.
+        """
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._state.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._state[key] = (last, suppressed + 1)
+                return
+            self._state[key] = (now, 0)
+        if suppressed:
+            msg += " (%d registros similares omitidos)"
+            args += (suppressed,)
+        self.logger.error(msg, *args)
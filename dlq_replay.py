@@ -0,0 +1,203 @@
+"""
+Reinyección de mensajes del tópico de mensajes fallidos (DLQ) en el tópico de entrada.
+
+Uso:
+    python -m dlq_replay [--error-class JSONDecodeError] [--stage decode] [--limit N]
+                         [--from-beginning] [--dry-run]
+
+Lee Config.KAFKA_TOPIC_DLQ por lotes con su propio grupo de consumidores, de modo que
+cada ejecución continúa donde terminó la anterior (`--from-beginning` vuelve a leer todo
+el tópico). Los mensajes se publican con la clave y el valor originales y sus headers
+sin los `dlq.*`, más `dlq.replay.count` para cortar ciclos: los mensajes que ya se
+reinyectaron `--max-replays` veces se omiten. Los offsets de cada lote se confirman
+después de que el broker confirma todas sus entregas. Termina al alcanzar `--limit` o
+cuando el tópico queda sin mensajes nuevos durante `--idle-timeout` segundos.
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from config import Config
+from diagnostics import setup_logging, shutdown_logging
+from kafka_client import (
+    BatchDeliveries, OFFSET_BEGINNING, TopicPartition, create_consumer, create_producer, flush_producer,
+    send_to_topic
+)
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Grupo de consumidores propio de la reinyección (independiente del procesamiento)
+REPLAY_GROUP = 'transactions-dlq-replay'
+
+# Prefijo de los headers agregados al enviar un mensaje al DLQ
+DLQ_HEADER_PREFIX = 'dlq.'
+REPLAY_COUNT_HEADER = 'dlq.replay.count'
+
+# Segundos entre dos registros de progreso
+PROGRESS_INTERVAL = 5.0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Reinyecta mensajes del DLQ en el tópico de entrada.")
+    parser.add_argument('--source', default=Config.KAFKA_TOPIC_DLQ, help="Tópico de mensajes fallidos.")
+    parser.add_argument('--target', default=Config.KAFKA_TOPIC_INPUT, help="Tópico de destino.")
+    parser.add_argument('--error-class', help="Solo mensajes con esta clase de error (dlq.error.class).")
+    parser.add_argument('--stage', help="Solo mensajes fallidos en esta etapa (decode o score).")
+    parser.add_argument('--limit', type=int, default=0, help="Máximo de mensajes a reinyectar (0: sin límite).")
+    parser.add_argument('--max-replays', type=int, default=3,
+                        help="Omite los mensajes ya reinyectados esta cantidad de veces.")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Mensajes por lote.")
+    parser.add_argument('--idle-timeout', type=float, default=5.0,
+                        help="Segundos sin mensajes nuevos tras los cuales se termina.")
+    parser.add_argument('--group', default=REPLAY_GROUP, help="Grupo de consumidores.")
+    parser.add_argument('--from-beginning', action='store_true', help="Lee el DLQ desde el inicio.")
+    parser.add_argument('--dry-run', action='store_true', help="Cuenta los mensajes sin publicarlos.")
+    return parser.parse_args(argv)
+
+
+def header_dict(headers):
+    """
+    Convierte los headers de un mensaje en un diccionario de cadenas.
+    """
+    result = {}
+    for name, value in headers or []:
+        result[name] = value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+    return result
+
+
+def replay_headers(headers, replay_count):
+    """
+    Headers originales del mensaje, sin los agregados por el DLQ, más el contador de
+    reinyecciones.
+    """
+    original = [(name, value) for name, value in headers or [] if not name.startswith(DLQ_HEADER_PREFIX)]
+    return original + [(REPLAY_COUNT_HEADER, str(replay_count))]
+
+
+def parse_replay_count(info):
+    """
+    Reinyecciones previas según el header `dlq.replay.count` (0 si no está), o None si
+    el header no es un entero no negativo.
+    """
+    try:
+        replay_count = int(info.get(REPLAY_COUNT_HEADER, 0))
+    except (TypeError, ValueError):
+        return None
+    return replay_count if replay_count >= 0 else None
+
+
+def selected(info, args):
+    if args.error_class and info.get('dlq.error.class') != args.error_class:
+        return False
+    if args.stage and info.get('dlq.error.stage') != args.stage:
+        return False
+    return True
+
+
+def replay(args):
+    """
+    Ejecuta la reinyección.
+
+    Returns:
+        dict: Mensajes leídos, reinyectados y omitidos.
+    """
+    consumer = create_consumer(args.source, group_id=args.group)
+    if consumer is None:
+        raise RuntimeError("No se pudo crear el consumidor del DLQ.")
+    if args.from_beginning:
+        first_assignment = True
+
+        def rewind(consumer, partitions):
+            # Solo la primera asignación: tras un rebalanceo se sigue desde lo confirmado
+            nonlocal first_assignment
+            if first_assignment:
+                first_assignment = False
+                for partition in partitions:
+                    partition.offset = OFFSET_BEGINNING
+            consumer.assign(partitions)
+        consumer.subscribe([args.source], on_assign=rewind)
+    producer = None if args.dry_run else create_producer()
+
+    stats = {'read': 0, 'replayed': 0, 'skipped': 0}
+    start = last_progress = last_message = time.monotonic()
+    try:
+        while not args.limit or stats['replayed'] < args.limit:
+            messages = consumer.consume(num_messages=args.batch_size, timeout=1.0)
+            now = time.monotonic()
+            if not messages:
+                if now - last_message >= args.idle_timeout:
+                    break
+                continue
+            last_message = now
+
+            deliveries = BatchDeliveries()
+            next_offsets = {}  # offsets a confirmar: solo hasta el último mensaje atendido
+            for msg in messages:
+                if msg.error():
+                    logger.error("Error en Kafka Consumer: %s", msg.error())
+                    continue
+                if args.limit and stats['replayed'] >= args.limit:
+                    break
+                next_offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+                stats['read'] += 1
+                info = header_dict(msg.headers())
+                replay_count = parse_replay_count(info)
+                if replay_count is None:
+                    logger.warning("Header %s inválido en %s[%d]@%d: %r; el mensaje se omite.",
+                                   REPLAY_COUNT_HEADER, msg.topic(), msg.partition(), msg.offset(),
+                                   info.get(REPLAY_COUNT_HEADER))
+                    stats['skipped'] += 1
+                    continue
+                if not selected(info, args) or replay_count >= args.max_replays:
+                    stats['skipped'] += 1
+                    continue
+                stats['replayed'] += 1
+                if producer is None:
+                    continue
+                deliveries.expect()
+                if not send_to_topic(producer, args.target, key=msg.key(), value=msg.value(),
+                                     headers=replay_headers(msg.headers(), replay_count + 1),
+                                     on_delivery=deliveries):
+                    deliveries.failed()
+
+            if not deliveries.wait(Config.STREAM_DELIVERY_TIMEOUT):
+                raise RuntimeError("No se confirmó la entrega de un lote reinyectado; offsets sin confirmar.")
+            if not args.dry_run and next_offsets:
+                consumer.commit(offsets=[TopicPartition(topic, partition, offset)
+                                         for (topic, partition), offset in next_offsets.items()],
+                                asynchronous=False)
+
+            if now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                logger.info("Leídos %d, reinyectados %d, omitidos %d (%.0f mensajes/s).",
+                            stats['read'], stats['replayed'], stats['skipped'],
+                            stats['read'] / max(now - start, 1e-9))
+    finally:
+        consumer.close()
+        if producer is not None:
+            flush_producer(producer)
+
+    elapsed = time.monotonic() - start
+    logger.info("Reinyección terminada en %.1f s: leídos %d, reinyectados %d, omitidos %d.",
+                elapsed, stats['read'], stats['replayed'], stats['skipped'])
+    return stats
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        replay(args)
+    except Exception as e:
+        logger.error("Error reinyectando mensajes: %s", e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    finally:
+        shutdown_logging()
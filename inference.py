@@ -0,0 +1,85 @@
+"""
+Ejecución de la inferencia fuera del event loop.
+
+Las llamadas a los modelos son intensivas en CPU; ejecutarlas dentro de un handler
+`async` bloquea todas las conexiones (incluido /health). Este módulo las delega a un
+pool dedicado con concurrencia acotada:
+    - 'thread': ThreadPoolExecutor. Adecuado porque NumPy/BLAS y sklearn liberan el GIL
+      durante la mayor parte del cálculo.
+    - 'process': ProcessPoolExecutor. Cada proceso carga sus propios modelos al iniciar.
+"""
+
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config import Config
+from prediction import load_models, process_transactions_batch
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+
+# Modelos de cada proceso del pool (solo en modo 'process')
+_worker_models = None
+
+
+def _init_process_worker():
+    global _worker_models
+    _worker_models = load_models()
+
+
+def _score_in_process(input_array):
+    return process_transactions_batch(input_array, _worker_models)
+
+
+class InferenceExecutor:
+    """
+    Pool dedicado para ejecutar `process_transactions_batch` fuera del event loop.
+
+    Args:
+        models (dict): Modelos cargados (usados en modo 'thread').
+        kind (str): 'thread' o 'process'. Por defecto Config.INFERENCE_EXECUTOR.
+        workers (int): Hilos o procesos del pool. Por defecto Config.INFERENCE_WORKERS.
+    """
+
+    def __init__(self, models, kind=None, workers=None):
+        self.models = models
+        self.kind = kind or Config.INFERENCE_EXECUTOR
+        self.workers = workers or Config.INFERENCE_WORKERS
+        if self.kind == EXECUTOR_PROCESS:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_process_worker)
+        elif self.kind == EXECUTOR_THREAD:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference')
+        else:
+            raise ValueError(f"INFERENCE_EXECUTOR desconocido: {self.kind}")
+        logger.info("Pool de inferencia '%s' con %d workers.", self.kind, self.workers)
+
+    async def score(self, input_array):
+        """
+        Ejecuta los modelos sobre una matriz ya escalada en el pool, sin bloquear el event loop.
+
+        Args:
+            input_array (numpy.ndarray): Matriz (N, 30) en el orden de EXPECTED_COLUMNS.
+
+        Returns:
+            list[dict]: Predicciones por fila, con la estructura de `process_transaction`.
+        """
+        loop = asyncio.get_running_loop()
+        if self.kind == EXECUTOR_PROCESS:
+            return await loop.run_in_executor(self._executor, _score_in_process, input_array)
+        # run_in_executor no copia las variables de contexto al hilo del pool: sin esto
+        # `diagnostics.request_traced` sería siempre False durante la inferencia
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, context.run, process_transactions_batch, input_array, self.models
+        )
+
+    def shutdown(self):
+        """
+        Espera las tareas en curso y libera el pool.
+        """
+        self._executor.shutdown(wait=True)
+
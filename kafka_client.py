@@ -1,16 +1,145 @@
-from confluent_kafka import Producer, Consumer, KafkaException
+from confluent_kafka import (
+    OFFSET_BEGINNING, TIMESTAMP_NOT_AVAILABLE, Producer, Consumer, KafkaException, TopicPartition
+)
+import json
 import logging
+import threading
+import time
+
+import metrics
 from config import Config
+from diagnostics import request_traced
 
 logger = logging.getLogger(__name__)
 
+# Hilo de poll de cada productor creado con `create_producer` (id(productor) -> hilo)
+_pollers = {}
+
+# Tiempo que espera cada poll del hilo de reportes de entrega
+POLL_INTERVAL = 0.1
+
+# Grupo de consumidores del procesamiento de transacciones
+CONSUMER_GROUP = 'transactions-group-1'
+
+# Transportes de Config.KAFKA_TRANSPORT
+TRANSPORT_CONFLUENT = 'confluent'
+TRANSPORT_MEMORY = 'memory'
+
+_produced = metrics.counter('kafka_produced')
+_delivered = metrics.counter('kafka_delivered')
+_delivery_errors = metrics.counter('kafka_delivery_errors')
+_delivery_latency = metrics.histogram('kafka_delivery_latency_seconds')
+_commit_errors = metrics.counter('kafka_commit_errors')
+_consumer_lag = metrics.gauge('kafka_consumer_lag')
+_consumer_lag_max = metrics.gauge('kafka_consumer_lag_max')
+_consumer_rate = metrics.gauge('kafka_consumer_messages_per_second')
+_consumer_byte_rate = metrics.gauge('kafka_consumer_bytes_per_second')
+
+# Última estadística del consumidor entregada por librdkafka (ver `consumer_stats`)
+_consumer_stats = {}
+_consumer_stats_lock = threading.Lock()
+
+
+class DeliveryPoller(threading.Thread):
+    """
+    Hilo que llama periódicamente a `producer.poll()` para atender los reportes de entrega.
+
+    Con él, `send_to_topic` no necesita esperar al broker: los callbacks de entrega se
+    ejecutan en este hilo.
+
+    Args:
+        producer (Producer): Productor cuyos eventos se atienden.
+    """
+
+    def __init__(self, producer):
+        super().__init__(name='kafka-delivery-poller', daemon=True)
+        self.producer = producer
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.producer.poll(POLL_INTERVAL)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class BatchDeliveries:
+    """
+    Cuenta las confirmaciones de entrega pendientes de los mensajes publicados de un lote.
+
+    Se pasa como `on_delivery` a `send_to_topic`.
+
+    Args:
+        expected (int): Mensajes publicados del lote.
+    """
+
+    def __init__(self, expected=0):
+        self._pending = expected
+        self._errors = 0
+        self._condition = threading.Condition()
+
+    def expect(self, count=1):
+        """
+        Suma mensajes cuya confirmación debe esperarse.
+        """
+        with self._condition:
+            self._pending += count
+
+    def __call__(self, err, msg):
+        with self._condition:
+            self._pending -= 1
+            if err is not None:
+                self._errors += 1
+            self._condition.notify_all()
+
+    def failed(self):
+        """
+        Registra un mensaje que no llegó al buffer del productor.
+        """
+        self(True, None)
+
+    def wait(self, timeout):
+        """
+        Espera las confirmaciones pendientes.
+
+        Args:
+            timeout (float): Segundos máximos de espera.
+
+        Returns:
+            bool: True si todos los mensajes fueron entregados sin error.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending <= 0, timeout)
+            return self._pending <= 0 and self._errors == 0
+
+
+def _transport():
+    """
+    Clases (productor, consumidor) del transporte de Config.KAFKA_TRANSPORT.
+
+    Ambos transportes reciben la misma configuración de librdkafka; el de memoria ignora
+    la que no le aplica.
+    """
+    if Config.KAFKA_TRANSPORT == TRANSPORT_CONFLUENT:
+        return Producer, Consumer
+    if Config.KAFKA_TRANSPORT == TRANSPORT_MEMORY:
+        # Importación diferida: solo se usa en benchmarks y pruebas locales
+        from memory_kafka import MemoryConsumer, MemoryProducer
+        return MemoryProducer, MemoryConsumer
+    raise ValueError(f"KAFKA_TRANSPORT desconocido: {Config.KAFKA_TRANSPORT}")
+
 
 def create_producer():
     """
     Crea y retorna un productor de Kafka.
 
     Configura el productor utilizando los parámetros definidos en Config y,
-    en caso de éxito, retorna una instancia de Producer.
+    en caso de éxito, retorna una instancia de Producer (o de `MemoryProducer` con
+    Config.KAFKA_TRANSPORT = 'memory'). Los mensajes se agrupan según
+    Config.KAFKA_PRODUCER_LINGER_MS, KAFKA_PRODUCER_BATCH_SIZE y KAFKA_PRODUCER_COMPRESSION,
+    y un `DeliveryPoller` atiende los reportes de entrega en segundo plano.
 
     Returns:
         Producer: Instancia de Producer configurada.
@@ -22,25 +151,39 @@ def create_producer():
         'sasl.mechanisms': Config.KAFKA_SASL_MECHANISMS,
         'sasl.username': Config.KAFKA_SASL_USERNAME,
         'sasl.password': Config.KAFKA_SASL_PASSWORD,
+        'linger.ms': Config.KAFKA_PRODUCER_LINGER_MS,
+        'batch.size': Config.KAFKA_PRODUCER_BATCH_SIZE,
+        'compression.type': Config.KAFKA_PRODUCER_COMPRESSION,
     }
     try:
-        producer = Producer(conf)
+        producer_class, _ = _transport()
+        producer = producer_class(conf)
+        poller = DeliveryPoller(producer)
+        poller.start()
+        _pollers[id(producer)] = poller
         logger.info("Kafka Producer creado.")
         return producer
     except Exception as e:
-        logger.error(f"Error creando Kafka Producer: {str(e)}")
+        logger.error("Error creando Kafka Producer: %s", e)
         return None
 
 
-def create_consumer(topic):
+def create_consumer(topic, group_id=None):
     """
     Crea y retorna un consumidor de Kafka suscrito a un tópico específico.
 
     Configura el consumidor utilizando los parámetros definidos en Config y
-    se suscribe al tópico proporcionado.
+    se suscribe al tópico proporcionado (un `MemoryConsumer` con
+    Config.KAFKA_TRANSPORT = 'memory'). Con Config.KAFKA_ENABLE_AUTO_COMMIT = False
+    (valor por defecto) los offsets no avanzan solos: quien consume debe confirmarlos
+    con `consumer.commit` después de procesar cada lote. El lag y la tasa de consumo se
+    obtienen de las estadísticas de librdkafka (ver `consumer_stats`).
 
     Args:
-        topic (str): Nombre del tópico al cual el consumidor se suscribirá.
+        topic (str): Nombre del tópico al cual el consumidor se suscribirá. Si es None no
+            se suscribe: quien consume asigna las particiones con `consumer.assign`, sin
+            unirse al grupo (por ejemplo, el re-procesamiento de `backfill`).
+        group_id (str, optional): Grupo de consumidores. Por defecto el de la aplicación.
 
     Returns:
         Consumer: Instancia de Consumer configurada y suscrita al tópico.
@@ -48,38 +191,194 @@ def create_consumer(topic):
     """
     conf = {
         'bootstrap.servers': Config.KAFKA_BOOTSTRAP_SERVERS,
-        'group.id': 'transactions-group-1',
+        'group.id': group_id or CONSUMER_GROUP,
         'auto.offset.reset': 'earliest',
         'security.protocol': Config.KAFKA_SECURITY_PROTOCOL,
         'sasl.mechanisms': Config.KAFKA_SASL_MECHANISMS,
         'sasl.username': Config.KAFKA_SASL_USERNAME,
         'sasl.password': Config.KAFKA_SASL_PASSWORD,
+        'enable.auto.commit': Config.KAFKA_ENABLE_AUTO_COMMIT,
+        'on_commit': _on_commit,
     }
+    if Config.KAFKA_STATISTICS_INTERVAL_MS > 0:
+        conf['statistics.interval.ms'] = Config.KAFKA_STATISTICS_INTERVAL_MS
+        conf['stats_cb'] = _on_consumer_stats
     try:
-        consumer = Consumer(conf)
-        consumer.subscribe([topic])
-        logger.info(f"Kafka Consumer suscrito al tópico {topic}.")
+        _, consumer_class = _transport()
+        consumer = consumer_class(conf)
+        if topic is not None:
+            consumer.subscribe([topic])
+            logger.info("Kafka Consumer suscrito al tópico %s.", topic)
         return consumer
     except Exception as e:
-        logger.error(f"Error creando Kafka Consumer: {str(e)}")
+        logger.error("Error creando Kafka Consumer: %s", e)
         return None
 
 
-def send_to_topic(producer, topic, key, value):
+def _on_commit(err, partitions):
+    """
+    Callback de resultado de los commits de offsets (incluidos los asíncronos).
+    """
+    if err is not None:
+        _commit_errors.inc()
+        logger.error("Error confirmando offsets en Kafka: %s", err)
+
+
+def _on_consumer_stats(stats_json):
+    """
+    Callback de estadísticas de librdkafka. Se ejecuta dentro de `consume` cada
+    Config.KAFKA_STATISTICS_INTERVAL_MS, así que el procesamiento de cada mensaje no paga
+    nada por estas métricas.
+
+    Calcula el lag de cada partición asignada (high watermark menos offset confirmado) y
+    la tasa de mensajes y bytes consumidos desde la estadística anterior.
+    """
+    try:
+        stats = json.loads(stats_json)
+    except ValueError as e:
+        logger.error("Estadísticas de Kafka inválidas: %s", e)
+        return
+    partitions = []
+    for topic, topic_stats in stats.get('topics', {}).items():
+        for partition, partition_stats in topic_stats.get('partitions', {}).items():
+            # La partición -1 agrupa los mensajes sin partición asignada
+            if int(partition) < 0 or not partition_stats.get('desired'):
+                continue
+            high = partition_stats.get('hi_offset', -1)
+            committed = partition_stats.get('committed_offset', -1)
+            # Sin offset confirmado todavía: el lag es todo lo que hay en la partición
+            low = committed if committed >= 0 else partition_stats.get('lo_offset', -1)
+            partitions.append({
+                'topic': topic,
+                'partition': int(partition),
+                'lag': high - low if high >= 0 and low >= 0 else None,
+                'high_watermark': high,
+                'committed_offset': committed,
+                'fetch_queue': partition_stats.get('fetchq_cnt', 0),
+            })
+
+    gauges = {f"kafka_consumer_lag_{p['topic']}_{p['partition']}": p['lag']
+              for p in partitions if p['lag'] is not None}
+    with _consumer_stats_lock:
+        previous = dict(_consumer_stats)
+        elapsed = (stats.get('ts', 0) - previous.get('ts', 0)) / 1e6  # 'ts' está en µs
+        if previous and elapsed > 0:
+            _consumer_rate.set((stats.get('rxmsgs', 0) - previous['rxmsgs']) / elapsed)
+            _consumer_byte_rate.set((stats.get('rxmsg_bytes', 0) - previous['rxmsg_bytes']) / elapsed)
+        _consumer_stats.update({
+            'ts': stats.get('ts', 0),
+            'rxmsgs': stats.get('rxmsgs', 0),
+            'rxmsg_bytes': stats.get('rxmsg_bytes', 0),
+            'updated': time.time(),
+            'partitions': partitions,
+            'gauges': set(gauges),
+        })
+    _consumer_lag.set(sum(gauges.values()))
+    _consumer_lag_max.set(max(gauges.values(), default=0))
+    for name, lag in gauges.items():
+        metrics.gauge(name).set(lag)
+    # Particiones que dejaron de estar asignadas
+    for name in previous.get('gauges', set()) - set(gauges):
+        metrics.unregister(name)
+
+
+def consumer_stats():
+    """
+    Retorna la última estadística del consumidor (para /health).
+
+    Returns:
+        dict | None: Lag total, tasa de consumo, antigüedad de la estadística en segundos
+            y detalle por partición asignada; None si todavía no hay estadísticas.
+    """
+    with _consumer_stats_lock:
+        if not _consumer_stats:
+            return None
+        partitions = list(_consumer_stats['partitions'])
+        updated = _consumer_stats['updated']
+    return {
+        'lag': _consumer_lag.value,
+        'lag_max': _consumer_lag_max.value,
+        'messages_per_second': _consumer_rate.value,
+        'bytes_per_second': _consumer_byte_rate.value,
+        'age_seconds': round(time.time() - updated, 3),
+        'partitions': partitions,
+    }
+
+
+def send_to_topic(producer, topic, key, value, headers=None, on_delivery=None):
     """
     Envía un mensaje a un tópico de Kafka utilizando el productor proporcionado.
 
+    El envío es asíncrono: el mensaje queda en el buffer del productor y el resultado
+    llega por el reporte de entrega, atendido por el `DeliveryPoller`. Si el buffer está
+    lleno, espera a que se libere espacio hasta Config.KAFKA_PRODUCER_BLOCK_TIMEOUT segundos.
+
     Args:
         producer (Producer): Instancia de Kafka Producer.
         topic (str): Nombre del tópico al cual se enviará el mensaje.
         key (str): Clave del mensaje.
         value (str): Valor o contenido del mensaje.
+        headers (dict | list, optional): Headers del mensaje.
+        on_delivery (callable, optional): Función (err, msg) llamada al confirmarse o
+            fallar la entrega.
 
-    Registra en el log el éxito o fallo del envío del mensaje.
+    Returns:
+        bool: True si el mensaje quedó en el buffer del productor. Si es False,
+            `on_delivery` no será llamada.
+
+    Registra en el log el fallo del envío del mensaje.
     """
+    sent_at = time.perf_counter()
+
+    def delivery_report(err, msg):
+        _delivery_latency.observe(time.perf_counter() - sent_at)
+        if err is not None:
+            _delivery_errors.inc()
+            logger.error("Error entregando mensaje al tópico %s: %s", topic, err)
+        else:
+            _delivered.inc()
+        if on_delivery is not None:
+            on_delivery(err, msg)
+
+    deadline = sent_at + Config.KAFKA_PRODUCER_BLOCK_TIMEOUT
     try:
-        producer.produce(topic, key=key, value=value)
-        producer.flush()
-        logger.info(f"Mensaje enviado al tópico {topic}.")
+        while True:
+            try:
+                producer.produce(topic, key=key, value=value, headers=headers, on_delivery=delivery_report)
+                break
+            except BufferError:
+                # Buffer local lleno: esperar a que se entreguen mensajes pendientes
+                if time.perf_counter() >= deadline:
+                    raise
+                producer.poll(POLL_INTERVAL)
+        _produced.inc()
+        if request_traced():
+            logger.info("Mensaje enviado al tópico %s.", topic)
+        return True
     except Exception as e:
-        logger.error(f"Error enviando mensaje al tópico {topic}: {str(e)}")
+        _delivery_errors.inc()
+        logger.error("Error enviando mensaje al tópico %s: %s", topic, e)
+        return False
+
+
+def flush_producer(producer, timeout=None):
+    """
+    Detiene el hilo de reportes y espera la entrega de los mensajes pendientes.
+
+    Debe llamarse una sola vez, al apagar la aplicación.
+
+    Args:
+        producer (Producer): Productor creado con `create_producer`.
+        timeout (float, optional): Segundos máximos de espera. Por defecto
+            Config.KAFKA_PRODUCER_FLUSH_TIMEOUT.
+
+    Returns:
+        int: Mensajes que quedaron sin entregar.
+    """
+    poller = _pollers.pop(id(producer), None)
+    if poller is not None:
+        poller.stop()
+    pending = producer.flush(Config.KAFKA_PRODUCER_FLUSH_TIMEOUT if timeout is None else timeout)
+    if pending:
+        logger.warning("%d mensajes de Kafka quedaron sin entregar al cerrar.", pending)
+    return pending
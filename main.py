@@ -8,30 +8,42 @@ import asyncio
 import json
 import logging
 import os
+import time
 
 from fastapi import FastAPI, BackgroundTasks, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict
 
+import metrics
+from batcher import MicroBatcher
+from inference import InferenceExecutor
+from diagnostics import begin_request, setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
 try:
-    from kafka_client import create_consumer, create_producer, send_to_topic
+    from kafka_client import consumer_stats, create_consumer, create_producer, flush_producer, send_to_topic
+    from stream_processor import StreamProcessor
     KAFKA_AVAILABLE = True
 except ImportError:
     KAFKA_AVAILABLE = False
     logger.warning("Kafka no disponible - funcionando sin Kafka")
 
 try:
-    from db import store_transaction, init_transactions_table, get_transaction
+    from db import (
+        store_transaction, enqueue_transaction, init_transactions_table, get_transaction,
+        close_pool, close_writer, pool_stats
+    )
     DB_AVAILABLE = True
 except ImportError:
     DB_AVAILABLE = False
     logger.warning("Base de datos no disponible - funcionando sin DB")
 
-from prediction import load_models, process_transaction
+from prediction import apply_scaling, assemble_features, load_models
 from config import Config
 
-logger = logging.getLogger(__name__)
 app = FastAPI(title="Fraud Detection API", description="API para detección de fraude en transacciones", version="1.0.0")
 
 # Configurar CORS para permitir conexiones desde Streamlit
@@ -88,66 +100,105 @@ if DB_AVAILABLE:
         init_transactions_table()
         logger.info("Base de datos inicializada correctamente")
     except Exception as e:
-        logger.warning(f"No se pudo conectar a la base de datos: {e}")
+        logger.warning("No se pudo conectar a la base de datos: %s", e)
         DB_AVAILABLE = False
 
 # Cargar modelos al iniciar la aplicación
 models = load_models()
 
-# Crear clientes Kafka (solo si está disponible)
+# Pool dedicado para la inferencia: el event loop solo coordina
+inference = InferenceExecutor(models)
+
+# Agrupa las solicitudes concurrentes a /predict en una sola llamada a los modelos
+batcher = MicroBatcher(
+    inference.score,
+    max_batch_size=Config.MICROBATCH_MAX_BATCH_SIZE,
+    max_wait_ms=Config.MICROBATCH_MAX_WAIT_MS,
+    max_in_flight=inference.workers,
+) if Config.MICROBATCH_ENABLED else None
+
+# Retraso del event loop: cada cuánto se mide y su histograma
+EVENT_LOOP_LAG_INTERVAL = 0.5
+event_loop_lag = metrics.histogram('event_loop_lag_seconds')
+
+# Crear el productor Kafka (solo si está disponible)
 if KAFKA_AVAILABLE:
     try:
         producer = create_producer()
-        consumer = create_consumer(Config.KAFKA_TOPIC_INPUT)
         logger.info("Kafka inicializado correctamente")
     except Exception as e:
-        logger.warning(f"No se pudo conectar a Kafka: {e}")
+        logger.warning("No se pudo conectar a Kafka: %s", e)
         KAFKA_AVAILABLE = False
         producer = None
-        consumer = None
 else:
     producer = None
-    consumer = None
 
+# Consumidor e hilo de procesamiento desde Kafka (se crean con /start-consuming). En
+# producción el consumo corre en el worker independiente (`python -m worker`); el
+# consumidor no se crea antes para no unirse al grupo sin consumir.
+consumer = None
+stream_processor = None
 
-async def consume_transactions():
+
+async def monitor_event_loop_lag():
     """
-    Consume transacciones de Kafka de manera continua.
+    Mide periódicamente cuánto se retrasa el event loop respecto a lo programado.
 
-    Esta función realiza un 'polling' en el consumidor de Kafka para obtener mensajes,
-    procesa cada transacción (aplicando los modelos de predicción), almacena el resultado
-    en NeonDB y envía las predicciones a un tópico de salida en Kafka.
+    Un retraso alto indica trabajo bloqueante ejecutándose dentro del loop.
     """
     while True:
-        msg = consumer.poll(timeout=1.0)
-        if msg is None:
-            await asyncio.sleep(1)
-            continue
+        start = time.perf_counter()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        event_loop_lag.observe(max(time.perf_counter() - start - EVENT_LOOP_LAG_INTERVAL, 0.0))
 
-        if msg.error():
-            logger.error(f"Error en Kafka Consumer: {msg.error()}")
-            print("Error en Kafka Consumer:", msg.error())
-            continue
 
-        try:
-            transaction_data = json.loads(msg.value().decode('utf-8'))
-            logger.info(f"Transacción recibida: {transaction_data}")
-            print("Transacción recibida:", transaction_data)
+@app.on_event("startup")
+async def start_batcher():
+    """
+    Inicia el despachador del micro-batcher y el monitor del event loop.
+    """
+    if batcher is not None:
+        batcher.start()
+    app.state.lag_monitor = asyncio.get_running_loop().create_task(monitor_event_loop_lag())
 
-            # Procesar la transacción (predecir, almacenar, etc.)
-            predictions = process_transaction(transaction_data, models)
-            store_transaction(json.dumps(transaction_data), predictions)
-            send_to_topic(
-                producer,
-                Config.KAFKA_TOPIC_OUTPUT,
-                key=transaction_data.get("transaction_id", ""),
-                value=json.dumps(predictions)
-            )
-        except Exception as e:
-            logger.error(f"Error procesando transacción: {str(e)}")
-            print("Error procesando transacción:", str(e))
 
-        await asyncio.sleep(0.1)
+@app.on_event("shutdown")
+async def stop_batcher():
+    """
+    Procesa las solicitudes pendientes, detiene el micro-batcher, libera el pool de
+    inferencia, entrega los mensajes pendientes de Kafka y cierra las conexiones a la
+    base de datos.
+    """
+    app.state.lag_monitor.cancel()
+    if batcher is not None:
+        await batcher.stop()
+    if stream_processor is not None:
+        await asyncio.to_thread(stream_processor.stop)
+    if consumer is not None:
+        consumer.close()
+    inference.shutdown()
+    if producer is not None:
+        flush_producer(producer)
+    if DB_AVAILABLE:
+        close_writer()
+        close_pool()
+
+
+def save_transaction(transaction_data, predictions):
+    """
+    Almacena una transacción procesada en la base de datos.
+
+    Con Config.DB_WRITE_BEHIND_ENABLED la fila se encola en el buffer de escritura
+    diferida, que la inserta por lotes; si no, se inserta de inmediato.
+
+    Args:
+        transaction_data (dict): Datos de la transacción.
+        predictions (dict): Predicciones generadas por `process_transaction`.
+    """
+    if Config.DB_WRITE_BEHIND_ENABLED:
+        enqueue_transaction(transaction_data, predictions)
+    else:
+        store_transaction(transaction_data, predictions)
 
 
 @app.get("/")
@@ -165,28 +216,70 @@ def root():
         "endpoints": {
             "health": "/health",
             "predict": "/predict",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
 
 
+def persist_and_publish(transaction_data, predictions):
+    """
+    Almacena la predicción en la base de datos y la publica en Kafka.
+
+    Se ejecuta como tarea en segundo plano después de responder, en el pool de hilos
+    de la aplicación, para que la E/S bloqueante no ocupe el event loop.
+
+    Args:
+        transaction_data (dict): Datos de la transacción.
+        predictions (dict): Predicciones generadas por `process_transaction`.
+    """
+    # Almacenar en DB solo si está disponible
+    if DB_AVAILABLE:
+        try:
+            save_transaction(transaction_data, predictions)
+        except Exception as e:
+            logger.warning("No se pudo almacenar en DB: %s", e)
+
+    # Enviar a Kafka solo si está disponible
+    if KAFKA_AVAILABLE and producer:
+        try:
+            send_to_topic(
+                producer,
+                Config.KAFKA_TOPIC_OUTPUT,
+                key=f"pred_{hash(str(transaction_data))}",
+                value=json.dumps(predictions)
+            )
+        except Exception as e:
+            logger.warning("No se pudo enviar a Kafka: %s", e)
+
+
 @app.post("/predict", response_model=PredictionResponse)
-async def predict_transaction(transaction: TransactionInput):
+async def predict_transaction(transaction: TransactionInput, background_tasks: BackgroundTasks):
     """
     Predice si una transacción es fraudulenta.
+
+    La inferencia se ejecuta en el pool de inferencia y el almacenamiento en DB y el
+    envío a Kafka en segundo plano, sin bloquear el event loop.
     
     Args:
         transaction (TransactionInput): Datos de la transacción a analizar
+        background_tasks (BackgroundTasks): Tareas en segundo plano de FastAPI.
         
     Returns:
         PredictionResponse: Resultado de la predicción con probabilidades por modelo
     """
+    begin_request()
     try:
         # Convertir a diccionario para el procesamiento
         transaction_data = transaction.dict()
         
-        # Procesar transacción con los modelos
-        predictions = process_transaction(transaction_data, models)
+        # Procesar transacción con los modelos; con micro-batching, la fila se agrupa
+        # con las de otras solicitudes concurrentes en una sola llamada a los modelos
+        input_array = apply_scaling(assemble_features([transaction_data]))
+        if batcher is not None:
+            predictions = await batcher.submit(input_array[0])
+        else:
+            predictions = (await inference.score(input_array))[0]
         
         # Determinar si es fraude (usando promedio de modelos como ejemplo)
         # Puedes ajustar esta lógica según tus necesidades
@@ -200,24 +293,7 @@ async def predict_transaction(transaction: TransactionInput):
         avg_fraud_prob = sum(fraud_probs) / len(fraud_probs)
         is_fraud = avg_fraud_prob > 0.5
         
-        # Almacenar en DB solo si está disponible
-        if DB_AVAILABLE:
-            try:
-                store_transaction(json.dumps(transaction_data), predictions)
-            except Exception as e:
-                logger.warning(f"No se pudo almacenar en DB: {e}")
-        
-        # Enviar a Kafka solo si está disponible
-        if KAFKA_AVAILABLE and producer:
-            try:
-                send_to_topic(
-                    producer,
-                    Config.KAFKA_TOPIC_OUTPUT,
-                    key=f"pred_{hash(str(transaction_data))}",
-                    value=json.dumps(predictions)
-                )
-            except Exception as e:
-                logger.warning(f"No se pudo enviar a Kafka: {e}")
+        background_tasks.add_task(persist_and_publish, transaction_data, predictions)
 
         return PredictionResponse(
             is_fraud=is_fraud,
@@ -226,25 +302,36 @@ async def predict_transaction(transaction: TransactionInput):
         )
         
     except Exception as e:
-        logger.error(f"Error en predicción: {str(e)}")
+        logger.error("Error en predicción: %s", e)
         raise HTTPException(status_code=500, detail=f"Error en el procesamiento: {str(e)}")
 
 
 @app.get("/start-consuming")
-async def start_consuming(background_tasks: BackgroundTasks):
+async def start_consuming():
     """
     Inicia el consumo de transacciones en segundo plano.
 
-    Esta ruta agrega la tarea asíncrona `consume_transactions` a las tareas en segundo
-    plano de FastAPI, permitiendo procesar las transacciones sin bloquear las demás rutas.
-
-    Args:
-        background_tasks (BackgroundTasks): Tareas en segundo plano de FastAPI.
+    El consumo se ejecuta en un hilo propio (`StreamProcessor`) que procesa los mensajes
+    por lotes sin bloquear el event loop. Si ya está en ejecución no se inicia otro.
+    Pensado para desarrollo: en producción el consumo corre en el worker independiente
+    (`python -m worker`), que se escala por separado de la API.
 
     Returns:
         dict: Mensaje de confirmación indicando que el consumo ha comenzado.
+
+    Raises:
+        HTTPException: Si Kafka no está disponible.
     """
-    background_tasks.add_task(consume_transactions)
+    global consumer, stream_processor
+    if not KAFKA_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Kafka no disponible.")
+    if consumer is None:
+        consumer = create_consumer(Config.KAFKA_TOPIC_INPUT)
+        if consumer is None:
+            raise HTTPException(status_code=503, detail="Kafka no disponible.")
+    if stream_processor is None or not stream_processor.is_alive():
+        stream_processor = StreamProcessor(consumer, producer, models, persist=DB_AVAILABLE)
+        stream_processor.start()
     return {"message": "Consumiendo transacciones en segundo plano."}
 
 
@@ -262,11 +349,24 @@ def health():
         "models_loaded": len(models) > 0,
         "models_count": len(models),
         "kafka_available": KAFKA_AVAILABLE,
+        "kafka_consumer": consumer_stats() if KAFKA_AVAILABLE else None,
         "db_available": DB_AVAILABLE,
+        "db_pool": pool_stats() if DB_AVAILABLE else None,
         "environment": os.getenv("ENVIRONMENT", "unknown")
     }
 
 
+@app.get("/metrics")
+def get_metrics():
+    """
+    Expone las métricas internas de la aplicación.
+
+    Returns:
+        dict: Valor actual de cada métrica (ver módulo `metrics`).
+    """
+    return metrics.snapshot()
+
+
 @app.get("/transaction/{transaction_id}")
 def get_transaction_result(transaction_id: str):
     """
@@ -0,0 +1,555 @@
+"""
+Kafka en memoria para benchmarks y pruebas locales, sin broker ni red.
+
+Se selecciona con Config.KAFKA_TRANSPORT = 'memory': `create_producer` y
+`create_consumer` retornan entonces un `MemoryProducer` y un `MemoryConsumer` con la
+parte de la interfaz de confluent_kafka que usa la aplicación. Todos comparten el
+`MemoryBroker` del proceso (`get_broker`):
+    - Tópicos de Config.KAFKA_MEMORY_PARTITIONS particiones, creados al usarlos; cada
+      partición es un log con offsets consecutivos desde 0.
+    - Particionado por CRC32 de la clave, como el particionador por defecto de
+      librdkafka; los mensajes sin clave se reparten en round-robin.
+    - Grupos de consumidores con offsets confirmados y reparto de particiones por rangos
+      entre los miembros suscritos (protocolo eager: en cada rebalanceo se revocan todas
+      las particiones y se asigna el reparto nuevo).
+    - Callbacks de rebalanceo, de commit y de estadísticas (`stats_cb`) ejecutados dentro
+      de `consume`/`poll`, y reportes de entrega dentro de `producer.poll`/`flush`, como en
+      librdkafka.
+
+Las entregas son inmediatas y no hay hilos propios, así que las mediciones reflejan el
+costo del pipeline y no el de la red. El broker vive en la memoria del proceso: los
+workers 'process' del `StreamProcessor` no lo comparten.
+"""
+
+import bisect
+import itertools
+import json
+import threading
+import time
+import zlib
+from collections import deque
+from types import SimpleNamespace
+
+from confluent_kafka import (
+    OFFSET_BEGINNING, OFFSET_END, OFFSET_INVALID, TIMESTAMP_CREATE_TIME, TopicPartition
+)
+
+from config import Config
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Retorna el broker en memoria del proceso, creándolo si no existe.
+    """
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = MemoryBroker()
+        return _broker
+
+
+def reset_broker(partitions=None):
+    """
+    Reemplaza el broker del proceso por uno vacío (entre corridas de un benchmark).
+
+    Args:
+        partitions (int, optional): Particiones de los tópicos nuevos. Por defecto
+            Config.KAFKA_MEMORY_PARTITIONS.
+
+    Returns:
+        MemoryBroker: Broker nuevo.
+    """
+    global _broker
+    with _broker_lock:
+        _broker = MemoryBroker(partitions)
+        return _broker
+
+
+class MemoryMessage:
+    """
+    Mensaje de un log en memoria, con la interfaz de `confluent_kafka.Message`.
+    """
+
+    __slots__ = ('_topic', '_partition', '_offset', '_key', '_value', '_headers', '_timestamp')
+
+    def __init__(self, topic, partition, offset, key, value, headers, timestamp):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._headers = headers
+        self._timestamp = timestamp
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return self._headers
+
+    def timestamp(self):
+        return TIMESTAMP_CREATE_TIME, self._timestamp
+
+    def error(self):
+        return None
+
+    def __len__(self):
+        return len(self._value) if self._value is not None else 0
+
+
+class MemoryBroker:
+    """
+    Logs particionados, offsets confirmados y miembros de los grupos de consumidores.
+
+    Args:
+        partitions (int): Particiones de cada tópico nuevo. Por defecto
+            Config.KAFKA_MEMORY_PARTITIONS.
+    """
+
+    def __init__(self, partitions=None):
+        self.default_partitions = partitions or Config.KAFKA_MEMORY_PARTITIONS
+        self._logs = {}  # tópico -> lista de particiones (lista de mensajes)
+        self._timestamps = {}  # tópico -> lista de particiones (timestamps de sus mensajes)
+        self._committed = {}  # grupo -> {(tópico, partición): offset}
+        self._members = {}  # grupo -> {consumidor: tópicos suscritos}
+        self._owners = {}  # (grupo, tópico, partición) -> consumidor que la está leyendo
+        self._lock = threading.RLock()
+        self._appended = threading.Condition(self._lock)
+
+    def create_topic(self, topic, partitions=None):
+        """
+        Crea un tópico si no existe.
+
+        Returns:
+            int: Particiones del tópico.
+        """
+        with self._lock:
+            if topic not in self._logs:
+                count = partitions or self.default_partitions
+                self._logs[topic] = [[] for _ in range(count)]
+                self._timestamps[topic] = [[] for _ in range(count)]
+            return len(self._logs[topic])
+
+    def topics(self):
+        with self._lock:
+            return {topic: len(partitions) for topic, partitions in self._logs.items()}
+
+    def append(self, topic, partition, key, value, headers):
+        with self._appended:
+            self.create_topic(topic)
+            log = self._logs[topic][partition]
+            timestamps = self._timestamps[topic][partition]
+            timestamp = max(int(time.time() * 1000), timestamps[-1] if timestamps else 0)
+            msg = MemoryMessage(topic, partition, len(log), key, value, headers, timestamp)
+            log.append(msg)
+            timestamps.append(timestamp)
+            self._appended.notify_all()
+            return msg
+
+    def read(self, topic, partition, offset, max_count):
+        with self._lock:
+            return self._logs[topic][partition][offset:offset + max_count]
+
+    def messages(self, topic):
+        """
+        Todos los mensajes de un tópico, partición por partición.
+        """
+        with self._lock:
+            return [msg for log in self._logs.get(topic, []) for msg in log]
+
+    def watermarks(self, topic, partition):
+        with self._lock:
+            self.create_topic(topic)
+            return 0, len(self._logs[topic][partition])
+
+    def offset_for_time(self, topic, partition, timestamp):
+        with self._lock:
+            self.create_topic(topic)
+            timestamps = self._timestamps[topic][partition]
+            index = bisect.bisect_left(timestamps, timestamp)
+            return index if index < len(timestamps) else -1
+
+    def wait_for_messages(self, timeout):
+        with self._appended:
+            self._appended.wait(timeout)
+
+    def commit(self, group, offsets):
+        with self._lock:
+            committed = self._committed.setdefault(group, {})
+            for tp in offsets:
+                committed[(tp.topic, tp.partition)] = tp.offset
+
+    def committed(self, group, topic, partition):
+        with self._lock:
+            return self._committed.get(group, {}).get((topic, partition))
+
+    def claim(self, group, topic, partition, consumer):
+        """
+        Toma una partición asignada por un rebalanceo. Falla mientras el dueño anterior no
+        la haya liberado (y confirmado sus offsets), como la barrera de un rebalanceo real.
+
+        Returns:
+            bool: True si la partición es de `consumer`.
+        """
+        with self._lock:
+            owner = self._owners.setdefault((group, topic, partition), consumer)
+            return owner is consumer
+
+    def release(self, group, consumer):
+        with self._lock:
+            for key in [key for key, owner in self._owners.items() if key[0] == group and owner is consumer]:
+                del self._owners[key]
+            # Despierta a los consumidores que esperan las particiones liberadas
+            self._appended.notify_all()
+
+    def join(self, group, consumer, topics):
+        with self._lock:
+            for topic in topics:
+                self.create_topic(topic)
+            self._members.setdefault(group, {})[consumer] = list(topics)
+            self._rebalance(group)
+
+    def leave(self, group, consumer):
+        with self._lock:
+            members = self._members.get(group, {})
+            if members.pop(consumer, None) is not None:
+                self._rebalance(group)
+
+    def _rebalance(self, group):
+        """
+        Reparte por rangos las particiones de cada tópico entre los miembros suscritos a
+        él; cada miembro aplica su parte en su próximo `consume`.
+        """
+        members = self._members.get(group, {})
+        targets = {consumer: [] for consumer in members}
+        for topic in sorted({topic for topics in members.values() for topic in topics}):
+            subscribed = [consumer for consumer in members if topic in members[consumer]]
+            count = len(self._logs[topic])
+            for index, consumer in enumerate(subscribed):
+                start = index * count // len(subscribed)
+                end = (index + 1) * count // len(subscribed)
+                targets[consumer].extend((topic, partition) for partition in range(start, end))
+        for consumer, target in targets.items():
+            consumer._set_target(target)
+        self._appended.notify_all()
+
+
+class MemoryProducer:
+    """
+    Productor en memoria con la interfaz de `confluent_kafka.Producer`.
+
+    Args:
+        conf (dict): Configuración de librdkafka (se ignora).
+        broker (MemoryBroker, optional): Broker de destino. Por defecto el del proceso.
+    """
+
+    def __init__(self, conf=None, broker=None):
+        self._broker = broker or get_broker()
+        self._reports = deque()  # (callback, mensaje) pendientes de atender en `poll`
+        self._pending = threading.Condition()
+        self._round_robin = itertools.count()
+
+    def produce(self, topic, value=None, key=None, partition=-1, on_delivery=None, callback=None,
+                timestamp=0, headers=None):
+        count = self._broker.create_topic(topic)
+        key = _to_bytes(key)
+        if partition < 0:
+            partition = zlib.crc32(key) % count if key is not None else next(self._round_robin) % count
+        msg = self._broker.append(topic, partition, key, _to_bytes(value), _normalize_headers(headers))
+        on_delivery = on_delivery or callback
+        if on_delivery is not None:
+            with self._pending:
+                self._reports.append((on_delivery, msg))
+                self._pending.notify_all()
+
+    def poll(self, timeout=None):
+        """
+        Ejecuta los reportes de entrega pendientes, esperando hasta `timeout` segundos si
+        no hay ninguno.
+
+        Returns:
+            int: Reportes atendidos.
+        """
+        with self._pending:
+            if not self._reports and timeout:
+                self._pending.wait(None if timeout < 0 else timeout)
+            reports = list(self._reports)
+            self._reports.clear()
+        for on_delivery, msg in reports:
+            on_delivery(None, msg)
+        return len(reports)
+
+    def flush(self, timeout=None):
+        self.poll(0)
+        return 0
+
+    def list_topics(self, topic=None, timeout=-1):
+        return _cluster_metadata(self._broker, topic)
+
+    def __len__(self):
+        with self._pending:
+            return len(self._reports)
+
+
+class MemoryConsumer:
+    """
+    Consumidor en memoria con la interfaz de `confluent_kafka.Consumer`.
+
+    Usa de la configuración 'group.id', 'auto.offset.reset', 'enable.auto.commit',
+    'on_commit', 'stats_cb' y 'statistics.interval.ms'.
+
+    Args:
+        conf (dict): Configuración de librdkafka.
+        broker (MemoryBroker, optional): Broker de origen. Por defecto el del proceso.
+    """
+
+    def __init__(self, conf, broker=None):
+        self._broker = broker or get_broker()
+        self.group_id = conf.get('group.id')
+        self._reset = conf.get('auto.offset.reset', 'latest')
+        self._auto_commit = conf.get('enable.auto.commit', True)
+        self._on_commit = conf.get('on_commit')
+        self._stats_cb = conf.get('stats_cb')
+        self._stats_interval = conf.get('statistics.interval.ms', 0) / 1000.0
+        self._next_stats = time.monotonic() + self._stats_interval
+        self._callbacks = {}
+        self._subscribed = False
+        self._assignment = {}  # (tópico, partición) -> posición (None: sin resolver)
+        self._paused = set()
+        self._target = None  # reparto pendiente de aplicar tras un rebalanceo
+        self._target_lock = threading.Lock()
+        self._commit_results = deque()  # particiones confirmadas, para `on_commit`
+        self._assigned_in_callback = False
+        self._rx_msgs = 0
+        self._rx_bytes = 0
+        self._closed = False
+
+    def subscribe(self, topics, on_assign=None, on_revoke=None, on_lost=None):
+        self._callbacks = {'assign': on_assign, 'revoke': on_revoke, 'lost': on_lost}
+        self._subscribed = True
+        self._broker.join(self.group_id, self, topics)
+
+    def unsubscribe(self):
+        if self._subscribed:
+            self._broker.leave(self.group_id, self)
+            self._subscribed = False
+            self._serve()
+
+    def assign(self, partitions):
+        # None: la posición se resuelve con el offset confirmado o 'auto.offset.reset'
+        self._assignment = {
+            (tp.topic, tp.partition): tp.offset if tp.offset >= 0 or tp.offset in (OFFSET_BEGINNING, OFFSET_END)
+            else None
+            for tp in partitions
+        }
+        self._paused &= set(self._assignment)
+        self._assigned_in_callback = True
+
+    def unassign(self):
+        self._assignment = {}
+        self._paused = set()
+
+    def assignment(self):
+        return [TopicPartition(topic, partition) for topic, partition in self._assignment]
+
+    def pause(self, partitions):
+        self._paused |= {(tp.topic, tp.partition) for tp in partitions} & set(self._assignment)
+
+    def resume(self, partitions):
+        self._paused -= {(tp.topic, tp.partition) for tp in partitions}
+
+    def seek(self, partition):
+        key = (partition.topic, partition.partition)
+        if key not in self._assignment:
+            raise ValueError(f"Partición no asignada: {partition.topic}[{partition.partition}]")
+        self._assignment[key] = partition.offset
+
+    def position(self, partitions):
+        return [TopicPartition(tp.topic, tp.partition, self._position(tp.topic, tp.partition))
+                for tp in partitions]
+
+    def committed(self, partitions, timeout=None):
+        result = []
+        for tp in partitions:
+            offset = self._broker.committed(self.group_id, tp.topic, tp.partition)
+            result.append(TopicPartition(tp.topic, tp.partition, OFFSET_INVALID if offset is None else offset))
+        return result
+
+    def commit(self, message=None, offsets=None, asynchronous=True):
+        if message is not None:
+            offsets = [TopicPartition(message.topic(), message.partition(), message.offset() + 1)]
+        elif offsets is None:
+            offsets = [TopicPartition(topic, partition, position)
+                       for (topic, partition), position in self._assignment.items() if position is not None]
+        self._broker.commit(self.group_id, offsets)
+        if self._on_commit is not None:
+            self._commit_results.append(offsets)
+        return None if asynchronous else offsets
+
+    def consume(self, num_messages=1, timeout=-1):
+        """
+        Retorna hasta `num_messages` mensajes de las particiones asignadas y no pausadas,
+        esperando hasta `timeout` segundos (-1: sin límite) si no hay ninguno.
+        """
+        deadline = None if timeout is None or timeout < 0 else time.monotonic() + timeout
+        while True:
+            self._serve()
+            messages = self._fetch(num_messages)
+            if messages:
+                return messages
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return []
+            self._broker.wait_for_messages(remaining if remaining is not None else 0.1)
+
+    def poll(self, timeout=None):
+        messages = self.consume(1, -1 if timeout is None else timeout)
+        return messages[0] if messages else None
+
+    def list_topics(self, topic=None, timeout=-1):
+        return _cluster_metadata(self._broker, topic)
+
+    def get_watermark_offsets(self, partition, timeout=None, cached=False):
+        return self._broker.watermarks(partition.topic, partition.partition)
+
+    def offsets_for_times(self, partitions, timeout=None):
+        return [TopicPartition(tp.topic, tp.partition, self._broker.offset_for_time(tp.topic, tp.partition, tp.offset))
+                for tp in partitions]
+
+    def close(self):
+        if self._closed:
+            return
+        if self._subscribed:
+            self._revoke_all()
+            self._broker.leave(self.group_id, self)
+        if self._auto_commit and self.group_id:
+            self.commit(asynchronous=False)
+        self._assignment = {}
+        self._closed = True
+
+    def _set_target(self, target):
+        with self._target_lock:
+            self._target = target
+
+    def _serve(self):
+        """
+        Aplica el rebalanceo pendiente y ejecuta los callbacks de commit y estadísticas.
+        """
+        with self._target_lock:
+            target, self._target = self._target, None
+        if target is not None:
+            self._revoke_all()
+            partitions = [TopicPartition(topic, partition, OFFSET_INVALID) for topic, partition in target]
+            self._assigned_in_callback = False
+            if self._callbacks.get('assign') is not None:
+                self._callbacks['assign'](self, partitions)
+            if not self._assigned_in_callback:
+                self.assign(partitions)
+        while self._commit_results:
+            self._on_commit(None, self._commit_results.popleft())
+        if self._stats_cb is not None and self._stats_interval > 0 and time.monotonic() >= self._next_stats:
+            self._next_stats = time.monotonic() + self._stats_interval
+            self._stats_cb(json.dumps(self._stats()))
+
+    def _revoke_all(self):
+        if not self._assignment:
+            return
+        if self._callbacks.get('revoke') is not None:
+            self._callbacks['revoke'](self, self.assignment())
+        if self._auto_commit and self.group_id:
+            self.commit(asynchronous=False)
+        self.unassign()
+        self._broker.release(self.group_id, self)
+
+    def _position(self, topic, partition):
+        position = self._assignment.get((topic, partition))
+        if position is None or position < 0:
+            low, high = self._broker.watermarks(topic, partition)
+            committed = self._broker.committed(self.group_id, topic, partition) if position is None else None
+            if committed is not None:
+                position = committed
+            elif position == OFFSET_BEGINNING or (position is None and self._reset in ('earliest', 'smallest')):
+                position = low
+            else:
+                position = high
+            self._assignment[(topic, partition)] = position
+        return position
+
+    def _fetch(self, num_messages):
+        if self._auto_commit and self.group_id and self._rx_msgs:
+            self.commit()
+        messages = []
+        for topic, partition in list(self._assignment):
+            if (topic, partition) in self._paused:
+                continue
+            if self._subscribed and not self._broker.claim(self.group_id, topic, partition, self):
+                continue
+            position = self._position(topic, partition)
+            batch = self._broker.read(topic, partition, position, num_messages - len(messages))
+            if batch:
+                self._assignment[(topic, partition)] = position + len(batch)
+                messages.extend(batch)
+                if len(messages) >= num_messages:
+                    break
+        self._rx_msgs += len(messages)
+        self._rx_bytes += sum(len(msg) for msg in messages)
+        return messages
+
+    def _stats(self):
+        """
+        Estadísticas con la estructura (parcial) de las de librdkafka.
+        """
+        topics = {}
+        for topic, partition in self._assignment:
+            low, high = self._broker.watermarks(topic, partition)
+            committed = self._broker.committed(self.group_id, topic, partition)
+            topics.setdefault(topic, {'partitions': {}})['partitions'][str(partition)] = {
+                'desired': True,
+                'lo_offset': low,
+                'hi_offset': high,
+                'committed_offset': OFFSET_INVALID if committed is None else committed,
+                'fetchq_cnt': 0,
+            }
+        return {
+            'ts': int(time.monotonic() * 1e6),
+            'rxmsgs': self._rx_msgs,
+            'rxmsg_bytes': self._rx_bytes,
+            'topics': topics,
+        }
+
+
+def _to_bytes(value):
+    return value.encode() if isinstance(value, str) else value
+
+
+def _normalize_headers(headers):
+    if not headers:
+        return None
+    items = headers.items() if isinstance(headers, dict) else headers
+    return [(name, _to_bytes(value)) for name, value in items]
+
+
+def _cluster_metadata(broker, topic=None):
+    topics = broker.topics()
+    if topic is not None:
+        topics = {topic: broker.create_topic(topic)}
+    return SimpleNamespace(topics={
+        name: SimpleNamespace(topic=name, error=None,
+                              partitions={p: SimpleNamespace(id=p) for p in range(count)})
+        for name, count in topics.items()
+    })
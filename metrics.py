@@ -0,0 +1,167 @@
+"""
+Métricas internas en memoria (contadores, gauges e histogramas).
+
+Las métricas se registran por nombre en un registro global y se exponen como un
+diccionario con `snapshot()`, que la API publica en el endpoint /metrics. Todas las
+operaciones son seguras entre hilos y de costo constante en el camino crítico.
+"""
+
+import threading
+from collections import deque
+
+import numpy as np
+
+# Muestras recientes que guarda cada histograma para calcular percentiles
+HISTOGRAM_WINDOW = 2048
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Counter:
+    """
+    Contador monótono.
+    """
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return self._value
+
+
+class Gauge:
+    """
+    Valor instantáneo que puede subir o bajar.
+    """
+
+    def __init__(self):
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return self._value
+
+
+class Histogram:
+    """
+    Distribución de observaciones: total acumulado y percentiles sobre una ventana reciente.
+    """
+
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._samples.append(value)
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+
+    def observe_many(self, values):
+        with self._lock:
+            for value in values:
+                self._samples.append(value)
+                self._count += 1
+                self._sum += value
+                if value > self._max:
+                    self._max = value
+
+    def snapshot(self):
+        with self._lock:
+            samples = np.fromiter(self._samples, dtype=np.float64, count=len(self._samples))
+            count, total, maximum = self._count, self._sum, self._max
+        if count == 0:
+            return {'count': 0}
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+        return {
+            'count': count,
+            'mean': total / count,
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'max': maximum,
+        }
+
+
+def _get_or_create(name, metric_class):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.setdefault(name, metric_class())
+    return metric
+
+
+def counter(name):
+    """
+    Retorna el contador registrado con `name`, creándolo si no existe.
+    """
+    return _get_or_create(name, Counter)
+
+
+def gauge(name):
+    """
+    Retorna el gauge registrado con `name`, creándolo si no existe.
+    """
+    return _get_or_create(name, Gauge)
+
+
+def histogram(name):
+    """
+    Retorna el histograma registrado con `name`, creándolo si no existe.
+    """
+    return _get_or_create(name, Histogram)
+
+
+def unregister(name):
+    """
+    Elimina la métrica registrada con `name` (por ejemplo, el lag de una partición que
+    dejó de estar asignada).
+    """
+    with _registry_lock:
+        _registry.pop(name, None)
+
+
+def snapshot():
+    """
+    Retorna el valor actual de todas las métricas registradas.
+
+    Returns:
+        dict: Nombre de la métrica -> valor (contadores y gauges) o resumen (histogramas).
+    """
+    with _registry_lock:
+        items = list(_registry.items())
+    return {name: metric.snapshot() for name, metric in sorted(items)}
+
+
+def counters(prefix=''):
+    """
+    Retorna el valor actual de los contadores cuyo nombre empieza con `prefix`.
+
+    Returns:
+        dict: Nombre del contador -> valor.
+    """
+    with _registry_lock:
+        items = list(_registry.items())
+    return {name: metric.value for name, metric in items
+            if isinstance(metric, Counter) and name.startswith(prefix)}
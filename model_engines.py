@@ -0,0 +1,776 @@
+"""
+Motores de puntuación que reemplazan a `predict_proba` de sklearn en el camino caliente.
+
+Cada motor extrae una sola vez, al cargar los modelos, los parámetros ajustados del
+estimador a arreglos contiguos y expone `predict_proba` con la misma interfaz y los
+mismos resultados, sin la validación de entrada ni el despacho de sklearn en cada
+llamada. El estimador original queda en el atributo `estimator`.
+
+`load_models` (prediction.py) los aplica según Config.TREE_ENGINE, Config.LOGISTIC_ENGINE,
+Config.KNN_ENGINE y Config.SVC_ENGINE.
+"""
+
+import logging
+import math
+import operator
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import sklearn
+from scipy.linalg.blas import dgemm, sgemm
+from scipy.special import expit
+from sklearn.utils.fixes import parse_version
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Filas que ExactKNN resolvió con sklearn (ver `ExactKNN`)
+_knn_fallback_rows = metrics.counter('knn_exact_fallback_rows')
+
+# Menor valor float64 que se convierte a infinito en float32 (2**128 - 2**103): sklearn
+# convierte la entrada de los árboles a float32 y rechaza los valores infinitos
+FLOAT32_OVERFLOW = float(2.0 ** 128 - 2.0 ** 103)
+
+# Profundidad máxima para generar el código de ramas de una fila; en árboles más profundos
+# la fila se recorre sobre los arreglos de nodos
+TREE_CODEGEN_MAX_DEPTH = 64
+
+_TREE_LEAF = -1
+
+# Kernels de SVC que KernelSVC sabe evaluar
+SVC_KERNELS = ('linear', 'rbf', 'poly', 'sigmoid')
+
+# Cota relativa del error de las distancias al cuadrado calculadas en float32, por
+# dimensión: |d32 - d| <= FLOAT32_DISTANCE_ERROR * (n_features + 1) * (|x|² + |y|²)
+FLOAT32_DISTANCE_ERROR = 4 * float(np.finfo(np.float32).eps)
+
+# Norma al cuadrado a partir de la cual una fila no se puede filtrar en float32
+FLOAT32_MAX_NORM = 1e30
+
+# Margen relativo (sobre |x|² + |y|²) dentro del cual dos distancias float64 se consideran
+# empatadas: cubre de sobra el redondeo de sklearn, que las calcula por otro camino
+KNN_TIE_TOLERANCE = 1e-9
+
+
+def float32_thresholds(thresholds):
+    """
+    Convierte umbrales de comparación sobre float32 en umbrales equivalentes sobre float64.
+
+    sklearn compara `float32(x) <= umbral`. Como el redondeo a float32 es monótono, existe
+    un único float64 T tal que, para todo float64 x, `float32(x) <= umbral` equivale a
+    `x <= T`: el mayor x cuyo redondeo no supera el umbral.
+
+    Args:
+        thresholds (numpy.ndarray): Umbrales float64.
+
+    Returns:
+        numpy.ndarray: Umbrales float64 para comparar directamente con la entrada float64.
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    with np.errstate(over='ignore'):
+        # Mayor float32 que no supera el umbral
+        low = thresholds.astype(np.float32)
+        low = np.where(low.astype(np.float64) > thresholds, np.nextafter(low, np.float32(-np.inf)), low)
+        high = np.nextafter(low, np.float32(np.inf))
+        # Punto medio exacto en float64 entre dos float32 consecutivos; el empate se redondea al par
+        middle = (low.astype(np.float64) + high.astype(np.float64)) / 2.0
+        limits = np.where(middle.astype(np.float32) == low, middle, np.nextafter(middle, -np.inf))
+    # Umbrales por encima del mayor float32 finito: cualquier valor que no desborde los cumple
+    return np.where(np.isfinite(high), limits, np.inf)
+
+
+def check_float32_range(input_array, allow_nan=True):
+    """
+    Rechaza los valores que sklearn no acepta al convertir la entrada a float32.
+
+    Returns:
+        bool: True si la matriz contiene algún NaN.
+
+    Raises:
+        ValueError: Con el mismo mensaje que sklearn, si algún valor es infinito o
+            desborda float32, o si es NaN y `allow_nan` es falso.
+    """
+    if input_array.size == 0:
+        return False
+    # Camino rápido: min y max dentro del rango (con algún NaN la comparación es falsa)
+    if -FLOAT32_OVERFLOW < input_array.min() and input_array.max() < FLOAT32_OVERFLOW:
+        return False
+    with np.errstate(invalid='ignore'):
+        overflow = np.abs(input_array) >= FLOAT32_OVERFLOW
+    if overflow.any():
+        raise ValueError("Input X contains infinity or a value too large for dtype('float32').")
+    if not allow_nan:
+        raise ValueError("Input X contains NaN.")
+    return True
+
+
+class CompiledTree:
+    """
+    Evaluación de un DecisionTreeClassifier ajustado sobre arreglos planos de nodos.
+
+    - Lotes: recorrido sincronizado por niveles. Todas las filas bajan un nivel por
+      iteración con operaciones vectorizadas (las hojas apuntan a sí mismas), así que el
+      costo es `max_depth` pasadas sobre el lote.
+    - Una fila: una función de `if`/`else` anidados generada a partir del árbol, con los
+      umbrales como constantes, que no asigna arreglos de NumPy.
+
+    Los resultados son idénticos bit a bit a `predict_proba` de sklearn: la conversión de
+    la entrada a float32 se refleja en los umbrales (ver `float32_thresholds`), los NaN van
+    al hijo indicado por `missing_go_to_left` y las probabilidades son las mismas filas de
+    `tree_.value`.
+
+    Args:
+        estimator (sklearn.tree.DecisionTreeClassifier): Árbol ajustado de una sola salida.
+
+    Raises:
+        ValueError: Si el árbol tiene más de una salida.
+    """
+
+    def __init__(self, estimator):
+        tree = estimator.tree_
+        if estimator.n_outputs_ != 1:
+            raise ValueError("CompiledTree solo admite árboles de una salida.")
+        self.estimator = estimator
+        self.classes_ = estimator.classes_
+        self.n_features_in_ = estimator.n_features_in_
+        self.max_depth = int(tree.max_depth)
+
+        leaves = tree.children_left == _TREE_LEAF
+        nodes = np.arange(tree.node_count, dtype=np.intp)
+        self.feature = np.where(leaves, 0, tree.feature).astype(np.intp)
+        self.threshold = np.where(leaves, np.inf, float32_thresholds(tree.threshold))
+        self.children_left = np.where(leaves, nodes, tree.children_left).astype(np.intp)
+        self.children_right = np.where(leaves, nodes, tree.children_right).astype(np.intp)
+        # Versiones de sklearn sin soporte de valores faltantes en árboles rechazan los NaN
+        missing = getattr(tree, 'missing_go_to_left', None)
+        self.allow_nan = missing is not None
+        self.missing_go_to_left = (np.zeros(tree.node_count, dtype=bool) if missing is None
+                                   else np.asarray(missing, dtype=bool) & ~leaves)
+        # Mismas filas que retorna `tree_.predict`, recortadas a las clases del modelo. Desde
+        # sklearn 1.4 son fracciones que predict_proba retorna tal cual; antes eran conteos
+        # que predict_proba normalizaba fila por fila
+        value = tree.value[:, 0, :len(self.classes_)].astype(np.float64)
+        if parse_version(sklearn.__version__) < parse_version('1.4'):
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value /= normalizer
+        self.value = np.ascontiguousarray(value)
+
+        self._leaf_rows = [tuple(row) for row in self.value.tolist()]
+        self._node_feature = self.feature.tolist()
+        self._node_threshold = self.threshold.tolist()
+        self._node_left = self.children_left.tolist()
+        self._node_right = self.children_right.tolist()
+        self._node_missing_left = self.missing_go_to_left.tolist()
+        self._predict_row = (self._generate_row_function() if self.max_depth <= TREE_CODEGEN_MAX_DEPTH
+                             else self._walk_row)
+
+    def predict_proba(self, input_array):
+        """
+        Probabilidades por clase, igual que `estimator.predict_proba`.
+
+        Args:
+            input_array (numpy.ndarray): Matriz (N, n_features_in_).
+
+        Returns:
+            numpy.ndarray: Matriz (N, n_clases) float64.
+
+        Raises:
+            ValueError: Si la matriz no tiene la forma esperada o contiene valores que
+                sklearn rechaza.
+        """
+        input_array = np.asarray(input_array, dtype=np.float64)
+        if input_array.ndim != 2 or input_array.shape[1] != self.n_features_in_:
+            raise ValueError(f"Se esperaba una matriz de forma (N, {self.n_features_in_}), "
+                             f"se recibió {input_array.shape}")
+        if len(input_array) == 1:
+            return np.array([self.predict_row(input_array[0].tolist())])
+        has_nan = check_float32_range(input_array, self.allow_nan)
+        return self.value.take(self.apply(input_array, has_nan), axis=0)
+
+    def apply(self, input_array, has_nan=True):
+        """
+        Índice de la hoja de cada fila, por recorrido sincronizado por niveles.
+
+        Args:
+            input_array (numpy.ndarray): Matriz (N, n_features_in_) float64 ya validada.
+            has_nan (bool): Falso si se sabe que la matriz no tiene NaN.
+
+        Returns:
+            numpy.ndarray: Índices de nodo de longitud N.
+        """
+        input_array = np.ascontiguousarray(input_array)
+        flat = input_array.ravel()
+        # Posición en `flat` del inicio de cada fila
+        row_starts = np.arange(0, input_array.size, input_array.shape[1], dtype=np.intp)
+        nodes = np.zeros(len(input_array), dtype=np.intp)
+        # NaN <= umbral es falso: sin este ajuste todos los NaN irían a la derecha
+        check_missing = has_nan and self.missing_go_to_left.any()
+        for _ in range(self.max_depth):
+            values = flat.take(row_starts + self.feature.take(nodes))
+            go_left = values <= self.threshold.take(nodes)
+            if check_missing:
+                go_left |= np.isnan(values) & self.missing_go_to_left.take(nodes)
+            nodes = np.where(go_left, self.children_left.take(nodes), self.children_right.take(nodes))
+        return nodes
+
+    def predict_row(self, row):
+        """
+        Probabilidades de una sola fila, sin NumPy.
+
+        Args:
+            row (sequence[float]): Los n_features_in_ valores de la fila.
+
+        Returns:
+            tuple[float]: Probabilidad de cada clase.
+
+        Raises:
+            ValueError: Si algún valor es infinito o desborda float32 (o es NaN, en
+                versiones de sklearn que no los admiten).
+        """
+        for value in row:
+            if abs(value) >= FLOAT32_OVERFLOW:
+                raise ValueError("Input X contains infinity or a value too large for dtype('float32').")
+            if value != value and not self.allow_nan:
+                raise ValueError("Input X contains NaN.")
+        return self._predict_row(row)
+
+    def _walk_row(self, row):
+        """
+        Recorre una fila sobre los arreglos de nodos (árboles demasiado profundos para generar código).
+        """
+        node = 0
+        for _ in range(self.max_depth):
+            value = row[self._node_feature[node]]
+            if value <= self._node_threshold[node] or (value != value and self._node_missing_left[node]):
+                node = self._node_left[node]
+            else:
+                node = self._node_right[node]
+        return self._leaf_rows[node]
+
+    def _generate_row_function(self):
+        """
+        Genera y compila la función de una fila: un `if`/`else` por nodo interno y un
+        `return` de la tupla de probabilidades por hoja.
+        """
+        lines = ["def predict_row(row):"]
+        self._emit_node(0, 1, lines)
+        # `repr` de un umbral infinito (divisiones solo por valores faltantes) es 'inf'
+        namespace = {'LEAVES': self._leaf_rows, 'inf': float('inf')}
+        exec(compile("\n".join(lines), f"<CompiledTree {id(self):x}>", 'exec'), namespace)
+        return namespace['predict_row']
+
+    def _emit_node(self, node, depth, lines):
+        indent = "    " * depth
+        if self.children_left[node] == node:
+            lines.append(f"{indent}return LEAVES[{node}]")
+            return
+        value = f"row[{self.feature[node]}]"
+        threshold = repr(float(self.threshold[node]))
+        # `not x > t` también es verdadero para NaN
+        condition = f"not {value} > {threshold}" if self.missing_go_to_left[node] else f"{value} <= {threshold}"
+        lines.append(f"{indent}if {condition}:")
+        self._emit_node(self.children_left[node], depth + 1, lines)
+        lines.append(f"{indent}else:")
+        self._emit_node(self.children_right[node], depth + 1, lines)
+
+
+def check_finite(input_array):
+    """
+    Rechaza los valores que sklearn no acepta en la entrada de los modelos float64.
+
+    Raises:
+        ValueError: Con el mismo mensaje que sklearn, si algún valor es NaN o infinito.
+    """
+    if np.isnan(input_array).any():
+        raise ValueError("Input X contains NaN.")
+    if not np.isfinite(input_array).all():
+        raise ValueError("Input X contains infinity or a value too large for dtype('float64').")
+
+
+def sigmoid(value):
+    """
+    Función logística de un escalar, estable para valores grandes en ambos signos.
+    """
+    if value >= 0.0:
+        return 1.0 / (1.0 + math.exp(-value))
+    exp_value = math.exp(value)
+    return exp_value / (1.0 + exp_value)
+
+
+class FusedLogistic:
+    """
+    Regresión logística binaria como un producto `X @ w + b` seguido de la sigmoide.
+
+    - Lotes (`predict_proba`): las mismas operaciones que sklearn (producto contra
+      `coef_.T`, suma de `intercept_`, `expit` en el mismo arreglo), así que el resultado es
+      idéntico bit a bit, sin la validación ni el despacho por llamada.
+    - Una fila (`predict_row`): producto escalar y sigmoide en Python puro, sin asignar
+      arreglos de NumPy. El orden de la suma no es el de BLAS, así que puede diferir de
+      sklearn en el último bit.
+    - Entrada sin escalar (`predict_proba_raw`, `predict_row(raw=True)`): el escalado afín
+      de 'amount' y 'time' (`prediction.apply_scaling`) está plegado en los coeficientes y
+      el intercepto al cargar, de modo que un único producto reemplaza escalado y modelo.
+      Equivale al flujo escalado salvo por el redondeo (del orden de 1e-15).
+
+    Los valores NaN o infinitos se rechazan como en sklearn, sin recorrer la matriz: si
+    algún valor no es finito, su puntaje tampoco lo es, y solo entonces se revisa la entrada.
+
+    Args:
+        estimator (sklearn.linear_model.LogisticRegression): Modelo binario ajustado (uno contra el resto).
+        scaler_multiplier (numpy.ndarray): Multiplicador de 'amount' y 'time' (ver `prediction.load_scaler_params`).
+        scaler_offset (numpy.ndarray): Desplazamiento de 'amount' y 'time'.
+
+    Raises:
+        ValueError: Si el modelo no es binario o no usa uno contra el resto.
+    """
+
+    def __init__(self, estimator, scaler_multiplier, scaler_offset):
+        if len(estimator.classes_) != 2 or estimator.coef_.shape[0] != 1:
+            raise ValueError("FusedLogistic solo admite regresión logística binaria.")
+        if estimator.multi_class == 'multinomial':
+            raise ValueError("FusedLogistic no admite multi_class='multinomial'.")
+        self.estimator = estimator
+        self.classes_ = estimator.classes_
+        self.n_features_in_ = estimator.n_features_in_
+
+        # (n_features, 1), igual que `coef_.T` en sklearn
+        self.coef_t = np.ascontiguousarray(estimator.coef_.T, dtype=np.float64)
+        self.intercept = np.asarray(estimator.intercept_, dtype=np.float64)
+        # Coeficientes sobre la entrada sin escalar:
+        #   w·scaled + b = (w * [m, 1...])·raw + (b + w[:2]·offset)
+        scaled_columns = len(scaler_multiplier)
+        raw_coef = estimator.coef_[0].astype(np.float64)
+        raw_coef[:scaled_columns] *= scaler_multiplier
+        self.raw_coef_t = np.ascontiguousarray(raw_coef[:, np.newaxis])
+        self.raw_intercept = self.intercept + float(np.dot(estimator.coef_[0, :scaled_columns], scaler_offset))
+
+        self._coef = estimator.coef_[0].tolist()
+        self._intercept = float(self.intercept[0])
+        self._raw_coef = raw_coef.tolist()
+        self._raw_intercept = float(self.raw_intercept[0])
+
+    def predict_proba(self, input_array):
+        """
+        Probabilidades [no_fraude, fraude] sobre la entrada escalada, igual que `estimator.predict_proba`.
+
+        Args:
+            input_array (numpy.ndarray): Matriz (N, n_features_in_) en el orden de EXPECTED_COLUMNS.
+
+        Returns:
+            numpy.ndarray: Matriz (N, 2) float64.
+
+        Raises:
+            ValueError: Si la matriz no tiene la forma esperada o contiene NaN o infinitos.
+        """
+        input_array = self._check_shape(input_array)
+        if len(input_array) == 1:
+            return np.array([self.predict_row(input_array[0].tolist())])
+        return self._predict(input_array, self.coef_t, self.intercept)
+
+    def predict_proba_raw(self, raw_array):
+        """
+        Probabilidades [no_fraude, fraude] sobre la entrada sin escalar ('amount' y 'time' originales).
+
+        Args:
+            raw_array (numpy.ndarray): Matriz (N, n_features_in_) en el orden de RAW_COLUMNS.
+
+        Returns:
+            numpy.ndarray: Matriz (N, 2) float64.
+
+        Raises:
+            ValueError: Si la matriz no tiene la forma esperada o contiene NaN o infinitos.
+        """
+        raw_array = self._check_shape(raw_array)
+        if len(raw_array) == 1:
+            return np.array([self.predict_row(raw_array[0].tolist(), raw=True)])
+        return self._predict(raw_array, self.raw_coef_t, self.raw_intercept)
+
+    def predict_row(self, row, raw=False):
+        """
+        Probabilidades de una sola fila, sin NumPy.
+
+        Args:
+            row (sequence[float]): Los n_features_in_ valores de la fila.
+            raw (bool): True si 'amount' y 'time' vienen sin escalar.
+
+        Returns:
+            tuple[float]: (probabilidad_no_fraude, probabilidad_fraude).
+
+        Raises:
+            ValueError: Si algún valor es NaN o infinito.
+        """
+        if raw:
+            score = sum(map(operator.mul, self._raw_coef, row), self._raw_intercept)
+        else:
+            score = sum(map(operator.mul, self._coef, row), self._intercept)
+        if not math.isfinite(score):
+            check_finite(np.asarray(row, dtype=np.float64))
+        probability = sigmoid(score)
+        return (1.0 - probability, probability)
+
+    def _check_shape(self, input_array):
+        input_array = np.asarray(input_array, dtype=np.float64)
+        if input_array.ndim != 2 or input_array.shape[1] != self.n_features_in_:
+            raise ValueError(f"Se esperaba una matriz de forma (N, {self.n_features_in_}), "
+                             f"se recibió {input_array.shape}")
+        return input_array
+
+    @staticmethod
+    def _predict(input_array, coef_t, intercept):
+        scores = input_array @ coef_t + intercept
+        if not np.isfinite(scores).all():
+            check_finite(input_array)
+        probabilities = scores.reshape(-1)
+        expit(probabilities, out=probabilities)
+        return np.vstack([1 - probabilities, probabilities]).T
+
+
+def _integer_power(values, degree):
+    """
+    `values ** degree` por cuadrados sucesivos, como `powi` de libsvm (mucho más rápido que
+    `numpy.power` con exponente entero). Puede modificar `values`.
+    """
+    result = np.ones_like(values)
+    while degree > 0:
+        if degree % 2 == 1:
+            result *= values
+        degree //= 2
+        if degree:
+            values *= values
+    return result
+
+
+class KernelSVC:
+    """
+    SVC binario como suma de kernels contra los vectores de soporte, seguida de la sigmoide
+    que `prediction._predict_matrix` aplica a `decision_function`.
+
+    decision(x) = Σ dual_coef_i · K(x, sv_i) + intercept, calculado para el lote completo:
+        - 'linear': los vectores de soporte se colapsan al cargar en w = dual_coef @ SV, y
+          el lote es un único producto `X @ w`.
+        - 'rbf': exp(-γ (|x|² + |sv|² - 2 x·sv)), con una multiplicación de matrices (DGEMM)
+          para x·sv y las normas de los vectores de soporte precalculadas.
+        - 'poly' y 'sigmoid': (γ x·sv + coef0)^grado y tanh(γ x·sv + coef0) sobre el mismo
+          producto.
+    `predict_proba` aplica la sigmoide 1 / (1 + exp(-decision)) sobre el mismo arreglo, con
+    las mismas operaciones que prediction.py. El orden de las sumas no es el de libsvm, así
+    que el resultado puede diferir de sklearn en el redondeo (del orden de 1e-15).
+
+    Con `min_dual_coef` > 0 se descartan los vectores de soporte cuyo coeficiente dual,
+    en valor absoluto, es menor que esa fracción del mayor. La desviación máxima que eso
+    produce en la probabilidad de fraude sobre los propios vectores de soporte queda en
+    `pruning_error` y en el log.
+
+    Args:
+        estimator (sklearn.svm.SVC): Modelo binario ajustado.
+        min_dual_coef (float): Fracción del mayor |dual_coef_| bajo la cual se descarta un vector de soporte.
+
+    Raises:
+        ValueError: Si el modelo no es binario o usa un kernel precalculado o propio.
+    """
+
+    def __init__(self, estimator, min_dual_coef=0.0):
+        if len(estimator.classes_) != 2:
+            raise ValueError("KernelSVC solo admite clasificación binaria.")
+        if estimator.kernel not in SVC_KERNELS:
+            raise ValueError(f"KernelSVC no admite el kernel {estimator.kernel!r}.")
+        self.estimator = estimator
+        self.classes_ = estimator.classes_
+        self.n_features_in_ = estimator.n_features_in_
+        self.kernel = estimator.kernel
+        self.gamma = float(estimator._gamma)
+        self.coef0 = float(estimator.coef0)
+        self.degree = estimator.degree
+        self.intercept = float(estimator.intercept_[0])
+
+        dual_coef = np.asarray(estimator.dual_coef_[0], dtype=np.float64)
+        keep = np.abs(dual_coef) >= min_dual_coef * np.abs(dual_coef).max()
+        self.dual_coef = np.ascontiguousarray(dual_coef[keep])
+        self.support_vectors = np.ascontiguousarray(estimator.support_vectors_[keep], dtype=np.float64)
+        if self.kernel == 'linear':
+            self.coef = self.dual_coef @ self.support_vectors
+        # γ|sv|² de cada vector de soporte, para el kernel RBF
+        self.scaled_norms = self.gamma * np.einsum('ij,ij->i', self.support_vectors, self.support_vectors)
+
+        self.pruning_error = 0.0
+        if not keep.all():
+            support_vectors = estimator.support_vectors_
+            full = KernelSVC(estimator).predict_proba(support_vectors)[:, 1]
+            self.pruning_error = float(np.abs(self.predict_proba(support_vectors)[:, 1] - full).max())
+            logger.info("KernelSVC: %d de %d vectores de soporte descartados (|dual_coef| < %g del mayor); "
+                        "desviación máxima de la probabilidad de fraude sobre los vectores de soporte: %.3g.",
+                        len(keep) - len(self.dual_coef), len(keep), min_dual_coef, self.pruning_error)
+
+    def decision_function(self, input_array):
+        """
+        Puntaje del modelo, como `estimator.decision_function`.
+
+        Args:
+            input_array (numpy.ndarray): Matriz (N, n_features_in_).
+
+        Returns:
+            numpy.ndarray: Arreglo (N,) float64.
+
+        Raises:
+            ValueError: Si la matriz no tiene la forma esperada o contiene NaN o infinitos.
+        """
+        input_array = np.asarray(input_array, dtype=np.float64)
+        if input_array.ndim != 2 or input_array.shape[1] != self.n_features_in_:
+            raise ValueError(f"Se esperaba una matriz de forma (N, {self.n_features_in_}), "
+                             f"se recibió {input_array.shape}")
+        if self.kernel != 'linear':
+            # exp y tanh pueden devolver valores finitos con entrada no finita
+            check_finite(input_array)
+            return self._decision(input_array)
+        scores = self._decision(input_array)
+        if not np.isfinite(scores).all():
+            check_finite(input_array)
+        return scores
+
+    def predict_proba(self, input_array):
+        """
+        Probabilidades [no_fraude, fraude] con la sigmoide de `decision_function`.
+
+        Args:
+            input_array (numpy.ndarray): Matriz (N, n_features_in_).
+
+        Returns:
+            numpy.ndarray: Matriz (N, 2) float64.
+
+        Raises:
+            ValueError: Si la matriz no tiene la forma esperada o contiene NaN o infinitos.
+        """
+        probabilities = self.decision_function(input_array)
+        # 1 / (1 + exp(-decision)) sobre el mismo arreglo
+        np.negative(probabilities, out=probabilities)
+        np.exp(probabilities, out=probabilities)
+        probabilities += 1
+        np.divide(1, probabilities, out=probabilities)
+        return np.vstack([1 - probabilities, probabilities]).T
+
+    def _decision(self, input_array):
+        if self.kernel == 'linear':
+            return input_array @ self.coef + self.intercept
+        if self.kernel == 'rbf':
+            # -γ|x - sv|² = 2γ x·sv - γ|sv|² - γ|x|²
+            kernel = dgemm(2.0 * self.gamma, input_array, self.support_vectors, trans_b=True)
+            kernel -= self.scaled_norms
+            kernel -= self.gamma * np.einsum('ij,ij->i', input_array, input_array)[:, np.newaxis]
+            np.exp(kernel, out=kernel)
+        else:
+            kernel = dgemm(self.gamma, input_array, self.support_vectors, trans_b=True)
+            kernel += self.coef0
+            if self.kernel == 'poly':
+                kernel = _integer_power(kernel, self.degree)
+            else:
+                np.tanh(kernel, out=kernel)
+        return kernel @ self.dual_coef + self.intercept
+
+
+class ExactKNN:
+    """
+    k vecinos más cercanos exactos (euclidianos, pesos uniformes) por bloques con BLAS.
+
+    Guarda las muestras de entrenamiento como una matriz float32 contigua con sus normas al
+    cuadrado precalculadas. Cada bloque de consultas se resuelve así:
+      1. Puntajes aproximados en float32 con un único producto de matrices (sgemm de la
+         BLAS de SciPy, la misma que usa sklearn): la muestra aumentada [y, -|y|²/2] contra
+         la consulta [x, 1] da x·y - |y|²/2 = (|x|² - d²)/2, que ordena las muestras igual
+         que la distancia sin pasadas adicionales sobre la matriz. El k-ésimo mayor de cada
+         fila sale de k pasadas de `argmax`, sin ordenar ni particionar las filas.
+      2. Con la cota de error de float32 se descartan todas las muestras que no pueden
+         estar entre las k más cercanas; las demás (pocas) se verifican con distancias
+         float64 exactas y se ordenan por (distancia, índice): en un empate gana la muestra
+         de menor índice, como en sklearn.
+      3. Si hay vecinos de clases distintas empatados (dentro de KNN_TIE_TOLERANCE) en el
+         límite del k-ésimo, la fila se resuelve con `estimator.kneighbors`, cuyo redondeo
+         decide el empate. En datos reales son casos excepcionales (métrica
+         knn_exact_fallback_rows).
+
+    Los bloques tienen como máximo `block_mb` MB de distancias y, si hay más de uno, se
+    reparten entre `threads` hilos (BLAS y NumPy liberan el GIL).
+
+    Args:
+        estimator (sklearn.neighbors.KNeighborsClassifier): Modelo ajustado con métrica
+            euclidiana y pesos uniformes.
+        block_mb (float): Memoria máxima de la matriz de distancias de un bloque.
+        threads (int): Hilos para repartir los bloques.
+
+    Raises:
+        ValueError: Si el modelo usa otra métrica, pesos por distancia o varias salidas.
+    """
+
+    def __init__(self, estimator, block_mb=16.0, threads=1):
+        if estimator.effective_metric_ != 'euclidean':
+            raise ValueError(f"ExactKNN solo admite la métrica euclidiana, no {estimator.effective_metric_}.")
+        if estimator.weights != 'uniform':
+            raise ValueError("ExactKNN solo admite pesos uniformes.")
+        if estimator.outputs_2d_:
+            raise ValueError("ExactKNN solo admite modelos de una salida.")
+        self.estimator = estimator
+        self.classes_ = estimator.classes_
+        self.n_features_in_ = estimator.n_features_in_
+        self.n_neighbors = estimator.n_neighbors
+
+        samples = np.asarray(estimator._fit_X, dtype=np.float64)
+        samples32 = samples.astype(np.float32)
+        # [y, -|y|²/2] en orden Fortran, como lo recibe sgemm
+        self.samples = np.asfortranarray(np.column_stack(
+            [samples32, -0.5 * np.einsum('ij,ij->i', samples32, samples32)]))
+        self._samples64 = np.ascontiguousarray(samples)
+        self._max_sample_norm = float(np.einsum('ij,ij->i', samples, samples).max())
+        self.labels = np.asarray(estimator._y, dtype=np.intp)
+
+        self.block_rows = max(int(block_mb * 2 ** 20 // (4 * len(samples))), 1)
+        self.threads = max(threads, 1)
+        self._executor = None
+
+    def predict_proba(self, input_array):
+        """
+        Probabilidades por clase, igual que `estimator.predict_proba`.
+
+        Args:
+            input_array (numpy.ndarray): Matriz (N, n_features_in_).
+
+        Returns:
+            numpy.ndarray: Matriz (N, n_clases) float64.
+
+        Raises:
+            ValueError: Si la matriz no tiene la forma esperada o contiene NaN o infinitos.
+        """
+        labels = self.labels[self.kneighbors(input_array)]
+        counts = np.empty((len(labels), len(self.classes_)), dtype=np.float64)
+        for column in range(len(self.classes_)):
+            np.sum(labels == column, axis=1, out=counts[:, column])
+        # Igual que sklearn: normaliza por la suma de los pesos (k con pesos uniformes)
+        counts /= counts.sum(axis=1)[:, np.newaxis]
+        return counts
+
+    def kneighbors(self, input_array):
+        """
+        Índices de los k vecinos de cada fila, del más cercano al más lejano.
+
+        Args:
+            input_array (numpy.ndarray): Matriz (N, n_features_in_).
+
+        Returns:
+            numpy.ndarray: Matriz (N, k) de índices de muestras de entrenamiento.
+
+        Raises:
+            ValueError: Si la matriz no tiene la forma esperada o contiene NaN o infinitos.
+        """
+        input_array = np.asarray(input_array, dtype=np.float64)
+        if input_array.ndim != 2 or input_array.shape[1] != self.n_features_in_:
+            raise ValueError(f"Se esperaba una matriz de forma (N, {self.n_features_in_}), "
+                             f"se recibió {input_array.shape}")
+        if len(input_array) == 1:
+            neighbors, doubtful = self._kneighbors_row(input_array[0])
+            if doubtful:
+                _knn_fallback_rows.inc()
+                return self.estimator.kneighbors(input_array, return_distance=False)
+            return neighbors[np.newaxis, :]
+        blocks = [input_array[start:start + self.block_rows]
+                  for start in range(0, len(input_array), self.block_rows)]
+        if len(blocks) > 1 and self.threads > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='knn')
+            results = list(self._executor.map(self._kneighbors_block, blocks))
+        else:
+            results = [self._kneighbors_block(block) for block in blocks]
+        if not results:
+            return np.empty((0, self.n_neighbors), dtype=np.intp)
+        neighbors = np.concatenate([neighbors for neighbors, _ in results])
+        doubtful = np.flatnonzero(np.concatenate([doubtful for _, doubtful in results]))
+        if len(doubtful):
+            _knn_fallback_rows.inc(len(doubtful))
+            neighbors[doubtful] = self.estimator.kneighbors(input_array[doubtful], return_distance=False)
+        return neighbors
+
+    def _kneighbors_row(self, row):
+        """
+        Una sola consulta: distancias float64 exactas contra todas las muestras, sin el
+        filtro en float32 (con una fila el costo está en las llamadas, no en el cálculo).
+
+        Returns:
+            tuple: (vecinos (k,), True si la fila debe resolverla sklearn).
+        """
+        k = self.n_neighbors
+        norm = float(row @ row)
+        if not math.isfinite(norm):
+            check_finite(row[np.newaxis, :])
+            return None, True
+        differences = self._samples64 - row
+        exact = np.einsum('ij,ij->i', differences, differences)
+        order = np.argsort(exact, kind='stable')
+        exact = exact[order]
+        tied = np.abs(exact - exact[k - 1]) <= KNN_TIE_TOLERANCE * (norm + self._max_sample_norm)
+        if tied[k:].any():
+            labels = self.labels[order[tied]]
+            return order[:k], labels.min() != labels.max()
+        return order[:k], False
+
+    def _kneighbors_block(self, block):
+        """
+        Returns:
+            tuple: (vecinos (n, k), máscara de las filas que debe resolver sklearn).
+        """
+        k = self.n_neighbors
+        rows = np.arange(len(block))
+        norms = np.einsum('ij,ij->i', block, block)
+        if not np.isfinite(norms).all():
+            check_finite(block)
+        scale = norms + self._max_sample_norm
+        tie_margin = KNN_TIE_TOLERANCE * scale
+        doubtful = norms > FLOAT32_MAX_NORM
+
+        # 1. Puntajes (|x|² - d²)/2 aproximados en float32 y k-ésimo mayor por fila (k
+        # pasadas de argmax, sacando temporalmente de la matriz los ya encontrados)
+        queries = np.empty((len(block), self.n_features_in_ + 1), dtype=np.float32)
+        queries[:, :-1] = block
+        queries[:, -1] = 1.0
+        # (muestras, consultas) en orden Fortran: su transpuesta es (consultas, muestras) en orden C
+        scores = sgemm(1.0, self.samples, queries.T).T
+        nearest = np.empty((len(block), k), dtype=np.intp)
+        nearest_scores = np.empty((len(block), k), dtype=np.float32)
+        for position in range(k):
+            nearest[:, position] = scores.argmax(axis=1)
+            nearest_scores[:, position] = scores[rows, nearest[:, position]]
+            scores[rows, nearest[:, position]] = -np.inf
+        scores[rows[:, np.newaxis], nearest] = nearest_scores
+
+        # 2. Candidatos: toda muestra cuya distancia real podría quedar a menos de
+        # `tie_margin` de la k-ésima real. La k-ésima real es a lo sumo la aproximada más
+        # `error`, y cada distancia aproximada está a lo sumo a `error` de la real
+        error = FLOAT32_DISTANCE_ERROR * (self.n_features_in_ + 1) * scale
+        limit = nearest_scores[:, -1] - (error + tie_margin / 2.0)
+        limit = np.nextafter(limit.astype(np.float32), np.float32(-np.inf))
+        # En orden de (fila, índice de muestra)
+        candidate_rows, candidate_samples = np.divmod(np.flatnonzero(scores >= limit[:, np.newaxis]),
+                                                      scores.shape[1])
+
+        # 3. Distancias float64 exactas de los candidatos, en una matriz (filas, candidatos
+        # de la fila) rellena con infinito, y orden estable por distancia: en un empate gana
+        # la muestra de menor índice, como en sklearn
+        differences = block[candidate_rows] - self._samples64[candidate_samples]
+        counts = np.bincount(candidate_rows, minlength=len(block))
+        columns = np.arange(len(candidate_rows)) - (np.cumsum(counts) - counts)[candidate_rows]
+        exact = np.full((len(block), counts.max()), np.inf)
+        exact[candidate_rows, columns] = np.einsum('ij,ij->i', differences, differences)
+        samples = np.zeros(exact.shape, dtype=np.intp)
+        samples[candidate_rows, columns] = candidate_samples
+        order = np.argsort(exact, axis=1, kind='stable')
+        exact = np.take_along_axis(exact, order, axis=1)
+        samples = np.take_along_axis(samples, order, axis=1)
+        neighbors = samples[:, :k]
+
+        # 4. Filas dudosas: candidatos fuera de los k empatados con el k-ésimo y con clases
+        # distintas en el empate
+        tied = np.abs(exact - exact[:, k - 1:k]) <= tie_margin[:, np.newaxis]
+        if tied[:, k:].any():
+            labels = self.labels[samples]
+            lowest = np.where(tied, labels, np.iinfo(np.intp).max).min(axis=1)
+            highest = np.where(tied, labels, -1).max(axis=1)
+            doubtful |= tied[:, k:].any(axis=1) & (lowest != highest)
+        return neighbors, doubtful
@@ -5,23 +5,60 @@ Este módulo utiliza modelos de machine learning para generar predicciones
 sobre transacciones. Se emplean modelos tradicionales cargados con joblib.
 """
 
+import json
 import logging
+import operator
+import os
 import numpy as np
-import pandas as pd
 import joblib
-from sklearn.preprocessing import RobustScaler
+
+from ann_index import IVFKNN
+from config import Config
+from diagnostics import lazy, request_traced
+from model_engines import CompiledTree, ExactKNN, FusedLogistic, KernelSVC
+
+try:
+    import pandas as pd
+except ImportError:  # pandas solo se usa como alternativa opcional para armar la entrada
+    pd = None
 
 logger = logging.getLogger(__name__)
 
-# Escaladores globales para normalizar los datos
-scaler_amount = RobustScaler()
-scaler_time = RobustScaler()
+# Orden de columnas esperado por los modelos
+EXPECTED_COLUMNS = ['scaled_amount', 'scaled_time'] + [f'v{i}' for i in range(1, 29)]
+
+# Columnas de entrada antes del escalado, en el mismo orden
+RAW_COLUMNS = ['amount', 'time'] + EXPECTED_COLUMNS[2:]
+
+# Tabla de índices precalculada: nombre de columna (en minúsculas) -> posición en la matriz
+FEATURE_INDEX = {name: i for i, name in enumerate(RAW_COLUMNS)}
+
+# Extrae las 30 columnas en orden cuando las claves ya vienen con el nombre exacto
+_get_raw_features = operator.itemgetter(*RAW_COLUMNS)
+
+# Motores de puntuación disponibles (ver model_engines.py)
+ENGINE_SKLEARN = 'sklearn'
+ENGINE_COMPILED = 'compiled'
+ENGINE_IVF = 'ivf'
+
+# Archivo con el centro y la escala del RobustScaler usado en entrenamiento
+SCALER_PARAMS_FILE = 'scaler_params.json'
+
+# Transformación afín precalculada para 'amount' y 'time':
+#   scaled = raw * scaler_multiplier + scaler_offset
+# Equivale a (raw - center) / scale del RobustScaler ajustado en entrenamiento.
+scaler_multiplier = None
+scaler_offset = None
 
 
 def load_models():
     """
     Carga los modelos de predicción desde archivos.
 
+    También carga los parámetros de escalado de 'amount' y 'time' (ver `load_scaler_params`)
+    y reemplaza los estimadores por los motores de model_engines.py configurados (ver
+    `load_engines`).
+
     Los modelos cargados son:
       - 'logistic': Modelo de regresión logística.
       - 'kneighbors': Modelo de k-vecinos.
@@ -36,28 +73,145 @@ def load_models():
     """
     models = {}
     try:
-        models['logistic'] = joblib.load('/app/model/logistic_regression_model.pkl')
-        models['kneighbors'] = joblib.load('/app/model/knears_neighbors_model.pkl')
-        models['svc'] = joblib.load('/app/model/svc_model.pkl')
-        models['tree'] = joblib.load('/app/model/decision_tree_model.pkl')
+        models['logistic'] = joblib.load(os.path.join(Config.MODEL_PATH, 'logistic_regression_model.pkl'))
+        models['kneighbors'] = joblib.load(os.path.join(Config.MODEL_PATH, 'knears_neighbors_model.pkl'))
+        models['svc'] = joblib.load(os.path.join(Config.MODEL_PATH, 'svc_model.pkl'))
+        models['tree'] = joblib.load(os.path.join(Config.MODEL_PATH, 'decision_tree_model.pkl'))
+        load_scaler_params()
+        load_engines(models)
         logger.info("Modelos cargados exitosamente.")
     except Exception as e:
-        logger.error(f"Error cargando modelos: {str(e)}")
+        logger.error("Error cargando modelos: %s", e)
         raise e
     return models
 
 
+def load_engines(models):
+    """
+    Reemplaza en el mismo diccionario los estimadores de sklearn por los motores de
+    puntuación configurados. Cada motor conserva el estimador en su atributo `estimator`.
+
+    Args:
+        models (dict): Modelos cargados por `load_models`.
+
+    Returns:
+        dict: El mismo diccionario.
+
+    Raises:
+        ValueError: Si Config.TREE_ENGINE, Config.LOGISTIC_ENGINE, Config.KNN_ENGINE o
+            Config.SVC_ENGINE no es un motor conocido.
+    """
+    if _use_engine('TREE_ENGINE'):
+        models['tree'] = CompiledTree(models['tree'])
+    if _use_engine('LOGISTIC_ENGINE'):
+        if scaler_multiplier is None:
+            load_scaler_params()
+        models['logistic'] = FusedLogistic(models['logistic'], scaler_multiplier, scaler_offset)
+    knn_engine = _use_engine('KNN_ENGINE', (ENGINE_COMPILED, ENGINE_IVF))
+    if knn_engine == ENGINE_IVF:
+        models['kneighbors'] = IVFKNN.load(models['kneighbors'])
+    elif knn_engine:
+        models['kneighbors'] = ExactKNN(models['kneighbors'], block_mb=Config.KNN_BLOCK_MB,
+                                        threads=Config.KNN_THREADS)
+    if _use_engine('SVC_ENGINE'):
+        models['svc'] = KernelSVC(models['svc'], min_dual_coef=Config.SVC_MIN_DUAL_COEF)
+    return models
+
+
+def _use_engine(setting, engines=(ENGINE_COMPILED,)):
+    """
+    Motor seleccionado por la opción `setting` de Config, o None si es 'sklearn'.
+
+    Args:
+        setting (str): Nombre de la opción de Config.
+        engines (tuple): Motores admitidos además de 'sklearn'.
+
+    Raises:
+        ValueError: Si el valor no es un motor conocido.
+    """
+    engine = getattr(Config, setting)
+    if engine not in engines + (ENGINE_SKLEARN,):
+        raise ValueError(f"{setting} desconocido: {engine}")
+    return None if engine == ENGINE_SKLEARN else engine
+
+
+def load_scaler_params(path=None):
+    """
+    Carga el centro y la escala de 'amount' y 'time' usados en entrenamiento.
+
+    Precalcula la transformación afín equivalente y la deja en las variables globales
+    `scaler_multiplier` y `scaler_offset`.
+
+    Args:
+        path (str, optional): Ruta del archivo JSON. Por defecto se usa
+            SCALER_PARAMS_FILE dentro de Config.MODEL_PATH.
+
+    Returns:
+        tuple: (scaler_multiplier, scaler_offset), arreglos de longitud 2 en el
+            orden ['amount', 'time'].
+
+    Raises:
+        Exception: Si el archivo no existe o no tiene el formato esperado.
+    """
+    global scaler_multiplier, scaler_offset
+    if path is None:
+        path = os.path.join(Config.MODEL_PATH, SCALER_PARAMS_FILE)
+    with open(path) as f:
+        params = json.load(f)
+    center = np.array([params['amount']['center'], params['time']['center']], dtype=np.float64)
+    scale = np.array([params['amount']['scale'], params['time']['scale']], dtype=np.float64)
+    # Igual que RobustScaler: una escala nula no modifica los datos
+    scale[scale == 0.0] = 1.0
+    scaler_multiplier = 1.0 / scale
+    scaler_offset = -center / scale
+    logger.info("Parámetros de escalado cargados desde %s.", path)
+    return scaler_multiplier, scaler_offset
+
+
+def save_scaler_params(scaler_amount, scaler_time, path):
+    """
+    Exporta el centro y la escala de dos RobustScaler ya ajustados en entrenamiento.
+
+    Args:
+        scaler_amount (RobustScaler): Escalador ajustado sobre la columna 'Amount'.
+        scaler_time (RobustScaler): Escalador ajustado sobre la columna 'Time'.
+        path (str): Ruta del archivo JSON a generar.
+    """
+    params = {
+        'amount': {'center': float(scaler_amount.center_[0]), 'scale': float(scaler_amount.scale_[0])},
+        'time': {'center': float(scaler_time.center_[0]), 'scale': float(scaler_time.scale_[0])},
+    }
+    with open(path, 'w') as f:
+        json.dump(params, f, indent=2)
+
+
+def apply_scaling(input_array):
+    """
+    Escala en el mismo arreglo las dos primeras columnas ('amount' y 'time').
+
+    Aplica la transformación afín precalculada como una multiplicación y una suma
+    vectorizadas sobre todo el lote, sin ajustar ningún escalador.
+
+    Args:
+        input_array (numpy.ndarray): Matriz (N, 30) de tipo flotante cuyas dos primeras
+            columnas contienen 'amount' y 'time' sin escalar.
+
+    Returns:
+        numpy.ndarray: La misma matriz, con 'scaled_amount' y 'scaled_time'.
+    """
+    if scaler_multiplier is None:
+        load_scaler_params()
+    block = input_array[:, :2]
+    np.multiply(block, scaler_multiplier, out=block)
+    np.add(block, scaler_offset, out=block)
+    return input_array
+
+
 def process_transaction(transaction_data, models):
     """
     Procesa los datos de una transacción para generar predicciones de fraude.
 
-    Realiza las siguientes operaciones:
-      - Convierte la entrada en un DataFrame.
-      - Convierte los nombres de columnas a minúsculas.
-      - Verifica y asigna valores por defecto a las columnas 'amount' y 'time'.
-      - Convierte 'amount' a numérico y escala 'amount' y 'time'.
-      - Ordena las columnas de forma que coincidan con el formato esperado.
-      - Genera predicciones utilizando cada modelo cargado.
+    Es un envoltorio de `process_transactions_batch` para una única transacción.
 
     Args:
         transaction_data (dict): Diccionario con los datos de la transacción.
@@ -75,83 +229,265 @@ def process_transaction(transaction_data, models):
     Raises:
         Exception: Si ocurre un error durante el procesamiento o la predicción.
     """
-    predictions = {}
+    return process_transactions_batch([transaction_data], models)[0]
+
+
+def process_transactions_batch(transactions, models):
+    """
+    Procesa un lote de transacciones ejecutando cada modelo una sola vez sobre toda la matriz.
+
+    Por defecto la matriz se arma con `assemble_features`, sin pandas. Con
+    Config.FEATURE_ASSEMBLER = 'pandas', o si se recibe un DataFrame, se usa
+    `_build_feature_matrix`.
+
+    Args:
+        transactions (list[dict] | numpy.ndarray | pandas.DataFrame): Lista de diccionarios
+            con los datos de cada transacción, una matriz (N, 30) ya preparada con las
+            columnas en el orden esperado por los modelos ('scaled_amount', 'scaled_time',
+            'v1' a 'v28'), o un DataFrame con una fila por transacción.
+        models (dict): Diccionario con los modelos de predicción.
+
+    Returns:
+        list[dict]: Una entrada por transacción, en el mismo orden de la entrada y con la
+            misma estructura que retorna `process_transaction`.
+
+    Raises:
+        ValueError: Si la matriz recibida no tiene la forma (N, 30).
+        Exception: Si ocurre un error durante el procesamiento o la predicción.
+    """
     try:
-        # Convertir la entrada en un DataFrame
-        input_data = pd.DataFrame([transaction_data])
+        if isinstance(transactions, np.ndarray):
+            input_array = np.asarray(transactions, dtype=np.float64)
+            if input_array.ndim != 2 or input_array.shape[1] != len(EXPECTED_COLUMNS):
+                raise ValueError(
+                    f"Se esperaba una matriz de forma (N, {len(EXPECTED_COLUMNS)}), "
+                    f"se recibió {input_array.shape}"
+                )
+        elif Config.FEATURE_ASSEMBLER == 'pandas' or (pd is not None and isinstance(transactions, pd.DataFrame)):
+            if pd is None:
+                raise RuntimeError("FEATURE_ASSEMBLER=pandas requiere tener pandas instalado.")
+            if not isinstance(transactions, pd.DataFrame):
+                transactions = pd.DataFrame(list(transactions))
+            input_array = _build_feature_matrix(transactions)
+        else:
+            if not isinstance(transactions, (list, tuple)):
+                transactions = list(transactions)
+            input_array = apply_scaling(assemble_features(transactions))
+
+        if len(input_array) == 0:
+            return []
+
+        raw_predictions = _predict_matrix(input_array, models)
+        predictions = [
+            _format_predictions(raw_predictions, i) for i in range(len(input_array))
+        ]
+
+        if request_traced():
+            logger.info("Predicciones generadas: %s", predictions)
+    except Exception as e:
+        # Quien llama registra el error (la API lo informa en la respuesta; el procesamiento
+        # desde Kafka lo envía al DLQ con límite de frecuencia en el log)
+        logger.debug("Error en el procesamiento de la transacción: %s", e)
+        raise e
+    return predictions
+
 
-        # Loguear las columnas originales
+def assemble_features(transactions, dtype=None, out=None):
+    """
+    Arma la matriz de entrada sin escalar a partir de diccionarios, sin usar pandas.
+
+    Cada transacción se copia directamente a su fila de un arreglo preasignado usando
+    la tabla de índices FEATURE_INDEX. Conserva la semántica del flujo con DataFrame:
+      - Los nombres de las claves no distinguen mayúsculas de minúsculas.
+      - Si falta 'amount' o 'time' se usa 0.
+      - 'amount' se convierte como pd.to_numeric(errors='coerce'): un valor no numérico
+        queda como NaN.
+      - Las claves adicionales (por ejemplo 'transaction_id') se ignoran.
+
+    Args:
+        transactions (list[dict]): Transacciones a convertir.
+        dtype (numpy.dtype, optional): Tipo de la matriz. Por defecto Config.FEATURE_DTYPE.
+        out (numpy.ndarray, optional): Arreglo (N, 30) preasignado donde escribir.
+
+    Returns:
+        numpy.ndarray: Matriz (N, 30) en el orden de RAW_COLUMNS ('amount', 'time',
+            'v1' a 'v28'), lista para `apply_scaling`.
+
+    Raises:
+        KeyError: Si a una transacción le falta alguna de las columnas 'v1' a 'v28'.
+        ValueError: Si alguna columna distinta de 'amount' no es numérica.
+    """
+    if out is None:
+        out = np.empty((len(transactions), len(RAW_COLUMNS)), dtype=dtype or Config.FEATURE_DTYPE)
+    for i, transaction_data in enumerate(transactions):
+        try:
+            values = _get_raw_features(transaction_data)
+        except KeyError:
+            values = _collect_features(transaction_data)
+        try:
+            out[i] = values
+        except (TypeError, ValueError):
+            out[i] = _coerce_amount(values)
+    return out
+
+
+def _collect_features(transaction_data):
+    """
+    Extrae las columnas de una transacción cuyas claves no coinciden exactamente con RAW_COLUMNS.
+
+    Args:
+        transaction_data (dict): Datos de la transacción.
+
+    Returns:
+        list: Valores en el orden de RAW_COLUMNS, con 0 para 'amount' y 'time' ausentes.
+
+    Raises:
+        KeyError: Si falta alguna de las columnas 'v1' a 'v28'.
+    """
+    values = [0, 0] + [None] * (len(RAW_COLUMNS) - 2)
+    found = [True, True] + [False] * (len(RAW_COLUMNS) - 2)
+    for key, value in transaction_data.items():
+        index = FEATURE_INDEX.get(key)
+        if index is None and isinstance(key, str):
+            index = FEATURE_INDEX.get(key.lower())
+        if index is not None:
+            values[index] = value
+            found[index] = True
+    if not all(found):
+        missing = [name for name, present in zip(RAW_COLUMNS, found) if not present]
+        raise KeyError(f"Faltan columnas en la transacción: {missing}")
+    return values
+
+
+def _coerce_amount(values):
+    """
+    Convierte 'amount' a numérico como pd.to_numeric(errors='coerce').
+
+    Args:
+        values (sequence): Valores en el orden de RAW_COLUMNS.
+
+    Returns:
+        list: Los mismos valores con 'amount' convertido a float (NaN si no es numérico).
+    """
+    values = list(values)
+    try:
+        values[0] = float(values[0])
+    except (TypeError, ValueError):
+        values[0] = np.nan
+    return values
+
+
+def _build_feature_matrix(input_data):
+    """
+    Prepara un DataFrame de transacciones y lo convierte en la matriz de entrada de los modelos.
+
+    Es la alternativa con pandas de `assemble_features`.
+
+    Realiza las siguientes operaciones:
+      - Convierte los nombres de columnas a minúsculas.
+      - Verifica y asigna valores por defecto a las columnas 'amount' y 'time'.
+      - Convierte 'amount' a numérico.
+      - Ordena las columnas de forma que coincidan con el formato esperado.
+      - Escala 'amount' y 'time' con los parámetros de entrenamiento (`apply_scaling`).
+
+    Args:
+        input_data (pandas.DataFrame): Una fila por transacción.
+
+    Returns:
+        numpy.ndarray: Matriz (N, 30) con las columnas en el orden de EXPECTED_COLUMNS.
+    """
+    traced = request_traced()
+    if traced:
         logger.info("Columnas originales: %s", input_data.columns.tolist())
-        print("Columnas originales:", input_data.columns.tolist())
 
-        # Convertir todas las columnas a minúsculas para uniformidad
-        input_data.columns = [col.lower() for col in input_data.columns]
-        logger.info("Columnas tras convertir a minúsculas: %s", input_data.columns.tolist())
-        print("Columnas tras lower():", input_data.columns.tolist())
+    # Convertir todas las columnas a minúsculas para uniformidad
+    input_data.columns = [col.lower() for col in input_data.columns]
 
-        # Verificar si la columna 'amount' está presente; de lo contrario, asignar valor por defecto
-        if 'amount' not in input_data.columns:
+    # Verificar si la columna 'amount' está presente; de lo contrario, asignar valor por defecto
+    if 'amount' not in input_data.columns:
+        if traced:
             logger.warning("No se encontró la columna 'amount'. Las columnas disponibles son: %s",
-                           input_data.columns.tolist())
-            print("No se encontró 'amount'. Asignando valor por defecto 0.")
-            input_data['amount'] = 0
+                           lazy(input_data.columns.tolist))
+        input_data['amount'] = 0
 
-        # Si no existe la columna 'time', asignar un valor por defecto (0)
-        if 'time' not in input_data.columns:
+    # Si no existe la columna 'time', asignar un valor por defecto (0)
+    if 'time' not in input_data.columns:
+        if traced:
             logger.info("No se encontró la columna 'time'. Asignando valor por defecto 0.")
-            print("No se encontró 'time'. Asignando valor 0.")
-            input_data['time'] = 0
+        input_data['time'] = 0
 
-        # Loguear el DataFrame antes de la conversión a numérico
-        logger.info("DataFrame antes de conversión:\n%s", input_data)
-        print("DataFrame antes de conversión:\n", input_data)
+    # Convertir la columna 'amount' a numérico en caso de que venga como string
+    input_data['amount'] = pd.to_numeric(input_data['amount'], errors='coerce')
 
-        # Convertir la columna 'amount' a numérico en caso de que venga como string
-        input_data['amount'] = pd.to_numeric(input_data['amount'], errors='coerce')
+    # Ordenar las columnas según lo esperado: primero 'amount' y 'time' y luego 'v1' a 'v28'
+    input_data = input_data[RAW_COLUMNS]
 
-        # Escalar las columnas 'amount' y 'time'
-        input_data['scaled_amount'] = scaler_amount.fit_transform(input_data[['amount']])
-        input_data['scaled_time'] = scaler_time.fit_transform(input_data[['time']])
+    if traced:
+        logger.info("DataFrame final con columnas ordenadas:\n%s", lazy(input_data.to_string))
 
-        # Eliminar las columnas originales
-        input_data = input_data.drop(['amount', 'time'], axis=1)
+    # Convertir a array de numpy y escalar 'amount' y 'time'
+    return apply_scaling(input_data.to_numpy(dtype=np.float64, copy=True))
 
-        # Ordenar las columnas según lo esperado: primero 'scaled_amount' y 'scaled_time' y luego 'v1' a 'v28'
-        expected_columns = ['scaled_amount', 'scaled_time'] + [f'v{i}' for i in range(1, 29)]
-        input_data = input_data[expected_columns]
 
-        logger.info("DataFrame final con columnas ordenadas:\n%s", input_data)
-        print("DataFrame final:\n", input_data)
+def _predict_matrix(input_array, models):
+    """
+    Ejecuta cada modelo una única vez sobre la matriz completa.
 
-        # Convertir a array de numpy
-        input_array = input_data.values
+    Args:
+        input_array (numpy.ndarray): Matriz (N, 30) de entrada.
+        models (dict): Diccionario con los modelos de predicción.
 
-        # Realizar predicciones con cada modelo
-        logistic_reg_pred = models['logistic'].predict_proba(input_array)
-        kneighbors_pred = models['kneighbors'].predict_proba(input_array)
+    Returns:
+        dict: Arreglos de probabilidades por modelo. 'logistic', 'kneighbors' y 'tree'
+            tienen forma (N, 2) con [no_fraude, fraude]; 'svc' es una tupla
+            (no_fraude, fraude) de arreglos de longitud N.
+    """
+    logistic_reg_pred = models['logistic'].predict_proba(input_array)
+    kneighbors_pred = models['kneighbors'].predict_proba(input_array)
+    if isinstance(models['svc'], KernelSVC):
+        svc_pred = models['svc'].predict_proba(input_array)
+        svc_non_fraud_prob, svc_fraud_prob = svc_pred[:, 0], svc_pred[:, 1]
+    else:
         svc_pred = models['svc'].decision_function(input_array)
         svc_fraud_prob = 1 / (1 + np.exp(-svc_pred))
         svc_non_fraud_prob = 1 - svc_fraud_prob
-        tree_pred = models['tree'].predict_proba(input_array)
+    tree_pred = models['tree'].predict_proba(input_array)
 
-        predictions['logistic'] = [
-            float(logistic_reg_pred[0][0]), float(logistic_reg_pred[0][1])
-        ]
-        predictions['kneighbors'] = [
-            float(kneighbors_pred[0][0]), float(kneighbors_pred[0][1])
-        ]
-        predictions['svc'] = {
-            'non_fraud': float(svc_non_fraud_prob[0]),
-            'fraud': float(svc_fraud_prob[0])
-        }
-        predictions['tree'] = [
-            float(tree_pred[0][0]), float(tree_pred[0][1])
-        ]
+    return {
+        'logistic': logistic_reg_pred,
+        'kneighbors': kneighbors_pred,
+        'svc': (svc_non_fraud_prob, svc_fraud_prob),
+        'tree': tree_pred,
+    }
 
-        logger.info("Predicciones generadas: %s", predictions)
-        print("Predicciones generadas:", predictions)
-    except Exception as e:
-        logger.error("Error en el procesamiento de la transacción: %s", str(e))
-        print("Error en el procesamiento de la transacción:", str(e))
-        raise e
-    return predictions
+
+def _format_predictions(raw_predictions, i):
+    """
+    Construye el diccionario de predicciones de la fila `i` a partir de `_predict_matrix`.
+
+    Args:
+        raw_predictions (dict): Resultado de `_predict_matrix`.
+        i (int): Índice de la transacción dentro del lote.
+
+    Returns:
+        dict: Predicciones con la misma estructura que retorna `process_transaction`.
+    """
+    logistic_reg_pred = raw_predictions['logistic']
+    kneighbors_pred = raw_predictions['kneighbors']
+    svc_non_fraud_prob, svc_fraud_prob = raw_predictions['svc']
+    tree_pred = raw_predictions['tree']
+    return {
+        'logistic': [
+            float(logistic_reg_pred[i][0]), float(logistic_reg_pred[i][1])
+        ],
+        'kneighbors': [
+            float(kneighbors_pred[i][0]), float(kneighbors_pred[i][1])
+        ],
+        'svc': {
+            'non_fraud': float(svc_non_fraud_prob[i]),
+            'fraud': float(svc_fraud_prob[i])
+        },
+        'tree': [
+            float(tree_pred[i][0]), float(tree_pred[i][1])
+        ],
+    }
@@ -0,0 +1,953 @@
+"""
+Motor de procesamiento de transacciones desde Kafka.
+
+Se ejecuta en un hilo propio, fuera del event loop de la API, como un pipeline de etapas
+con un hilo cada una:
+    1. Consumo: obtiene lotes de hasta Config.STREAM_BATCH_SIZE mensajes con
+       `consumer.consume`.
+    2. Puntuación: decodifica los mensajes y los puntúa con una única llamada vectorizada
+       (`process_transactions_batch`).
+    3. Almacenamiento: guarda el lote completo con una sola escritura
+       (`store_transactions_batch`).
+    4. Publicación: publica las predicciones en el tópico de salida y espera las
+       confirmaciones del broker.
+    5. De vuelta en el hilo de consumo y en el orden en que se consumieron, registra los
+       offsets de los lotes terminados y los confirma con un commit asíncrono cada
+       Config.STREAM_COMMIT_EVERY_BATCHES lotes (entrega al menos una vez).
+
+Las etapas se comunican con colas acotadas de Config.STREAM_STAGE_QUEUE_SIZE lotes, de
+modo que mientras un lote se almacena el siguiente ya se está puntuando. Si una etapa se
+atrasa (por ejemplo, la base de datos responde lento) su cola se llena y las anteriores
+se bloquean; cuando alguna cola llega a Config.STREAM_QUEUE_HIGH_WATER lotes, el consumo
+pausa (`consumer.pause`) las particiones asignadas, y las reanuda cuando todas bajan a
+Config.STREAM_QUEUE_LOW_WATER. Mientras tanto `consume` se sigue llamando, así que el
+consumidor no sale del grupo, y la memoria y la latencia quedan acotadas.
+
+Si un lote no se puede almacenar o publicar (base de datos o broker caídos), el
+consumidor vuelve (seek) al primer offset pendiente de cada partición y reintenta ese
+lote y los posteriores que estaban en curso (que se descartan), sin confirmar sus
+offsets. Los reintentos no se agotan: mientras tanto las particiones quedan pausadas
+durante una espera que se duplica con cada fallo, desde Config.STREAM_RETRY_BACKOFF_MS
+hasta Config.STREAM_RETRY_MAX_BACKOFF_MS. Una caída de la infraestructura no manda
+transacciones válidas al tópico de mensajes fallidos.
+
+Las transacciones llegan en JSON o en el formato binario de `wire_format` (según su
+header content-type); las binarias de un lote se decodifican juntas en una matriz, sin
+pasar por diccionarios. Las predicciones se publican en Config.KAFKA_OUTPUT_FORMAT.
+
+Los mensajes que no se pueden decodificar, puntuar o almacenar (porque Postgres rechaza
+su contenido) no detienen el lote: se publican sin modificar (misma clave, valor y
+headers) en el tópico de mensajes fallidos Config.KAFKA_TOPIC_DLQ, con el motivo en
+headers `dlq.*`, y se cuentan por clase de error (`stream_errors_<clase>`). Se publican
+cuando el lote ya quedó almacenado, de modo que reintentar el almacenamiento no los
+duplica. Los errores repetidos se registran como máximo una vez cada
+Config.STREAM_ERROR_LOG_INTERVAL segundos por clase. `dlq_replay` los reinyecta.
+
+Con Config.STREAM_WORKERS > 1 la puntuación de cada lote se reparte entre varios
+workers: cada mensaje va al worker que corresponde a su clave (la partición o el hash de
+la clave del mensaje, que lleva el `transaction_id`, según Config.STREAM_PARTITION_KEY;
+los mensajes sin clave van por partición), de modo que los mensajes de una misma clave se
+procesan siempre en orden y por el mismo worker. En un rebalanceo se terminan los lotes en curso y los offsets procesados de las
+particiones revocadas se confirman antes de entregarlas a otro consumidor.
+
+Decodificar, puntuar y serializar es trabajo en Python puro que retiene el GIL, por lo
+que los workers 'thread' no aceleran la puntuación. Los workers 'process' ejecutan
+puntuación, almacenamiento y publicación en procesos propios (cada uno con sus
+modelos, su productor y su pool de conexiones) y escalan con los núcleos disponibles.
+Cada proceso informa qué mensajes dejó almacenados o en el tópico de mensajes fallidos,
+así que al reintentar un lote no se repiten los grupos que ya terminaron ni se duplican
+filas o mensajes fallidos.
+
+El tiempo de espera de `consume` se adapta a la carga: si el lote llegó lleno se vuelve a
+consultar de inmediato, si llegó incompleto se espera poco para acumular más mensajes y
+si no llegó ninguno la espera crece hasta Config.STREAM_POLL_MAX_TIMEOUT_MS.
+"""
+
+import collections
+import json
+import logging
+import queue
+import threading
+import time
+import zlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+import wire_format
+from config import Config
+from diagnostics import ThrottledLog, begin_request, setup_logging
+from inference import EXECUTOR_PROCESS, EXECUTOR_THREAD
+from kafka_client import (
+    TIMESTAMP_NOT_AVAILABLE, BatchDeliveries, TopicPartition, create_producer, send_to_topic
+)
+from prediction import apply_scaling, load_models, process_transactions_batch
+
+logger = logging.getLogger(__name__)
+
+PARTITION_KEY_PARTITION = 'partition'
+PARTITION_KEY_TRANSACTION_ID = 'transaction_id'
+
+# Etapas en las que un mensaje puede fallar (header dlq.error.stage)
+STAGE_DECODE = 'decode'
+STAGE_SCORE = 'score'
+STAGE_PERSIST = 'persist'
+
+# Largo máximo del mensaje de error copiado al header dlq.error.message
+DLQ_ERROR_MESSAGE_LIMIT = 1000
+
+OUTPUT_FORMAT_JSON = 'json'
+OUTPUT_FORMAT_BINARY = 'binary'
+
+# Colas de entrada de las etapas del pipeline, en orden
+QUEUE_SCORE = 'score'
+QUEUE_PERSIST = 'persist'
+QUEUE_PUBLISH = 'publish'
+PIPELINE_STAGES = (QUEUE_SCORE, QUEUE_PERSIST, QUEUE_PUBLISH)
+
+# Procesador de cada proceso del pool de workers (solo en modo 'process')
+_worker_processor = None
+
+
+def _init_process_worker(persist, publish, output_topic, dlq_topic, output_format, table):
+    global _worker_processor
+    setup_logging()
+    producer = create_producer() if publish else None
+    _worker_processor = StreamProcessor(None, producer, load_models(), persist=persist,
+                                        output_topic=output_topic, dlq_topic=dlq_topic,
+                                        output_format=output_format, workers=1, table=table)
+
+
+def _process_in_worker(entries, stored):
+    """
+    Procesa en un proceso del pool los mensajes de un worker.
+
+    Args:
+        entries (list[tuple]): Mensajes del worker.
+        stored (dict): Avance de intentos anteriores (ver `process_entries`).
+
+    Returns:
+        tuple: (éxito, avance actualizado, incremento de cada contador `stream_*`),
+            para que el proceso principal siga el avance y actualice sus métricas.
+    """
+    before = metrics.counters('stream_')
+    ok = _worker_processor.process_entries(entries, stored)
+    after = metrics.counters('stream_')
+    return ok, stored, {name: value - before.get(name, 0) for name, value in after.items()}
+
+
+class _Batch:
+    """
+    Lote consumido en tránsito por las etapas del pipeline.
+
+    Args:
+        messages (list[Message]): Mensajes del lote.
+        groups (list[list[tuple]]): Mensajes agrupados por worker.
+        epoch (int): Época del procesador al consumirlo; los lotes de una época anterior
+            a un reintento se descartan.
+        seq (int): Número de lote, en el orden del consumo.
+    """
+
+    __slots__ = ('messages', 'groups', 'epoch', 'seq', 'started', 'deliveries', 'scored', 'dead_letters',
+                 'completed', 'stored', 'ok')
+
+    def __init__(self, messages, groups, epoch, seq):
+        self.messages = messages
+        self.groups = groups
+        self.epoch = epoch
+        self.seq = seq
+        self.started = time.perf_counter()
+        self.deliveries = BatchDeliveries()
+        self.scored = []
+        self.dead_letters = []  # (entry, etapa, excepción), se publican con el lote ya almacenado
+        # Avance de los workers 'process' si el lote falla, para no repetirlo al reintentar:
+        # posiciones (tópico, partición, offset) terminadas y avance de las demás
+        self.completed = set()
+        self.stored = {}
+        self.ok = True
+
+
+class StreamProcessor(threading.Thread):
+    """
+    Hilo que consume, puntúa, almacena y publica transacciones por lotes.
+
+    Métricas:
+        stream_batch_size: Mensajes por lote consumido.
+        stream_batch_seconds: Tiempo desde que se consume un lote hasta que termina.
+        stream_queue_depth_<etapa>: Lotes en la cola de la etapa (score, persist, publish).
+        stream_batches_in_flight: Lotes consumidos que aún no terminan.
+        stream_paused: 1 mientras las particiones están pausadas por backpressure.
+        stream_pauses: Veces que se pausaron las particiones.
+        stream_messages_processed: Transacciones puntuadas.
+        stream_messages_failed: Mensajes que no se pudieron decodificar, puntuar o almacenar.
+        stream_errors_<clase>: Mensajes fallidos por clase de error (p. ej. JSONDecodeError).
+        stream_dlq_messages: Mensajes enviados al tópico de mensajes fallidos.
+        stream_batch_retries: Lotes reintentados por fallas de escritura o publicación.
+        stream_commits: Commits de offsets realizados.
+        stream_rebalances: Particiones asignadas o revocadas al consumidor.
+        stream_end_to_end_seconds: Tiempo desde el timestamp de Kafka de cada mensaje
+            hasta que su lote terminó (predicción almacenada y publicada).
+
+    Args:
+        consumer (Consumer): Consumidor suscrito al tópico de entrada.
+        producer (Producer): Productor para el tópico de salida (None para no publicar).
+        models (dict): Modelos de predicción cargados.
+        persist (bool): Si es True, almacena cada lote en la base de datos.
+        batch_size (int): Máximo de mensajes por lote. Por defecto Config.STREAM_BATCH_SIZE.
+        output_topic (str): Tópico de salida. Por defecto Config.KAFKA_TOPIC_OUTPUT.
+        dlq_topic (str): Tópico de mensajes fallidos. Por defecto Config.KAFKA_TOPIC_DLQ.
+        output_format (str): 'json' o 'binary'. Por defecto Config.KAFKA_OUTPUT_FORMAT.
+        input_topic (str): Tópico de entrada. Por defecto Config.KAFKA_TOPIC_INPUT.
+        workers (int): Workers que procesan cada lote. Por defecto Config.STREAM_WORKERS.
+        worker_kind (str): 'thread' o 'process'. Por defecto Config.STREAM_WORKER_KIND.
+        partition_key (str): 'partition' o 'transaction_id'. Por defecto
+            Config.STREAM_PARTITION_KEY.
+        table (str): Tabla donde se almacenan las transacciones. Por defecto
+            'transactions'.
+    """
+
+    def __init__(self, consumer, producer, models, persist=True, batch_size=None, output_topic=None,
+                 dlq_topic=None, output_format=None, input_topic=None, workers=None, worker_kind=None,
+                 partition_key=None, table=None):
+        super().__init__(name='stream-processor', daemon=True)
+        self.consumer = consumer
+        self.producer = producer
+        self.models = models
+        self.persist = persist
+        self.table = table
+        self.batch_size = batch_size or Config.STREAM_BATCH_SIZE
+        self.output_topic = output_topic or Config.KAFKA_TOPIC_OUTPUT
+        self.dlq_topic = Config.KAFKA_TOPIC_DLQ if dlq_topic is None else dlq_topic
+        self.output_format = output_format or Config.KAFKA_OUTPUT_FORMAT
+        if self.output_format not in (OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_BINARY):
+            raise ValueError(f"KAFKA_OUTPUT_FORMAT desconocido: {self.output_format}")
+        self.input_topic = input_topic or Config.KAFKA_TOPIC_INPUT
+        self.workers = workers or Config.STREAM_WORKERS
+        self.worker_kind = worker_kind or Config.STREAM_WORKER_KIND
+        self.partition_key = partition_key or Config.STREAM_PARTITION_KEY
+        if self.worker_kind not in (EXECUTOR_THREAD, EXECUTOR_PROCESS):
+            raise ValueError(f"STREAM_WORKER_KIND desconocido: {self.worker_kind}")
+        if self.partition_key not in (PARTITION_KEY_PARTITION, PARTITION_KEY_TRANSACTION_ID):
+            raise ValueError(f"STREAM_PARTITION_KEY desconocido: {self.partition_key}")
+        self._pool = None
+        self.min_timeout = Config.STREAM_POLL_MIN_TIMEOUT_MS / 1000.0
+        self.max_timeout = Config.STREAM_POLL_MAX_TIMEOUT_MS / 1000.0
+        self.manual_commit = not Config.KAFKA_ENABLE_AUTO_COMMIT
+        self.commit_every = Config.STREAM_COMMIT_EVERY_BATCHES
+        self._pending_offsets = {}  # (tópico, partición) -> siguiente offset a confirmar
+        self._batches_since_commit = 0
+        self._stopped = threading.Event()
+        self.high_water = max(min(Config.STREAM_QUEUE_HIGH_WATER, Config.STREAM_STAGE_QUEUE_SIZE), 1)
+        self.low_water = min(Config.STREAM_QUEUE_LOW_WATER, self.high_water - 1)
+        self._queues = {name: queue.Queue(Config.STREAM_STAGE_QUEUE_SIZE) for name in PIPELINE_STAGES}
+        self._done = queue.Queue()  # lotes terminados, para el hilo de consumo
+        self._in_flight = collections.deque()  # lotes en curso, en el orden del consumo
+        self._stage_threads = []
+        self._epoch = 0
+        self._failed_at = None  # (época, secuencia) del último lote fallido
+        self._failures = {}  # (tópico, partición, offset) -> fallos del lote que empieza ahí
+        self._retry_at = 0.0  # time.monotonic() hasta el que se espera para reintentar
+        # Avance de los lotes fallidos en los workers 'process' (ver `_process_remotely`)
+        self._completed = set()
+        self._stored = {}
+        self._seq = 0
+        self._paused = False
+        self._assignment_changed = False
+        self._queue_depth = {name: metrics.gauge(f'stream_queue_depth_{name}') for name in PIPELINE_STAGES}
+        self._batches_in_flight = metrics.gauge('stream_batches_in_flight')
+        self._paused_gauge = metrics.gauge('stream_paused')
+        self._pauses = metrics.counter('stream_pauses')
+        self._batch_size = metrics.histogram('stream_batch_size')
+        self._batch_seconds = metrics.histogram('stream_batch_seconds')
+        self._processed = metrics.counter('stream_messages_processed')
+        self._failed = metrics.counter('stream_messages_failed')
+        self._dead_lettered = metrics.counter('stream_dlq_messages')
+        self._error_log = ThrottledLog(logger, Config.STREAM_ERROR_LOG_INTERVAL)
+        self._retries = metrics.counter('stream_batch_retries')
+        self._commits = metrics.counter('stream_commits')
+        self._rebalances = metrics.counter('stream_rebalances')
+        self._end_to_end = metrics.histogram('stream_end_to_end_seconds')
+
+    def run(self):
+        logger.info("Procesamiento de transacciones iniciado (lotes de hasta %d mensajes, %d workers '%s').",
+                    self.batch_size, self.workers, self.worker_kind)
+        if self.worker_kind == EXECUTOR_PROCESS:
+            # 'spawn': los procesos no heredan los sockets del consumidor ni del pool de conexiones
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_process_worker,
+                initargs=(self.persist, self.producer is not None, self.output_topic, self.dlq_topic,
+                          self.output_format, self.table),
+            )
+        elif self.workers > 1:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='stream-worker')
+        self._start_stages()
+        # Re-suscribirse con los callbacks de rebalanceo (se ejecutan dentro de `consume`,
+        # en este hilo)
+        self.consumer.subscribe([self.input_topic], on_assign=self._on_assign,
+                                on_revoke=self._on_revoke, on_lost=self._on_lost)
+        timeout = self.min_timeout
+        while not self._stopped.is_set():
+            self._collect()
+            self._apply_backpressure()
+            try:
+                # Con lotes en curso o particiones pausadas se vuelve pronto a atenderlos
+                wait = min(timeout, self.min_timeout) if self._in_flight or self._paused else timeout
+                messages = self.consumer.consume(num_messages=self.batch_size, timeout=wait)
+            except Exception as e:
+                logger.error("Error en Kafka Consumer: %s", e)
+                timeout = self.max_timeout
+                continue
+
+            if not messages:
+                timeout = min(max(timeout * 2, self.min_timeout), self.max_timeout)
+                continue
+            # Lote lleno: probablemente hay más mensajes esperando
+            timeout = 0 if len(messages) == self.batch_size else self.min_timeout
+            self._submit(messages)
+        self._drain()
+        self._stop_stages()
+        self._observe_queues()
+        self.commit(asynchronous=False)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        logger.info("Procesamiento de transacciones detenido.")
+
+    def stop(self, timeout=None):
+        """
+        Detiene el hilo después de terminar los lotes en curso y confirmar sus offsets.
+
+        Args:
+            timeout (float, optional): Segundos máximos de espera.
+        """
+        self._stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def process_entries(self, entries, stored=None):
+        """
+        Decodifica, puntúa, almacena y publica, en orden, los mensajes de un worker (las
+        tres etapas en el mismo hilo; lo usan los workers 'process' y `backfill`).
+
+        Args:
+            entries (list[tuple]): Mensajes como tuplas (tópico, partición, offset, clave,
+                valor, headers), en el orden del tópico.
+            stored (dict, optional): Avance de intentos anteriores, que se actualiza con el
+                de este: posición (tópico, partición, offset) -> True si la transacción ya
+                quedó almacenada (al reintentar solo se publica) o False si el mensaje ya
+                se entregó al tópico de mensajes fallidos (se omite).
+
+        Returns:
+            bool: True si las transacciones quedaron almacenadas y publicadas, y los
+                mensajes fallidos en el tópico de mensajes fallidos.
+        """
+        stored = {} if stored is None else stored
+        deliveries = BatchDeliveries()
+        dead_letter_deliveries = BatchDeliveries()
+        dead_letters = []
+        scored = self.score_entries(entries, dead_letters)
+        pending = [record for record in scored if record[1][:3] not in stored]
+        persisted = pending
+        if pending and self.persist:
+            try:
+                persisted = self._persist(pending, dead_letters)
+            except Exception as e:
+                logger.error("Error almacenando lote de %d transacciones: %s", len(pending), e)
+                return False
+        stored.update((record[1][:3], True) for record in persisted)
+        scored = [record for record in scored if stored.get(record[1][:3])]
+        dead_letters = [dead_letter for dead_letter in dead_letters if dead_letter[0][:3] not in stored]
+        self._send_dead_letters(dead_letters, dead_letter_deliveries)
+        if self.producer is not None:
+            self._publish(scored, deliveries)
+        if not dead_letter_deliveries.wait(Config.STREAM_DELIVERY_TIMEOUT):
+            logger.error("No se confirmó la entrega al tópico de mensajes fallidos de %d mensajes.",
+                         len(dead_letters))
+            return False
+        stored.update((entry[:3], False) for entry, _, _ in dead_letters)
+        if not deliveries.wait(Config.STREAM_DELIVERY_TIMEOUT):
+            logger.error("No se confirmó la entrega de los mensajes de un lote de %d transacciones.",
+                         len(entries))
+            return False
+        return True
+
+    def score_entries(self, entries, dead_letters):
+        """
+        Decodifica y puntúa los mensajes de un worker.
+
+        Los mensajes que no se pueden decodificar o puntuar se agregan a `dead_letters`,
+        para enviarlos al tópico de mensajes fallidos, y cuentan como procesados.
+
+        Args:
+            entries (list[tuple]): Mensajes como tuplas (tópico, partición, offset, clave,
+                valor, headers), en el orden del tópico.
+            dead_letters (list): Mensajes fallidos del lote (ver `_dead_letter`).
+
+        Returns:
+            list[tuple]: Registros (índice, entry, payload, predictions) puntuados con
+                éxito, en el orden del tópico.
+        """
+        json_records, binary_records = self._decode(entries, dead_letters)
+        scored = self._score(json_records, dead_letters)
+        if binary_records:
+            scored = self._score(binary_records, dead_letters) if not scored else sorted(
+                scored + self._score(binary_records, dead_letters), key=lambda item: item[0]
+            )
+        return scored
+
+    def _submit(self, messages):
+        """
+        Agrupa un lote por worker y lo encola en la etapa de puntuación.
+        """
+        groups = [[] for _ in range(self.workers)]
+        for msg in messages:
+            if msg.error():
+                logger.error("Error en Kafka Consumer: %s", msg.error())
+                continue
+            groups[self._worker_index(msg)].append(
+                (msg.topic(), msg.partition(), msg.offset(), msg.key(), msg.value(), msg.headers())
+            )
+        self._seq += 1
+        batch = _Batch(messages, [entries for entries in groups if entries], self._epoch, self._seq)
+        self._batch_size.observe(len(messages))
+        self._in_flight.append(batch)
+        # No bloquea: las particiones se pausan antes de que la cola se llene
+        self._queues[QUEUE_SCORE].put(batch)
+
+    def _start_stages(self):
+        handlers = {
+            QUEUE_SCORE: self._score_stage,
+            QUEUE_PERSIST: self._persist_stage,
+            QUEUE_PUBLISH: self._publish_stage,
+        }
+        outboxes = [self._queues[QUEUE_PERSIST], self._queues[QUEUE_PUBLISH], self._done]
+        for (name, inbox), outbox in zip(self._queues.items(), outboxes):
+            thread = threading.Thread(target=self._run_stage, args=(name, handlers[name], inbox, outbox),
+                                      name=f'stream-{name}', daemon=True)
+            thread.start()
+            self._stage_threads.append(thread)
+
+    def _stop_stages(self):
+        self._queues[QUEUE_SCORE].put(None)
+        for thread in self._stage_threads:
+            thread.join()
+        self._stage_threads = []
+
+    def _run_stage(self, name, handler, inbox, outbox):
+        """
+        Ciclo de una etapa: atiende los lotes de su cola en orden y los pasa a la siguiente
+        (bloqueándose si está llena). Los lotes fallidos o descartados por un reintento
+        pasan sin procesarse. None detiene la etapa y las siguientes.
+        """
+        while True:
+            batch = inbox.get()
+            if batch is not None and batch.ok and not self._discarded(batch):
+                try:
+                    handler(batch)
+                except Exception as e:
+                    logger.error("Error en la etapa '%s' de un lote de %d mensajes: %s",
+                                 name, len(batch.messages), e)
+                    batch.ok = False
+                if not batch.ok:
+                    # Los lotes posteriores se van a reintentar: ya no se procesan
+                    self._failed_at = (batch.epoch, batch.seq)
+            outbox.put(batch)
+            if batch is None:
+                return
+
+    def _discarded(self, batch):
+        """
+        True si el lote se va a reintentar porque falló un lote anterior.
+        """
+        if batch.epoch != self._epoch:
+            return True
+        failed = self._failed_at
+        return failed is not None and failed[0] == batch.epoch and batch.seq > failed[1]
+
+    def _score_stage(self, batch):
+        if not batch.groups:
+            return
+        if self.worker_kind == EXECUTOR_PROCESS:
+            # Cada proceso ejecuta las tres etapas: almacenar y publicar no tienen trabajo
+            batch.ok = self._process_remotely(batch)
+        elif self._pool is None:
+            batch.scored = self.score_entries(batch.groups[0], batch.dead_letters)
+        else:
+            futures = [self._pool.submit(self.score_entries, entries, batch.dead_letters)
+                       for entries in batch.groups]
+            batch.scored = [record for future in futures for record in future.result()]
+
+    def _persist_stage(self, batch):
+        if batch.scored and self.persist:
+            batch.scored = self._persist(batch.scored, batch.dead_letters)
+
+    def _publish_stage(self, batch):
+        if self.worker_kind == EXECUTOR_PROCESS:
+            return
+        # Los mensajes fallidos se publican recién con el lote almacenado: si el
+        # almacenamiento falla y el lote se reintenta, no se duplican
+        self._send_dead_letters(batch.dead_letters, batch.deliveries)
+        if self.producer is None:
+            return
+        self._publish(batch.scored, batch.deliveries)
+        if not batch.deliveries.wait(Config.STREAM_DELIVERY_TIMEOUT):
+            logger.error("No se confirmó la entrega de los mensajes de un lote de %d transacciones.",
+                         len(batch.messages))
+            batch.ok = False
+
+    def _process_remotely(self, batch):
+        """
+        Procesa los grupos del lote en los workers 'process'. En un reintento se omiten los
+        mensajes que un intento anterior ya terminó, y los ya almacenados solo se publican;
+        si el lote falla, su avance queda en `batch.completed` y `batch.stored`.
+        """
+        groups = [[entry for entry in entries if entry[:3] not in self._completed] for entries in batch.groups]
+        futures = [(entries, self._pool.submit(_process_in_worker, entries, self._progress(entries)))
+                   for entries in groups if entries]
+        ok = True
+        for entries, future in futures:
+            try:
+                group_ok, stored, increments = future.result()
+            except Exception as e:
+                logger.error("Error en un worker de procesamiento: %s", e)
+                ok = False
+                continue
+            for name, increment in increments.items():
+                if increment:
+                    metrics.counter(name).inc(increment)
+            if group_ok:
+                batch.completed.update(entry[:3] for entry in entries)
+            else:
+                batch.stored.update(stored)
+            ok = ok and group_ok
+        return ok
+
+    def _progress(self, entries):
+        """
+        Avance de intentos anteriores de los mensajes (ver `process_entries`).
+        """
+        if not self._stored:
+            return {}
+        progress = ((entry[:3], self._stored.get(entry[:3])) for entry in entries)
+        return {position: done for position, done in progress if done is not None}
+
+    def _collect(self, timeout=0):
+        """
+        Atiende los lotes terminados, en el orden en que se consumieron: registra sus
+        offsets o, si fallaron, reposiciona el consumidor para reintentarlos junto con los
+        lotes posteriores que estaban en curso (que se descartan).
+
+        Args:
+            timeout (float): Segundos de espera del primer lote terminado (0: no espera).
+        """
+        while self._in_flight:
+            try:
+                batch = self._done.get(timeout=timeout) if timeout else self._done.get_nowait()
+            except queue.Empty:
+                return
+            timeout = 0
+            self._in_flight.popleft()
+            self._batch_seconds.observe(time.perf_counter() - batch.started)
+            if batch.epoch != self._epoch:
+                continue
+            if batch.ok and not self._discarded(batch):
+                self._forget_failures(batch.messages)
+                self._mark_processed(batch.messages)
+                self._observe_end_to_end(batch.messages)
+                continue
+            self._epoch += 1
+            self._completed |= batch.completed
+            self._stored.update(batch.stored)
+            failures = self._count_failure(batch.messages) if not batch.ok else 1
+            self._rewind(batch.messages + [msg for pending in self._in_flight for msg in pending.messages])
+            self._back_off(failures)
+
+    def _back_off(self, failures):
+        """
+        Pausa las particiones antes de reintentar: la espera se duplica con cada fallo
+        seguido del mismo lote, hasta Config.STREAM_RETRY_MAX_BACKOFF_MS. `consume` se sigue
+        llamando mientras tanto, así que el consumidor no sale del grupo.
+        """
+        backoff = min(Config.STREAM_RETRY_BACKOFF_MS * 2 ** min(failures - 1, 30),
+                      Config.STREAM_RETRY_MAX_BACKOFF_MS) / 1000.0
+        self._retry_at = time.monotonic() + backoff
+        if failures > 1:
+            logger.warning("Lote fallido %d veces seguidas; se reintenta en %.1f s.", failures, backoff)
+        self._set_paused(True)
+
+    def _count_failure(self, messages):
+        """
+        Cuenta un fallo más de un lote, por la posición de su primer mensaje en cada
+        partición (un reintento vuelve a empezar en esas posiciones).
+
+        Returns:
+            int: Fallos de la posición más reintentada del lote.
+        """
+        failures = 0
+        for (topic, partition), offset in _first_offsets(messages).items():
+            position = (topic, partition, offset)
+            self._failures[position] = self._failures.get(position, 0) + 1
+            failures = max(failures, self._failures[position])
+        return failures
+
+    def _forget_failures(self, messages):
+        """
+        Olvida los fallos y el avance de los reintentos de las posiciones que quedaron
+        atrás con este lote.
+        """
+        if not (self._failures or self._completed or self._stored):
+            return
+        last_offsets = {}
+        for msg in messages:
+            if not msg.error():
+                key = (msg.topic(), msg.partition())
+                last_offsets[key] = max(last_offsets.get(key, -1), msg.offset())
+        self._forget_positions(lambda position: position[2] <= last_offsets.get(position[:2], -1))
+
+    def _forget_positions(self, behind):
+        """
+        Quita de los fallos y del avance de los reintentos las posiciones para las que
+        `behind` es True.
+        """
+        for positions in (self._failures, self._stored):
+            for position in [position for position in positions if behind(position)]:
+                del positions[position]
+        self._completed.difference_update([position for position in self._completed if behind(position)])
+
+    def _observe_end_to_end(self, messages):
+        now_ms = time.time() * 1000.0
+        timestamps = [msg.timestamp() for msg in messages if not msg.error()]
+        self._end_to_end.observe_many([
+            (now_ms - timestamp) / 1000.0 for kind, timestamp in timestamps if kind != TIMESTAMP_NOT_AVAILABLE
+        ])
+
+    def _drain(self):
+        """
+        Espera a que terminen los lotes en curso.
+        """
+        while self._in_flight:
+            self._collect(timeout=0.1)
+
+    def _apply_backpressure(self):
+        """
+        Pausa o reanuda las particiones asignadas según la ocupación de las colas y la
+        espera antes de reintentar un lote fallido.
+        """
+        depth = self._observe_queues()
+        backing_off = time.monotonic() < self._retry_at
+        if not self._paused and (depth >= self.high_water or backing_off):
+            self._set_paused(True)
+        elif self._paused and depth <= self.low_water and not backing_off:
+            self._set_paused(False)
+        elif self._paused and self._assignment_changed:
+            # Particiones asignadas mientras el consumo estaba pausado
+            self._set_paused(True)
+
+    def _observe_queues(self):
+        """
+        Actualiza las métricas de las colas.
+
+        Returns:
+            int: Lotes en la cola más ocupada.
+        """
+        depth = 0
+        for name, inbox in self._queues.items():
+            size = inbox.qsize()
+            self._queue_depth[name].set(size)
+            depth = max(depth, size)
+        self._batches_in_flight.set(len(self._in_flight))
+        return depth
+
+    def _set_paused(self, paused):
+        try:
+            partitions = self.consumer.assignment()
+            if paused:
+                self.consumer.pause(partitions)
+            else:
+                self.consumer.resume(partitions)
+        except Exception as e:
+            logger.error("Error %s particiones: %s", "pausando" if paused else "reanudando", e)
+            return
+        self._assignment_changed = False
+        if paused and not self._paused:
+            self._pauses.inc()
+            logger.debug("Pipeline saturado: %d particiones pausadas.", len(partitions))
+        elif not paused:
+            logger.debug("Pipeline descongestionado: %d particiones reanudadas.", len(partitions))
+        self._paused = paused
+        self._paused_gauge.set(int(paused))
+
+    def _worker_index(self, msg):
+        if self.workers == 1:
+            return 0
+        if self.partition_key == PARTITION_KEY_PARTITION:
+            return msg.partition() % self.workers
+        key = msg.key()
+        if key is None:
+            # Sin clave se reparte por partición: leer el transaction_id del mensaje
+            # obligaría a decodificarlo en el hilo de consumo
+            return msg.partition() % self.workers
+        if isinstance(key, str):
+            key = key.encode()
+        return zlib.crc32(key) % self.workers
+
+    def commit(self, asynchronous=True):
+        """
+        Confirma en Kafka los offsets de los lotes ya procesados.
+
+        Args:
+            asynchronous (bool): Si es False espera la respuesta del broker (al apagar).
+        """
+        if not self.manual_commit or not self._pending_offsets:
+            return
+        offsets = [
+            TopicPartition(topic, partition, offset)
+            for (topic, partition), offset in self._pending_offsets.items()
+        ]
+        try:
+            self.consumer.commit(offsets=offsets, asynchronous=asynchronous)
+            self._pending_offsets.clear()
+            self._batches_since_commit = 0
+            self._commits.inc()
+        except Exception as e:
+            logger.error("Error confirmando offsets: %s", e)
+
+    def _on_assign(self, consumer, partitions):
+        self._rebalances.inc(len(partitions))
+        self._assignment_changed = True
+        logger.info("Particiones asignadas: %s", [(p.topic, p.partition) for p in partitions])
+
+    def _on_revoke(self, consumer, partitions):
+        """
+        Termina los lotes en curso y confirma los offsets procesados de las particiones
+        revocadas antes de perderlas.
+        """
+        self._rebalances.inc(len(partitions))
+        self._drain()
+        logger.info("Particiones revocadas: %s", [(p.topic, p.partition) for p in partitions])
+        revoked = {(p.topic, p.partition) for p in partitions}
+        offsets = [
+            TopicPartition(topic, partition, offset)
+            for (topic, partition), offset in self._pending_offsets.items()
+            if (topic, partition) in revoked
+        ]
+        if self.manual_commit and offsets:
+            try:
+                consumer.commit(offsets=offsets, asynchronous=False)
+                self._commits.inc()
+            except Exception as e:
+                logger.error("Error confirmando offsets de particiones revocadas: %s", e)
+        for key in revoked:
+            self._pending_offsets.pop(key, None)
+        self._forget_positions(lambda position: position[:2] in revoked)
+
+    def _on_lost(self, consumer, partitions):
+        # Las particiones ya pertenecen a otro consumidor: sus offsets no se pueden confirmar
+        logger.warning("Particiones perdidas: %s", [(p.topic, p.partition) for p in partitions])
+        self._drain()
+        for p in partitions:
+            self._pending_offsets.pop((p.topic, p.partition), None)
+        lost = {(p.topic, p.partition) for p in partitions}
+        self._forget_positions(lambda position: position[:2] in lost)
+
+    def _mark_processed(self, messages):
+        if not self.manual_commit:
+            return
+        for msg in messages:
+            if msg.error():
+                continue
+            key = (msg.topic(), msg.partition())
+            next_offset = msg.offset() + 1
+            if next_offset > self._pending_offsets.get(key, -1):
+                self._pending_offsets[key] = next_offset
+        self._batches_since_commit += 1
+        if self._batches_since_commit >= self.commit_every:
+            self.commit()
+
+    def _rewind(self, messages):
+        """
+        Vuelve al primer offset de los mensajes en cada partición para reintentarlos.
+        """
+        self._retries.inc()
+        for (topic, partition), offset in _first_offsets(messages).items():
+            try:
+                self.consumer.seek(TopicPartition(topic, partition, offset))
+            except Exception as e:
+                logger.error("Error reposicionando %s[%d] en el offset %d: %s", topic, partition, offset, e)
+
+    def _decode(self, entries, dead_letters):
+        """
+        Returns:
+            tuple: Registros (índice, entry, payload) JSON y binarios decodificados con
+                éxito. El payload es el diccionario de la transacción (JSON) o su fila de
+                30 valores sin escalar (binario).
+        """
+        records = []
+        binary = []
+        for index, entry in enumerate(entries):
+            try:
+                # Dentro del try: un header content-type mal formado solo descarta su mensaje
+                if wire_format.content_type(entry[5]) == wire_format.CONTENT_TYPE_TRANSACTION:
+                    binary.append((index, entry))
+                    continue
+                transaction_data = json.loads(entry[4])
+                if not isinstance(transaction_data, dict):
+                    raise TypeError(f"se esperaba un objeto JSON, se recibió {type(transaction_data).__name__}")
+            except Exception as e:
+                self._dead_letter(entry, STAGE_DECODE, e, dead_letters)
+                continue
+            if begin_request():
+                logger.info("Transacción recibida: %s", transaction_data)
+            records.append((index, entry, transaction_data))
+        return records, self._decode_binary(binary, dead_letters)
+
+    def _decode_binary(self, binary, dead_letters):
+        if not binary:
+            return []
+        features, errors = wire_format.decode_transactions([entry[4] for _, entry in binary])
+        records = []
+        for row, (index, entry) in enumerate(binary):
+            if row in errors:
+                self._dead_letter(entry, STAGE_DECODE, wire_format.WireFormatError(errors[row]), dead_letters)
+                continue
+            if begin_request():
+                logger.info("Transacción recibida: %s", features[row])
+            records.append((index, entry, features[row]))
+        return records
+
+    def _score(self, records, dead_letters):
+        """
+        Puntúa el lote completo; si falla, lo divide en mitades hasta aislar las filas
+        inválidas, que se envían al tópico de mensajes fallidos.
+
+        Args:
+            records (list[tuple]): Registros (índice, entry, payload) de `_decode`, todos
+                JSON o todos binarios.
+
+        Returns:
+            list[tuple]: Registros (índice, entry, payload, predictions) puntuados con
+                éxito, en orden.
+        """
+        if not records:
+            return []
+        payloads = [payload for _, _, payload in records]
+        try:
+            if isinstance(payloads[0], dict):
+                predictions = process_transactions_batch(payloads, self.models)
+            else:
+                predictions = process_transactions_batch(apply_scaling(np.array(payloads)), self.models)
+        except Exception as e:
+            if len(records) == 1:
+                self._dead_letter(records[0][1], STAGE_SCORE, e, dead_letters)
+                return []
+            middle = len(records) // 2
+            return self._score(records[:middle], dead_letters) + self._score(records[middle:], dead_letters)
+        self._processed.inc(len(records))
+        return [record + (prediction,) for record, prediction in zip(records, predictions)]
+
+    @staticmethod
+    def _dead_letter(entry, stage, error, dead_letters):
+        """
+        Registra un mensaje fallido del lote; se publica con `_send_dead_letters`.
+        """
+        dead_letters.append((entry, stage, error))
+
+    def _send_dead_letters(self, dead_letters, deliveries):
+        """
+        Envía los mensajes fallidos, sin modificar, al tópico de mensajes fallidos.
+        """
+        for entry, stage, error in dead_letters:
+            self._send_dead_letter(entry, stage, error, deliveries)
+
+    def _send_dead_letter(self, entry, stage, error, deliveries):
+        topic, partition, offset, key, value, headers = entry
+        error_class = type(error).__name__
+        self._failed.inc()
+        metrics.counter(f'stream_errors_{error_class}').inc()
+        self._error_log.error(error_class, "Error procesando transacción (%s, %s[%d]@%d): %s: %s",
+                              stage, topic, partition, offset, error_class, error)
+        if self.producer is None or not self.dlq_topic:
+            return
+        dlq_headers = list(headers or []) + [
+            ('dlq.error.stage', stage),
+            ('dlq.error.class', error_class),
+            ('dlq.error.message', str(error)[:DLQ_ERROR_MESSAGE_LIMIT]),
+            ('dlq.source.topic', topic),
+            ('dlq.source.partition', str(partition)),
+            ('dlq.source.offset', str(offset)),
+        ]
+        deliveries.expect()
+        if send_to_topic(self.producer, self.dlq_topic, key=key, value=value,
+                         headers=dlq_headers, on_delivery=deliveries):
+            self._dead_lettered.inc()
+        else:
+            deliveries.failed()
+
+    def _persist(self, scored, dead_letters):
+        """
+        Almacena el lote. Las filas que Postgres rechaza por su contenido se aíslan
+        dividiendo el lote (`db.store_transactions_isolating`), se agregan a
+        `dead_letters` y no se publican.
+
+        Returns:
+            list[tuple]: Registros almacenados.
+
+        Raises:
+            Exception: Si falla el lote completo (por ejemplo, sin conexión) y hay que
+                reintentarlo.
+        """
+        # Importación diferida: el procesamiento funciona sin base de datos
+        from db import TRANSACTIONS_TABLE, store_transactions_isolating
+        rejected = store_transactions_isolating([
+            (payload if isinstance(payload, dict) else
+             wire_format.transaction_dict(payload, _transaction_id(entry, payload) or None), predictions)
+            for _, entry, payload, predictions in scored
+        ], table=self.table or TRANSACTIONS_TABLE)
+        if not rejected:
+            return scored
+        for position, error in rejected:
+            self._dead_letter(scored[position][1], STAGE_PERSIST, error, dead_letters)
+        rejected_positions = {position for position, _ in rejected}
+        return [record for position, record in enumerate(scored) if position not in rejected_positions]
+
+    def _publish(self, scored, deliveries):
+        if self.output_format == OUTPUT_FORMAT_BINARY:
+            encode, content_type = wire_format.encode_prediction, wire_format.CONTENT_TYPE_PREDICTION
+        else:
+            encode, content_type = json.dumps, wire_format.CONTENT_TYPE_JSON
+        headers = [(wire_format.CONTENT_TYPE_HEADER, content_type)]
+        deliveries.expect(len(scored))
+        for _, entry, payload, predictions in scored:
+            if not send_to_topic(self.producer, self.output_topic, key=_transaction_id(entry, payload),
+                                 value=encode(predictions), headers=headers, on_delivery=deliveries):
+                deliveries.failed()
+
+
+def _first_offsets(messages):
+    """
+    Primer offset de los mensajes en cada (tópico, partición).
+    """
+    first_offsets = {}
+    for msg in messages:
+        if msg.error():
+            continue
+        key = (msg.topic(), msg.partition())
+        if key not in first_offsets or msg.offset() < first_offsets[key]:
+            first_offsets[key] = msg.offset()
+    return first_offsets
+
+
+def _transaction_id(entry, payload):
+    """
+    Identificador de la transacción: el campo 'transaction_id' en JSON o la clave del
+    mensaje en binario.
+    """
+    if isinstance(payload, dict):
+        return str(payload.get("transaction_id", ""))
+    key = entry[3]
+    if isinstance(key, bytes):
+        return key.decode('utf-8', 'replace')
+    return key or ""
@@ -0,0 +1,218 @@
+"""
+Formato binario de los mensajes de Kafka (transacciones y predicciones).
+
+Alternativa opcional a JSON: cada mensaje lleva un encabezado fijo y los valores
+empaquetados en little-endian, de modo que un lote de transacciones se decodifica con un
+único `np.frombuffer` en lugar de un `json.loads` por mensaje. El formato de cada mensaje
+se indica en el header de Kafka `content-type`; los mensajes sin ese header se tratan
+como JSON, así que los productores existentes siguen funcionando.
+
+Encabezado (8 bytes, `HEADER`):
+    magic (2 bytes): b'FT' en transacciones, b'FP' en predicciones.
+    version (uint8): WIRE_VERSION.
+    dtype (uint8): 1 = float32, 2 = float64.
+    count (uint16): Cantidad de valores que siguen.
+    reserved (uint16): 0.
+
+Transacción: 30 valores en el orden de RAW_COLUMNS ('amount' y 'time' sin escalar,
+'v1' a 'v28'). El `transaction_id` viaja en la clave del mensaje.
+
+Predicción: 8 valores float64, [no_fraude, fraude] de 'logistic', 'kneighbors', 'svc' y
+'tree', en ese orden.
+"""
+
+import struct
+
+import numpy as np
+
+from prediction import RAW_COLUMNS
+
+CONTENT_TYPE_HEADER = 'content-type'
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_TRANSACTION = 'application/x-fraud-transaction'
+CONTENT_TYPE_PREDICTION = 'application/x-fraud-prediction'
+
+WIRE_VERSION = 1
+
+TRANSACTION_MAGIC = b'FT'
+PREDICTION_MAGIC = b'FP'
+
+HEADER = struct.Struct('<2sBBHH')
+
+# Código del tipo de los valores en el encabezado
+DTYPE_CODES = {'float32': 1, 'float64': 2}
+
+# Modelos de la predicción binaria, en orden
+PREDICTION_MODELS = ('logistic', 'kneighbors', 'svc', 'tree')
+
+_PREDICTION = struct.Struct('<2sBBHH8d')
+
+
+class WireFormatError(ValueError):
+    """
+    Mensaje binario que no respeta el formato (tamaño o encabezado inválidos).
+    """
+
+
+def _record_dtype(dtype):
+    """
+    dtype estructurado de un mensaje de transacción completo (encabezado + valores).
+    """
+    return np.dtype([
+        ('magic', 'S2'),
+        ('version', 'u1'),
+        ('dtype', 'u1'),
+        ('count', '<u2'),
+        ('reserved', '<u2'),
+        ('features', np.dtype(dtype).newbyteorder('<'), (len(RAW_COLUMNS),)),
+    ])
+
+
+_RECORD_DTYPES = {code: _record_dtype(name) for name, code in DTYPE_CODES.items()}
+
+# Tamaño de un mensaje de transacción -> (código, dtype estructurado)
+_RECORD_SIZES = {record.itemsize: (code, record) for code, record in _RECORD_DTYPES.items()}
+
+
+def content_type(headers):
+    """
+    Retorna el content-type de un mensaje a partir de sus headers de Kafka.
+
+    Args:
+        headers (list[tuple] | None): Headers del mensaje.
+
+    Returns:
+        str: Valor del header `content-type`, o CONTENT_TYPE_JSON si no está.
+    """
+    for name, value in headers or ():
+        if name == CONTENT_TYPE_HEADER:
+            return value.decode() if isinstance(value, bytes) else value
+    return CONTENT_TYPE_JSON
+
+
+def encode_transactions(features, dtype='float64'):
+    """
+    Codifica un lote de transacciones en el formato binario.
+
+    Args:
+        features (numpy.ndarray): Matriz (N, 30) sin escalar, en el orden de RAW_COLUMNS
+            (por ejemplo, la que retorna `assemble_features`).
+        dtype (str): 'float32' o 'float64'.
+
+    Returns:
+        list[bytes]: Un valor de mensaje por fila.
+    """
+    features = np.atleast_2d(features)
+    record = _RECORD_DTYPES[DTYPE_CODES[dtype]]
+    batch = np.zeros(len(features), dtype=record)
+    batch['magic'] = TRANSACTION_MAGIC
+    batch['version'] = WIRE_VERSION
+    batch['dtype'] = DTYPE_CODES[dtype]
+    batch['count'] = len(RAW_COLUMNS)
+    batch['features'] = features
+    data = batch.tobytes()
+    size = record.itemsize
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def decode_transactions(values):
+    """
+    Decodifica un lote de transacciones binarias en una matriz.
+
+    Los mensajes del mismo tamaño (mismo dtype) se decodifican juntos con un único
+    `np.frombuffer`.
+
+    Args:
+        values (list[bytes]): Valores de los mensajes.
+
+    Returns:
+        tuple: (matriz float64 (N, 30) sin escalar en el orden de RAW_COLUMNS,
+            diccionario índice -> motivo de los mensajes inválidos). Las filas inválidas
+            quedan en cero.
+    """
+    features = np.zeros((len(values), len(RAW_COLUMNS)), dtype=np.float64)
+    errors = {}
+    by_size = {}
+    for i, value in enumerate(values):
+        if len(value) in _RECORD_SIZES:
+            by_size.setdefault(len(value), []).append(i)
+        else:
+            errors[i] = f"tamaño de mensaje inválido: {len(value)} bytes"
+
+    for size, indices in by_size.items():
+        code, record = _RECORD_SIZES[size]
+        batch = np.frombuffer(b''.join([values[i] for i in indices]), dtype=record)
+        valid = (
+            (batch['magic'] == TRANSACTION_MAGIC)
+            & (batch['version'] == WIRE_VERSION)
+            & (batch['dtype'] == code)
+            & (batch['count'] == len(RAW_COLUMNS))
+        )
+        indices = np.asarray(indices)
+        features[indices[valid]] = batch['features'][valid]
+        for i in indices[~valid]:
+            errors[int(i)] = "encabezado inválido (magic, versión, dtype o cantidad de valores)"
+    return features, errors
+
+
+def encode_prediction(predictions):
+    """
+    Codifica las predicciones de una transacción en el formato binario.
+
+    Args:
+        predictions (dict): Predicciones con la estructura de `process_transaction`.
+
+    Returns:
+        bytes: Valor del mensaje.
+    """
+    svc = predictions['svc']
+    return _PREDICTION.pack(
+        PREDICTION_MAGIC, WIRE_VERSION, DTYPE_CODES['float64'], 2 * len(PREDICTION_MODELS), 0,
+        predictions['logistic'][0], predictions['logistic'][1],
+        predictions['kneighbors'][0], predictions['kneighbors'][1],
+        svc['non_fraud'], svc['fraud'],
+        predictions['tree'][0], predictions['tree'][1],
+    )
+
+
+def decode_prediction(value):
+    """
+    Decodifica una predicción binaria.
+
+    Args:
+        value (bytes): Valor del mensaje.
+
+    Returns:
+        dict: Predicciones con la estructura de `process_transaction`.
+
+    Raises:
+        WireFormatError: Si el mensaje no es una predicción binaria válida.
+    """
+    if len(value) != _PREDICTION.size:
+        raise WireFormatError(f"tamaño de predicción inválido: {len(value)} bytes")
+    magic, version, dtype, count, _, *probs = _PREDICTION.unpack(value)
+    if magic != PREDICTION_MAGIC or version != WIRE_VERSION or count != 2 * len(PREDICTION_MODELS):
+        raise WireFormatError("encabezado de predicción inválido")
+    return {
+        'logistic': [probs[0], probs[1]],
+        'kneighbors': [probs[2], probs[3]],
+        'svc': {'non_fraud': probs[4], 'fraud': probs[5]},
+        'tree': [probs[6], probs[7]],
+    }
+
+
+def transaction_dict(features, transaction_id=None):
+    """
+    Reconstruye el diccionario de una transacción binaria (para almacenarla en la base
+    de datos con el mismo formato que las transacciones JSON).
+
+    Args:
+        features (numpy.ndarray): Fila de 30 valores en el orden de RAW_COLUMNS.
+        transaction_id (str, optional): Identificador (clave del mensaje).
+
+    Returns:
+        dict: Transacción con 'transaction_id' (si se indicó) y las columnas de RAW_COLUMNS.
+    """
+    data = {} if transaction_id is None else {'transaction_id': transaction_id}
+    data.update(zip(RAW_COLUMNS, features.tolist()))
+    return data
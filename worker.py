@@ -0,0 +1,165 @@
+"""
+Worker de procesamiento de transacciones desde Kafka, independiente de la API.
+
+Uso:
+    python -m worker
+
+Ejecuta el `StreamProcessor` en su propio proceso, de modo que la API y los workers se
+escalan y ajustan por separado (varias instancias del worker se reparten las
+particiones del tópico de entrada dentro del mismo grupo de consumidores).
+
+Al recibir SIGTERM o SIGINT termina el lote en curso, confirma sus offsets, entrega los
+mensajes pendientes del productor y cierra las conexiones a la base de datos. Expone
+`/health` y `/metrics` en Config.WORKER_HEALTH_PORT. Si Config.DATABASE_URL está
+configurada pero la base de datos no responde al iniciar, termina con código 1.
+"""
+
+import json
+import logging
+import signal
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+from config import Config
+from diagnostics import setup_logging, shutdown_logging
+from kafka_client import consumer_stats, create_consumer, create_producer, flush_producer
+from prediction import load_models
+from stream_processor import StreamProcessor
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+try:
+    from db import close_pool, init_transactions_table, pool_stats
+    DB_AVAILABLE = bool(Config.DATABASE_URL)
+except ImportError:
+    DB_AVAILABLE = False
+    logger.warning("Base de datos no disponible - el worker no almacenará transacciones")
+
+
+class HealthServer(threading.Thread):
+    """
+    Servidor HTTP mínimo con el estado del worker.
+
+    `/health` responde 200 mientras el procesador esté vivo y 503 si se detuvo, con el
+    lag del consumidor por partición; `/metrics` retorna `metrics.snapshot()`.
+
+    Args:
+        processor (StreamProcessor): Procesador cuyo estado se informa.
+        port (int): Puerto de escucha. Por defecto Config.WORKER_HEALTH_PORT.
+    """
+
+    def __init__(self, processor, port=None):
+        super().__init__(name='worker-health', daemon=True)
+        self.processor = processor
+        self.server = ThreadingHTTPServer(('0.0.0.0', port or Config.WORKER_HEALTH_PORT), self._handler())
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def health(self):
+        alive = self.processor.is_alive()
+        return alive, {
+            "status": "ok" if alive else "stopped",
+            "processor_alive": alive,
+            "workers": self.processor.workers,
+            "worker_kind": self.processor.worker_kind,
+            "input_topic": self.processor.input_topic,
+            "kafka_consumer": consumer_stats(),
+            "db_available": DB_AVAILABLE,
+            "db_pool": pool_stats() if DB_AVAILABLE else None,
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/health':
+                    alive, body = server.health()
+                    self._reply(200 if alive else 503, body)
+                elif self.path == '/metrics':
+                    self._reply(200, metrics.snapshot())
+                else:
+                    self._reply(404, {"detail": "Not Found"})
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                # Los health checks periódicos no se registran
+                pass
+
+        return Handler
+
+
+def main():
+    """
+    Ejecuta el worker hasta recibir SIGTERM/SIGINT o hasta que el procesador se detenga.
+
+    Returns:
+        int: Código de salida del proceso.
+    """
+    stopped = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info("Señal %s recibida, deteniendo el worker.", signal.Signals(signum).name)
+        stopped.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    if DB_AVAILABLE:
+        try:
+            init_transactions_table()
+        except Exception as e:
+            # Sin base de datos el worker confirmaría offsets de transacciones que no se
+            # almacenaron: mejor salir y que el orquestador lo reinicie
+            logger.error("No se pudo conectar a la base de datos (%s): %s", type(e).__name__, e)
+            return 1
+    consumer = create_consumer(Config.KAFKA_TOPIC_INPUT)
+    if consumer is None:
+        logger.error("No se pudo crear el consumidor de Kafka.")
+        return 1
+    producer = create_producer()
+
+    processor = StreamProcessor(consumer, producer, load_models(), persist=DB_AVAILABLE)
+    health = HealthServer(processor)
+    processor.start()
+    health.start()
+    logger.info("Worker iniciado (health en el puerto %d).", Config.WORKER_HEALTH_PORT)
+
+    exit_code = 0
+    while not stopped.wait(1.0):
+        if not processor.is_alive():
+            logger.error("El procesamiento de transacciones se detuvo inesperadamente.")
+            exit_code = 1
+            break
+
+    processor.stop()
+    consumer.close()
+    if producer is not None:
+        flush_producer(producer)
+    if DB_AVAILABLE:
+        close_pool()
+    health.stop()
+    logger.info("Worker detenido.")
+    return exit_code
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    finally:
+        shutdown_logging()